@@ -1,40 +1,34 @@
+import time
+_startup_t0 = time.perf_counter()
 import sys
 import argparse
 import os
-import time
 import random
-import simpy
-import matplotlib.pyplot as plt
+import json
+import importlib
 from math import sqrt, log10
 
-from traces.augmented_ibm_object_store_trace import AugmentedIBMObjectStoreTrace
-from traces.ibm_object_store_trace import IBMObjectStoreTrace
-
 if sys.version_info[0] < 3:
     raise Exception("Must be using Python 3")
 
+# Imported one by one first, so that --profile-startup can tell what each one costs. A module only counts the imports
+# the previous ones did not already do.
+_startup_import_times = {}
+for _module_name in ("simpy", "tqdm", "storage", "simulation", "profiling", "registry"):
+    _t0 = time.perf_counter()
+    importlib.import_module(_module_name)
+    _startup_import_times[_module_name] = time.perf_counter() - _t0
+
+import simpy
 from simulation import Simulation
 from storage import Tier, StorageManager
-from resources import TENCENT_DATASET_FILE_THREAD1, PATH
-
-from policies.lru_policy import LRUPolicy
-from policies.fifo_policy import FIFOPolicy
-from policies.lifetime_overun_policy import LifetimeOverrunPolicy
-from policies.random_policy import RandomPolicy
-from policies.criteria_based_policy import CriteriaBasedPolicy
-
-from traces.augmented_snia_trace import AugmentedSNIATrace
-from traces.snia_trace import SNIATrace
-
-available_policies = {"lru": LRUPolicy,
-                      "fifo": FIFOPolicy,
-                      "lifetime": LifetimeOverrunPolicy,
-                      "criteria": CriteriaBasedPolicy,
-                      "random": RandomPolicy}
-available_traces = {"snia": SNIATrace(TENCENT_DATASET_FILE_THREAD1),
-                    "augmented-snia": AugmentedSNIATrace(TENCENT_DATASET_FILE_THREAD1),
-                    "augmented-ibm": AugmentedIBMObjectStoreTrace(),
-                    "ibm_object_store": IBMObjectStoreTrace()}
+from profiling import CallbackProfiler
+from forked_runs import collect_run_stats
+
+import registry
+from registry import available_policies, available_traces
+
+_startup_import_time = time.perf_counter() - _startup_t0
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -60,14 +54,109 @@ if __name__ == "__main__":
                         "A noise intensity of 0.0 means exact values while a noise intensity of "
                         "1.0 means values randomly picked within a magnitude of the exact value.",
                         default=float(0.0), type=float)
+    parser.add_argument("--fit-lifetimes", help="With a streaming trace, generate lifetimes following the distribution "
+                                                "of the lifetimes of this trace, parsed up to --limit-trace lines",
+                        choices=list(available_traces.keys()), default=None)
+    parser.add_argument("--promotion", help="Promote files that became hot on lower tiers back to the default tier",
+                        action="store_true")
+    parser.add_argument("--promotion-interval", help="Seconds between two promotion rounds, converted with the time "
+                                                     "unit of the trace", default=3600., type=float)
+    parser.add_argument("--promotion-budget", help="Maximum octets promoted per promotion round",
+                        default=10 ** 9, type=int)
+    parser.add_argument("--promotion-threshold", help="Decaying access count a file needs to be proposed for "
+                                                      "promotion", default=3., type=float)
+    parser.add_argument("--promotion-half-life", help="Seconds after which the access count of a file is halved, "
+                                                      "converted with the time unit of the trace",
+                        default=3600., type=float)
+    parser.add_argument("--promotion-watermark", help="Used capacity ratio of the default tier promotions fill it up "
+                                                      "to, evicting to make room. Its target occupation by default",
+                        default=None, type=float)
+    parser.add_argument("--direct-placement-lifetime", help="With the lifetime policy, new files whose predicted "
+                                                            "lifetime is lower or equal are directly created on the "
+                                                            "second tier", default=None, type=float)
+    parser.add_argument("--lifetime-model", help="Lifetime prediction model of the lifetime policy: the exact "
+                                                 "lifetimes from the trace (noised by --noise-intensity), or a "
+                                                 "prefix trie learning them online", choices=["oracle", "trie"],
+                        default="oracle")
+    parser.add_argument("--prioritized-replay", help="With the rl-lru-lo policy, replay the experiences of the agent "
+                                                     "by priority (their last temporal difference error) rather "
+                                                     "than uniformly", action="store_true")
+    parser.add_argument("--learner-mode", help="With the rl-lru-lo policy, train the agent in a background thread: "
+                                               "deterministic waits for the training steps at each evaluation, giving "
+                                               "the results of an inline training, free-running does not. Trained "
+                                               "inline by default", choices=["deterministic", "free-running"],
+                        default=None)
+    parser.add_argument("--profile-startup", help="Print how long imports took, at startup and when traces and "
+                                                  "policies are loaded", action="store_true")
+    parser.add_argument("--profile-callbacks", help="Account the CPU time spent in each policy callback and in "
+                                                    "the trace reading, and print it with the results",
+                        action="store_true")
+    parser.add_argument("--time-series-interval", help="Sample the state of each tier every given simulated "
+                                                       "seconds, and save the samples in the output folder",
+                        default=None, type=float)
+    parser.add_argument("--event-log", help="Write the simulation events of this level and above to a binary log in "
+                                            "the output folder, see event_log.py to read it",
+                        choices=["debug", "info", "warning"], default=None)
+    parser.add_argument("--chrome-trace", help="Write a timeline of the eviction rounds, migrations and tier "
+                                               "occupations to the output folder, to be opened in Perfetto",
+                        action="store_true")
+    parser.add_argument("--checkpoint-every", help="Write a checkpoint of the simulation to the output folder every "
+                                                   "given number of trace lines", default=None, type=int)
+    parser.add_argument("--resume", help="Resume the simulation from a checkpoint. The trace, tiers and policy must be "
+                                         "the same as when it was written", default=None, type=str)
+    parser.add_argument("--no-cache", help="Simulate every run, even those whose results are in the result cache "
+                                           "next to the output folder", action="store_true")
+    parser.add_argument("--channels", help="Model the contention of each tier: IOs, user ones and migrations alike, "
+                                           "queue for one of this many channels, the IOs in flight sharing the tier "
+                                           "throughput",
+                        default=None, type=int)
     parser.add_argument("policies", nargs='+', choices=["all"] + list(available_policies.keys()))
 
+    if "--profile-startup" in sys.argv[1:]:  # before parsing, so that --help is profiled too
+        print(f'Startup imports took {round(_startup_import_time * 1000, 1)} ms: ' +
+              ", ".join([f'{module} {round(duration * 1000, 1)} ms'
+                         for module, duration in _startup_import_times.items()]))
     args = vars(parser.parse_args())
     verbose, no_ui, custom_trace, no_progress_bar, limit_trace_len, output_folder, config_file, noise_intensity,\
-        policies = args.values()
+        fit_lifetimes, promotion, promotion_interval, promotion_budget, promotion_threshold, promotion_half_life, \
+        promotion_watermark, direct_placement_lifetime, lifetime_model, prioritized_replay, learner_mode, \
+        profile_startup, profile_callbacks, time_series_interval, event_log_level, chrome_trace, checkpoint_every, \
+        resume, no_cache, channels, policies = args.values()
 
-    trace = available_traces[custom_trace]
+    if custom_trace in registry.streaming_traces:
+        if any([policy in registry.next_use_policies for policy in policies]):
+            parser.error(f'the {custom_trace} trace is generated while simulated, the next uses policies '
+                         f'{", ".join(registry.next_use_policies)} need cannot be known in advance')
+        if noise_intensity > 0:
+            parser.error(f'--noise-intensity noises the lifetimes of a trace known in advance, the {custom_trace} '
+                         'trace only knows the ones of its live objects')
+    elif fit_lifetimes is not None:
+        parser.error(f'--fit-lifetimes only applies to the streaming traces: {", ".join(registry.streaming_traces)}')
+    if checkpoint_every is not None or resume is not None:
+        for policy_name in available_policies.keys() if "all" in policies else policies:
+            if not registry.get_policy_class(policy_name).checkpointable:
+                parser.error(f'the {policy_name} policy cannot be checkpointed, --checkpoint-every and --resume '
+                             'cannot be used with it')
+
+    if profile_startup:
+        print(f'Arguments parsed after {round((time.perf_counter() - _startup_t0) * 1000, 1)} ms.')
+
+    trace = registry.get_trace(custom_trace)
+    if profile_startup:
+        for policy_name in available_policies.keys() if "all" in policies else policies:
+            registry.get_policy_class(policy_name)  # loaded by the runs anyway, earlier to be reported here
+        print(f'Lazy imports of the trace and policies: ' +
+              ", ".join([f'{module} {round(duration * 1000, 1)} ms'
+                         for module, duration in registry.import_times.items()]))
+    if fit_lifetimes is not None:
+        fitted_trace = registry.get_trace(fit_lifetimes)
+        fitted_trace.gen_data(trace_len_limit=limit_trace_len)
+        trace.fit_lifetimes(fitted_trace.lifetime_per_fileid, time_unit=fitted_trace.time_unit)
+        del fitted_trace
+    t0 = time.perf_counter()
     trace.gen_data(trace_len_limit=limit_trace_len)
+    if profile_callbacks:
+        print(f'Trace parsed in {round(time.perf_counter() - t0, 3)} seconds.')
 
     if float(noise_intensity)>0:
         def noisy_value(exact_value, noise_intensity):
@@ -79,9 +168,17 @@ if __name__ == "__main__":
                                      for id, exact_value in trace.lifetime_per_fileid.items()}
 
     if "all" in policies:
-        policies = list(available_policies.keys())
+        policies = [policy for policy in available_policies.keys()
+                    if policy not in registry.experimental_policies and
+                    (custom_trace not in registry.streaming_traces or policy not in registry.next_use_policies)]
         args["policies"] = policies
 
+    if resume is not None:
+        from checkpoint import Checkpoint
+        resumed_checkpoint = Checkpoint(resume)
+        if len(policies) > 1:
+            raise RuntimeError("A single policy must be selected to resume from a checkpoint")
+
     print(f'Starting program with parameters {str(args)[1:-1]}')
 
     # Write commandline parameters to logs
@@ -95,6 +192,14 @@ if __name__ == "__main__":
     except:
         print(f'Error trying to write into a new file in output folder "{output_folder}"')
 
+    # Runs writing files besides their results, resuming, or noised at random, are always simulated
+    result_cache = None
+    if not no_cache and resume is None and checkpoint_every is None and event_log_level is None and \
+            not chrome_trace and time_series_interval is None and not profile_callbacks and noise_intensity == 0:
+        from result_cache import ResultCache, run_key
+        result_cache = ResultCache(os.path.join(os.path.dirname(output_folder), "result_cache"))
+        trace_fingerprint = trace.fingerprint()
+
     run_index = 0
     formatted_results = ""
     unit = 10 ** 9
@@ -112,95 +217,177 @@ if __name__ == "__main__":
 
     plot_x = []  # storage config str
     plot_y = {}  # policy + stat -> value
+    latency_histograms = {}  # run index -> exported IO duration histograms of each tier, see LogHistogram.to_dict()
 
     for storage_config in storage_config_list:
         plot_x += [f'{storage_config[0][0]} {round(storage_config[0][1] / (10 ** 9), 3)} Go']
         for selected_policy in policies:
 
-            # Init simpy env
-            env = simpy.Environment()
+            run_parameters = {"trace": custom_trace, "limit_trace": limit_trace_len,
+                              "noise_intensity": noise_intensity, "policy": selected_policy,
+                              "storage_config": storage_config, "lifetime_model": lifetime_model,
+                              "direct_placement_lifetime": direct_placement_lifetime, "channels": channels,
+                              "prioritized_replay": prioritized_replay, "learner_mode": learner_mode,
+                              "promotion": [promotion_interval, promotion_budget, promotion_threshold,
+                                            promotion_half_life, promotion_watermark] if promotion else None}
+            cached_run = None
+            if result_cache is not None:
+                run_cache_key = run_key(trace_fingerprint, run_parameters)
+                cached_run = result_cache.get(run_cache_key)
+            if cached_run is not None:
+                print(f'Run of policy {selected_policy}, storage config {storage_config} and noise intensity '
+                      f'{noise_intensity} found in the result cache, skipping it.')
+                last_results = cached_run["results"]
+                run_stats = cached_run["stats"]
+                run_histograms = cached_run["latency_histograms"]
+            else:
+                t_run = time.perf_counter()
+                # Init simpy env
+                env = simpy.Environment(initial_time=resumed_checkpoint.now if resume is not None else 0)
+
+                # Tiers
+                tiers = [Tier(*config[:-1], channels=channels) for config in storage_config]
+                storage = StorageManager(tiers, env, profiler=CallbackProfiler() if profile_callbacks else None,
+                                         time_unit=trace.time_unit)
 
-            # Tiers
-            tiers = [Tier(*config[:-1]) for config in storage_config]
-            storage = StorageManager(tiers, env)
+                # Policies
+                # No config needed for now, maybe later
+                if lifetime_model == "trie":
+                    from prediction_models.prefix_trie_predictor import PrefixTriePredictor
+                    lifetime_prediction_model = PrefixTriePredictor()
+                else:
+                    lifetime_prediction_model = trace.lifetime_per_fileid
+                index = 0
+                for config in storage_config:
+                    policy_str = config[-1]
 
-            # Policies
-            # No config needed for now, maybe later
-            commandline_policy_class = available_policies[selected_policy]
-            index = 0
-            for config in storage_config:
-                policy_str = config[-1]
+                    if policy_str == "no-policy":
+                        index += 1
+                        continue
+                    elif policy_str == "commandline-policy":
+                        policy_str = selected_policy
+                    registry.build_policy(policy_str, tiers[index], storage, env, trace,
+                                          lifetime_prediction_model=lifetime_prediction_model,
+                                          direct_placement_lifetime=direct_placement_lifetime,
+                                          prioritized_replay=prioritized_replay, learner_mode=learner_mode)
 
-                policy_class = None
-                if policy_str == "no-policy":
                     index += 1
-                    continue
-                elif policy_str == "commandline-policy":
-                    policy_class = commandline_policy_class
-                elif policy_str in available_policies.keys():
-                    policy_class = available_policies[policy_str]
-                if policy_class == LifetimeOverrunPolicy or policy_class == CriteriaBasedPolicy:
-                    policy_class(tiers[index], storage, env, trace.lifetime_per_fileid)
-                else:
-                    policy_class(tiers[index], storage, env)
 
-                index += 1
+                if promotion:
+                    from policies.promotion_policy import PromotionPolicy
+                    for tier in tiers[1:]:
+                        PromotionPolicy(tier, storage, env, promote_threshold=promotion_threshold,
+                                        keep_threshold=promotion_threshold / 2,
+                                        half_life=promotion_half_life / trace.time_unit)
+                    storage.start_promotions(promotion_interval / trace.time_unit, promotion_budget,
+                                             promotion_watermark)
+
+                if event_log_level is not None:
+                    from event_log import EventLog, LEVELS
+                    event_log = EventLog(os.path.join(output_folder, f'events_{run_index}.bin'),
+                                         level=LEVELS[event_log_level], time_unit=trace.time_unit)
+                    storage.add_event_sink(event_log)
+
+                if chrome_trace:
+                    from chrome_trace import ChromeTraceSink
+                    timeline = ChromeTraceSink(os.path.join(output_folder, f'timeline_{run_index}.json'),
+                                               time_unit=trace.time_unit)
+                    storage.add_event_sink(timeline)
+
+                if time_series_interval is not None:
+                    from metrics_recorder import TimeSeriesRecorder
+                    expected_samples = 1024  # streaming traces cannot tell their duration in advance
+                    if isinstance(trace.data, list) and len(trace.data) > 0:
+                        trace_duration = (trace.timestamp_from_line(trace.data[-1]) -
+                                          trace.timestamp_from_line(trace.data[0])) * trace.time_unit
+                        expected_samples = int(trace_duration / time_series_interval) + 2
+                    recorder = TimeSeriesRecorder(storage, env, time_series_interval, time_unit=trace.time_unit,
+                                                  expected_samples=expected_samples)
+                    recorder.start()
 
-            sim = Simulation([trace], storage, env, log_file=os.path.join(output_folder, "latest.log"),
-                             progress_bar_enabled=not no_progress_bar,
-                             logs_enabled=verbose)
-            print(f'Starting simulation for policy {selected_policy}, storage config {storage_config} and noise '
-                  f'intensity {noise_intensity}!')
-            last_results = sim.run()
+                if resume is not None:
+                    resumed_checkpoint.restore(trace, storage)
+
+                sim = Simulation([trace], storage, env, log_file=os.path.join(output_folder, "latest.log"),
+                                 progress_bar_enabled=not no_progress_bar,
+                                 logs_enabled=verbose, start_line=resumed_checkpoint.line if resume is not None else 0,
+                                 checkpoint_every=checkpoint_every,
+                                 checkpoint_path=os.path.join(output_folder, f'checkpoint_{run_index}.npz'))
+                print(f'Starting simulation for policy {selected_policy}, storage config {storage_config} and noise '
+                      f'intensity {noise_intensity}!')
+                last_results = sim.run()
+                if time_series_interval is not None:
+                    recorder.sample()
+                    time_series_file = recorder.flush(os.path.join(output_folder, f'time_series_{run_index}'))
+                    last_results += f'Time series of {recorder.sample_count} samples saved to "{time_series_file}"\n\n'
+                if event_log_level is not None:
+                    event_log.close()
+                    last_results += f'{event_log.record_count} events logged to "{event_log.path}"\n\n'
+                if chrome_trace:
+                    timeline.close()
+                    last_results += f'Timeline of {timeline.event_count} events written to "{timeline.path}"\n\n'
+
+                run_stats = collect_run_stats(tiers)
+                run_histograms = {tier.name: {kind: histogram.to_dict() for kind, histogram
+                                              in tier.latency_histograms.items()} for tier in tiers}
+                if result_cache is not None:
+                    result_cache.put(run_cache_key, {"parameters": run_parameters, "storage_config": plot_x[-1],
+                                                     "results": last_results, "stats": run_stats,
+                                                     "latency_histograms": run_histograms,
+                                                     "simulated_in": round(time.perf_counter() - t_run, 3)})
             last_results = f'{"#" * 10} Run N°{run_index} {"#" * 10}\n{last_results}\n'
+            latency_histograms[run_index] = {"policy": selected_policy,
+                                             "storage_config": plot_x[-1],
+                                             "tiers": run_histograms}
             run_index += 1
             print(last_results)
             formatted_results += last_results
 
-            for tier in tiers:
-                for stat_name, stat_value in [("Nombre d'io", tier.number_of_reads + tier.number_of_write),
-                                              ("Nombre d'io de migration", tier.number_of_prefetching_from_this_tier
-                                                                           + tier.number_of_prefetching_to_this_tier
-                                                                           + tier.number_of_eviction_from_this_tier
-                                                                           + tier.number_of_eviction_to_this_tier),
-                                              ("Time spent reading", round(tier.time_spent_reading, 3)),
-                                              ("Time spent writing", round(tier.time_spent_writing, 3))]:
-                    line_name = f'{selected_policy} - {tier.name} - {stat_name}'
-                    if line_name not in plot_y.keys():
-                        plot_y[line_name] = []
-                    plot_y[line_name] += [stat_value]
-
-    index = 0
-    stats_per_config = 4
-    tmp = [plt.subplots(1, 1) for i in range(stats_per_config)]
-    figs = [v[0] for v in tmp]
-    axs = [v[1] for v in tmp]
-    colors = [f'C{i}' for i in range(10)]
-    markers = ['+', 'x', 's', 'o', 'd']
-    storage_tier_count = len(tiers)
-    legend = [[] for i in range(stats_per_config)]
-    for line_name in plot_y.keys():
-        legend[index % stats_per_config] += axs[index % stats_per_config].plot(plot_x, plot_y[line_name],
-                                                 f'{colors[int(index / (stats_per_config * storage_tier_count)) % len(colors)]}'
-                                                 f'{markers[(int(index / stats_per_config) % storage_tier_count)%len(markers)]}-', label=line_name)
-        index += 1
-    for i in range(len(figs)):
-        axs[i].legend(loc="upper right")
-        figs[i].tight_layout()
-
-    fig, axs = plt.subplots(1, 1)
-    plt.subplots_adjust(left=0.1)
-    axs.axis("tight")
-    axs.axis("off")
-    table = axs.table(cellText=list(plot_y.values()), rowLabels=list(plot_y.keys()), colLabels=plot_x, loc="center")
-    table.auto_set_font_size(False)
-    table.set_fontsize(8)
-    table.scale(0.8, 0.8)
-    #fig.tight_layout()
+            for stat_name, stat_value in run_stats:
+                line_name = f'{selected_policy} - {stat_name}'
+                if line_name not in plot_y.keys():
+                    plot_y[line_name] = []
+                plot_y[line_name] += [stat_value]
+
+    if result_cache is not None:
+        print(f'{result_cache.hits} runs read from the result cache "{result_cache.folder}", '
+              f'{result_cache.misses} simulated')
+
+    if not no_ui:
+        import matplotlib.pyplot as plt
+        index = 0
+        stats_per_config = 4
+        tmp = [plt.subplots(1, 1) for i in range(stats_per_config)]
+        figs = [v[0] for v in tmp]
+        axs = [v[1] for v in tmp]
+        colors = [f'C{i}' for i in range(10)]
+        markers = ['+', 'x', 's', 'o', 'd']
+        storage_tier_count = len(storage_config)
+        legend = [[] for i in range(stats_per_config)]
+        for line_name in plot_y.keys():
+            legend[index % stats_per_config] += axs[index % stats_per_config].plot(plot_x, plot_y[line_name],
+                                                     f'{colors[int(index / (stats_per_config * storage_tier_count)) % len(colors)]}'
+                                                     f'{markers[(int(index / stats_per_config) % storage_tier_count)%len(markers)]}-', label=line_name)
+            index += 1
+        for i in range(len(figs)):
+            axs[i].legend(loc="upper right")
+            figs[i].tight_layout()
+
+        fig, axs = plt.subplots(1, 1)
+        plt.subplots_adjust(left=0.1)
+        axs.axis("tight")
+        axs.axis("off")
+        table = axs.table(cellText=list(plot_y.values()), rowLabels=list(plot_y.keys()), colLabels=plot_x, loc="center")
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+        table.scale(0.8, 0.8)
+        #fig.tight_layout()
 
     try:
         with open(os.path.join(output_folder, "formatted_results.txt"), "w") as f:
             f.write(formatted_results)
+        with open(os.path.join(output_folder, "latency_histograms.json"), "w") as f:
+            json.dump(latency_histograms, f)
         with open(os.path.join(output_folder, "results_display.py"), "w") as f:
             f.write("import matplotlib.pyplot as plt\n\n"
                     f'# plot_x\nplot_x = {plot_x}\n\n'
@@ -212,7 +399,7 @@ if __name__ == "__main__":
                     "axs = [v[1] for v in dataset_ibm]\n"
                     "colors = [f'C{i}' for i in range(10)]\n"
                     "markers = ['+', 'x', 's', 'o', 'd']\n"
-                    f'storage_tier_count = {len(tiers)}\n'
+                    f'storage_tier_count = {len(storage_config)}\n'
                     "legend = [[] for i in range(stats_per_config)]\n"
                     "for line_name in plot_y.keys():\n"
                     "    legend[index % stats_per_config] += axs[index % stats_per_config].plot(plot_x, plot_y[line_name],\n"
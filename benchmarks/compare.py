@@ -0,0 +1,78 @@
+"""
+Compares two benchmark results written by benchmarks.run, and flags the regressions. Exits with status 1 if any.
+    python -m benchmarks.compare old.json new.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+
+# key: metric, value: True if higher is better
+WORKLOAD_METRICS = {"generation_lines_per_s": True}
+POLICY_METRICS = {"events_per_s": True,
+                  "peak_rss_mb": False,
+                  "eviction_round_mean_us": False,
+                  "eviction_round_max_us": False}
+
+
+def compare_metric(name, old, new, higher_is_better, threshold):
+    """
+    :return: the formatted comparison, and whether it is a regression
+    """
+    change = (new - old) / old if old != 0 else 0.
+    regression = (change < -threshold) if higher_is_better else (change > threshold)
+    return f'{name}: {round(old, 3)} -> {round(new, 3)} ({"+" if change >= 0 else ""}{round(change * 100, 1)}%)' \
+           f'{" REGRESSION" if regression else ""}', regression
+
+
+def compare(old, new, threshold):
+    """
+    :return: the formatted comparison, and the number of regressions
+    """
+    s = f'\n{" "*4}>> '
+    s2 = f'\n{" "*8}>> '
+    output = f'Comparing {old.get("commit")} to {new.get("commit")}, regression threshold {threshold * 100}%:\n'
+    regressions = 0
+    for workload_name, new_workload in new["workloads"].items():
+        old_workload = old["workloads"].get(workload_name)
+        if old_workload is None:
+            continue
+        output += f'Workload "{workload_name}":'
+        if old_workload["lines"] != new_workload["lines"]:
+            output += f'{s}different line counts ({old_workload["lines"]} and {new_workload["lines"]}), skipping\n'
+            continue
+        for metric, higher_is_better in WORKLOAD_METRICS.items():
+            line, regression = compare_metric(metric, old_workload[metric], new_workload[metric], higher_is_better,
+                                              threshold)
+            output += f'{s}{line}'
+            regressions += regression
+        for policy_name, new_stats in new_workload["policies"].items():
+            old_stats = old_workload["policies"].get(policy_name)
+            if old_stats is None:
+                continue
+            output += f'{s}{policy_name}'
+            if old_stats["migrations"] != new_stats["migrations"]:
+                output += f'{s2}migration count changed: {old_stats["migrations"]} -> {new_stats["migrations"]}'
+            for metric, higher_is_better in POLICY_METRICS.items():
+                line, regression = compare_metric(metric, old_stats[metric], new_stats[metric], higher_is_better,
+                                                  threshold)
+                output += f'{s2}{line}'
+                regressions += regression
+        output += '\n'
+    return output, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old", help="Reference results")
+    parser.add_argument("new", help="Results to check")
+    parser.add_argument("-t", "--threshold", help="Relative change flagged as a regression", default=0.1, type=float)
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    output, regressions = compare(old, new, args.threshold)
+    print(output)
+    print(f'{regressions} regression(s) found.')
+    sys.exit(1 if regressions > 0 else 0)
@@ -0,0 +1,143 @@
+"""
+Benchmarks the simulator on deterministic synthetic workloads, for every registered policy:
+    - trace generation rate (lines/s),
+    - replay rate (trace lines simulated per second),
+    - peak resident memory of the replay,
+    - eviction round latency (duration of the on_tier_nearly_full calls).
+
+Each replay runs in its own forked process so that peak memories do not add up. Usage, from the repository root:
+    python -m benchmarks.run [-o results.json] [--workloads small churn] [--policies lru fifo]
+    python -m benchmarks.compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import simpy
+
+import registry
+from forked_runs import peak_rss_mb, run_forked
+from profiling import CallbackProfiler
+from simulation import Simulation
+from storage import Tier, StorageManager
+from traces.synthetic_trace import SyntheticTrace
+
+# SyntheticTrace parameters of each workload
+WORKLOADS = {"small": {"line_count": 50000},
+             "skewed": {"line_count": 200000, "zipf_exponent": 1.5},
+             "churn": {"line_count": 200000, "op_mix": (0.35, 0.3, 0.05, 0.3), "lifetime_mu": 6.},
+             "large-objects": {"line_count": 100000, "size_mu": 15., "size_sigma": 1.5}}
+
+# Fraction of the workload PUT volume fitting in the first tier
+FIRST_TIER_FRACTION = 0.05
+
+
+def build_storage(trace, env, policy_name):
+    put_volume = sum([line[3] for line in trace.data if line[1] == "PUT"])
+    tiers = [Tier('SSD', max(1, round(put_volume * FIRST_TIER_FRACTION)), 100e-6, 2e9),
+             Tier('HDD', 100 * put_volume, 10e-3, 250e6),
+             Tier('Tapes', 100 * put_volume, 20, 315e6)]
+    storage = StorageManager(tiers, env)
+    for tier in tiers[:2]:
+        registry.build_policy(policy_name, tier, storage, env, trace)
+    return tiers, storage
+
+
+def replay(trace, policy_name, connection):
+    """Forked process: simulates the trace and sends the measurements back"""
+    env = simpy.Environment()
+    tiers, storage = build_storage(trace, env, policy_name)
+    # Only the eviction rounds are timed, so that the replay rate is not biased by the profiling
+    profiler = CallbackProfiler()
+    for tier in tiers:
+        for listener in tier.listeners:
+            listener.on_tier_nearly_full = profiler.wrap((type(listener).__name__, tier.name, "on_tier_nearly_full"),
+                                                         listener.on_tier_nearly_full)
+    simulation = Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False)
+    t0 = time.perf_counter()
+    simulation.run()
+    wall_time = time.perf_counter() - t0
+    rounds = [stats for stats in profiler.stats.values() if stats[0] > 0]
+    calls = sum([stats[0] for stats in rounds])
+    connection.send({"wall_time": wall_time,
+                     "events_per_s": len(trace.data) / wall_time,
+                     "peak_rss_mb": peak_rss_mb(),
+                     "eviction_rounds": calls,
+                     "eviction_round_mean_us": sum([stats[1] for stats in rounds]) / max(1, calls) / 1e3,
+                     "eviction_round_max_us": max([stats[2] for stats in rounds], default=0) / 1e3,
+                     "migrations": sum([tier.number_of_eviction_to_this_tier + tier.number_of_prefetching_to_this_tier
+                                        for tier in tiers])})
+    connection.close()
+
+
+def run_workload(name, parameters, policies, repeat=1):
+    trace = SyntheticTrace(**parameters)
+    t0 = time.perf_counter()
+    trace.gen_data()
+    generation_time = time.perf_counter() - t0
+    results = {"lines": len(trace.data),
+               "objects": trace.unique_files,
+               "generation_lines_per_s": len(trace.data) / generation_time,
+               "policies": {}}
+    for policy_name in policies:
+        # One replay at a time, so that they do not compete for the CPU
+        for _, stats in run_forked([(repetition, replay, (trace, policy_name)) for repetition in range(repeat)], 1):
+            if stats is None:
+                print(f'{name} - {policy_name}: the replay crashed, skipping it')
+                break
+            # Keeping the fastest replay, the slower ones measure the noise of the machine more than the code
+            if policy_name not in results["policies"] or \
+                    stats["events_per_s"] > results["policies"][policy_name]["events_per_s"]:
+                results["policies"][policy_name] = stats
+        if policy_name in results["policies"]:
+            stats = results["policies"][policy_name]
+            print(f'{name} - {policy_name}: {round(stats["events_per_s"])} events/s, '
+                  f'{round(stats["peak_rss_mb"], 1)} Mo peak RSS, {stats["eviction_rounds"]} eviction rounds of '
+                  f'{round(stats["eviction_round_mean_us"], 1)} us on average')
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="JSON file the results are written to. Defaults to "
+                                               "benchmarks/results/<commit>.json", default=None)
+    parser.add_argument("-w", "--workloads", nargs='+', choices=list(WORKLOADS.keys()),
+                        default=list(WORKLOADS.keys()))
+    parser.add_argument("-p", "--policies", nargs='+', choices=list(registry.available_policies.keys()),
+                        default=[policy for policy in registry.available_policies.keys()
+                                 if policy not in registry.experimental_policies])
+    parser.add_argument("-r", "--repeat", help="Replays per policy, the fastest is kept", default=1, type=int)
+    parser.add_argument("--scale", help="Multiplies the line count of the workloads", default=1., type=float)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    output = {"commit": commit,
+              "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(),
+              "machine": platform.machine(),
+              "scale": args.scale,
+              "repeat": args.repeat,
+              "workloads": {}}
+    for name in args.workloads:
+        parameters = dict(WORKLOADS[name])
+        parameters["line_count"] = int(parameters["line_count"] * args.scale)
+        output["workloads"][name] = run_workload(name, parameters, args.policies, args.repeat)
+
+    path = args.output
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f'{commit or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f'Results written to "{path}"')
@@ -0,0 +1,258 @@
+"""
+Finds, for each policy, the smallest first tier (SSD) meeting performance targets:
+    - migration IOs, as a percentage of all the IOs of the tiers,
+    - time spent reading, summed over the tiers.
+
+The searched value is the size of the first tier, or its target occupation. Targets are assumed to be easier to meet
+as it grows. The search first brackets the answer, halving or doubling the size from the one of the config file, then
+narrows the bracket. Each step simulates as many values as there are free cores: successive halvings or doublings
+while bracketing, values inside the bracket afterwards. It stops once the bracket is tighter than the tolerance, or
+holds no other value to simulate: replays are deterministic, so the bracket is the confidence interval of the answer.
+
+Simulations run through the experiment engine: the trace is parsed once, and values already simulated, by this search or
+another one, are read from the result cache. Every simulated value is then used to report the Pareto frontier of the
+first tier size against the migration IOs and the read time.
+
+    python capacity_planning.py -t ibm_object_store -l 1000000 -e EXP1 --max-migration-io 5 --max-read-time 3600
+"""
+import argparse
+import os
+import time
+
+import registry
+from experiment_engine import ExperimentEngine, load_experiments
+
+SEARCHED_VALUES = ("max_size", "target_occupation")
+OCCUPATION_STEP = 1e-4  # target occupations are searched on this grid
+
+
+def run_metrics(record):
+    """
+    :param record: job results, see ExperimentEngine.run()
+    :return: dict of the metrics constrained by the search, and the Tier.stats() of each tier
+    """
+    io_count = sum([value for name, value in record["stats"] if name.endswith(" - Nombre d'io")])
+    migration_io_count = sum([value for name, value in record["stats"]
+                              if name.endswith(" - Nombre d'io de migration")])
+    return {"migration_io_percent": 100 * migration_io_count / max(1, io_count),
+            "read_time": sum([stats["time_spent_reading"] for stats in record["tier_stats"].values()]),
+            "tier_stats": record["tier_stats"]}
+
+
+class BracketSearch:
+    def __init__(self, policy_name, searched_value, start, minimum, maximum, tolerance):
+        """
+        Smallest value meeting the targets, knowing that every larger value also meets them.
+        :param searched_value: see SEARCHED_VALUES. Sizes are searched on a logarithmic scale.
+        :param start: first value simulated when bracketing by halving or doubling. Target occupations are bracketed
+        by simulating the minimum and the maximum instead.
+        :param tolerance: relative width of the bracket for sizes, absolute width for target occupations, at least
+        OCCUPATION_STEP
+        """
+        if searched_value == "target_occupation" and tolerance < OCCUPATION_STEP:
+            raise ValueError(f'Target occupations are searched by steps of {OCCUPATION_STEP}, the tolerance cannot be '
+                             f'lower')
+        self.policy_name = policy_name
+        self.searched_value = searched_value
+        self.start = start
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.passing = None  # smallest value meeting the targets
+        self.failing = None  # largest value missing them, below the passing one
+        self.unreachable = False
+        self.exhausted = False  # no value left inside the bracket, eg. on the grid of the target occupations
+        self.simulated = []  # (value, metrics or None if the simulation crashed, meets the targets)
+
+    def _value(self, value):
+        return int(round(value)) if self.searched_value == "max_size" else value
+
+    def _between(self, low, high, fraction):
+        if self.searched_value == "max_size":
+            return self._value(low * (high / low) ** fraction)
+        return round(round((low + (high - low) * fraction) / OCCUPATION_STEP) * OCCUPATION_STEP, 4)
+
+    @property
+    def done(self):
+        if self.unreachable or self.exhausted or (self.passing is not None and self.passing <= self.minimum):
+            return True
+        if self.passing is None or self.failing is None:
+            return False
+        if self.searched_value == "max_size":
+            return self.passing - self.failing <= max(1, self.tolerance * self.passing)
+        return self.passing - self.failing <= self.tolerance
+
+    def next_values(self, count):
+        """
+        :param count: number of simulations that can run now
+        :return: values to simulate next, none once done
+        """
+        if self.done:
+            return []
+        if self.passing is None and self.failing is None:
+            return [self.start] if self.searched_value == "max_size" else [self.minimum, self.maximum]
+        if self.passing is None:  # doubling count times, the first value failing being known
+            return sorted(set([self._value(min(self.maximum, self.failing * 2 ** (i + 1))) for i in range(count)]))
+        if self.failing is None:
+            return sorted(set([self._value(max(self.minimum, self.passing / 2 ** (i + 1))) for i in range(count)]))
+        values = [self._between(self.failing, self.passing, (i + 1) / (count + 1)) for i in range(count)]
+        values = sorted(set([value for value in values if self.failing < value < self.passing]))
+        if len(values) == 0:
+            self.exhausted = True
+        return values
+
+    def update(self, value, metrics, meets_targets):
+        self.simulated += [(value, metrics, meets_targets)]
+        if meets_targets:
+            if self.passing is None or value < self.passing:
+                self.passing = value
+        elif (self.failing is None or value > self.failing) and (self.passing is None or value < self.passing):
+            self.failing = value
+        if self.failing is not None and self.passing is not None and self.failing >= self.passing:
+            self.failing = None  # a failing value above a passing one would mean the metrics are not monotonic
+        if not meets_targets and value >= self.maximum and self.passing is None:
+            self.unreachable = True
+
+
+def pareto_frontier(simulated):
+    """
+    :param simulated: list of (value, metrics, ...), see BracketSearch.simulated
+    :return: the simulated values no other one is better than on the value, the migration IOs and the read time,
+    sorted by value
+    """
+    def objectives(point):
+        return point[0], point[1]["migration_io_percent"], point[1]["read_time"]
+
+    simulated = [point for point in simulated if point[1] is not None]
+    frontier = []
+    for point in simulated:
+        if not any([objectives(other) != objectives(point) and
+                    all([a <= b for a, b in zip(objectives(other), objectives(point))]) for other in simulated]):
+            frontier += [point]
+    return sorted(frontier, key=objectives)
+
+
+def plan(engine, base_tiers, policies, searched_value, start, minimum, maximum, tolerance, max_migration_io=None,
+         max_read_time=None):
+    """
+    :param base_tiers: tiers of an experiment, see load_experiments(). The first one is searched.
+    :param max_migration_io: optional, percent
+    :param max_read_time: optional, seconds
+    :return: the BracketSearch of each policy
+    """
+    def meets_targets(metrics):
+        return (max_migration_io is None or metrics["migration_io_percent"] <= max_migration_io) and \
+            (max_read_time is None or metrics["read_time"] <= max_read_time)
+
+    searches = [BracketSearch(policy_name, searched_value, start, minimum, maximum, tolerance)
+                for policy_name in policies]
+    step = 0
+    while not all([search.done for search in searches]):
+        active = [search for search in searches if not search.done]
+        per_search = max(1, engine.max_parallel // len(active))
+        experiments = []
+        for search in active:
+            for value in search.next_values(per_search):
+                tiers = [dict(tier) for tier in base_tiers]
+                tiers[0][searched_value] = value
+                experiments += [(f'{searched_value}={value}', tiers, [search.policy_name])]
+        finished = engine.run(experiments)
+        for name, tiers, (policy_name,) in experiments:
+            search = [search for search in searches if search.policy_name == policy_name][0]
+            if (name, policy_name) not in finished:  # the policy cannot handle this tier, eg. too small for a file
+                search.update(tiers[0][searched_value], None, False)
+                continue
+            metrics = run_metrics(finished[(name, policy_name)])
+            search.update(tiers[0][searched_value], metrics, meets_targets(metrics))
+        step += 1
+        print(f'Step {step}: ' + ", ".join([f'{search.policy_name} in ]{search.failing}, {search.passing}]'
+                                            for search in searches]))
+    return searches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config-file", help="Config file describing the tiers, see experiment_engine.py",
+                        default=os.path.join(os.path.dirname(__file__), "config.cfg"))
+    parser.add_argument("-e", "--experiment", help="Section of the config file giving the tiers. The size of the first "
+                                                   "one is where the search starts. Its policies are searched unless "
+                                                   "--policies is given", default="EXP1")
+    parser.add_argument("-t", "--trace", help="Trace to simulate", choices=list(registry.available_traces.keys()),
+                        default="ibm_object_store")
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default=-1, type=int)
+    parser.add_argument("-p", "--policies", nargs='+', choices=list(registry.available_policies.keys()), default=None)
+    parser.add_argument("--search", help="Searched parameter of the first tier", choices=SEARCHED_VALUES,
+                        default="max_size")
+    parser.add_argument("--min", help="Smallest value searched, 1 Mo or a target occupation of 0.05 by default",
+                        default=None, type=float)
+    parser.add_argument("--max", help="Largest value searched, the size of the second tier or a target occupation of "
+                                      "0.99 by default", default=None, type=float)
+    parser.add_argument("--tolerance", help="Width of the final bracket, relative for sizes, absolute for target "
+                                            f'occupations, at least {OCCUPATION_STEP}', default=0.05, type=float)
+    parser.add_argument("--max-migration-io", help="Target: migration IOs, in percent of all IOs", default=None,
+                        type=float)
+    parser.add_argument("--max-read-time", help="Target: seconds spent reading, summed over the tiers", default=None,
+                        type=float)
+    parser.add_argument("-j", "--jobs", help="Maximum number of simulations running at the same time", default=None,
+                        type=int)
+    parser.add_argument("-o", "--output-folder", help="The folder next to which the result cache is kept",
+                        default="logs/<timestamp>", type=str)
+    parser.add_argument("--no-cache", help="Simulate every value, even those whose results are in the result cache",
+                        action="store_true")
+    args = parser.parse_args()
+    if args.max_migration_io is None and args.max_read_time is None:
+        parser.error("at least one target is needed: --max-migration-io or --max-read-time")
+    if args.search == "target_occupation" and args.tolerance < OCCUPATION_STEP:
+        parser.error(f'target occupations are searched by steps of {OCCUPATION_STEP}, --tolerance cannot be lower')
+
+    experiments = {name: (tiers, policies) for name, tiers, policies in load_experiments(args.config_file)}
+    if args.experiment not in experiments:
+        raise RuntimeError(f'Unknown experiment {args.experiment} in "{args.config_file}"')
+    base_tiers, policies = experiments[args.experiment]
+    policies = policies if args.policies is None else args.policies
+    if args.search == "max_size":
+        start = base_tiers[0]["max_size"]
+        minimum = 10 ** 6 if args.min is None else int(args.min)
+        maximum = base_tiers[1]["max_size"] if args.max is None else int(args.max)
+    else:
+        start = None
+        minimum = 0.05 if args.min is None else args.min
+        maximum = 0.99 if args.max is None else args.max
+    if not minimum <= (maximum if start is None else start) <= maximum:
+        raise RuntimeError(f'The search starts at {start}, out of [{minimum}, {maximum}]')
+
+    output_folder = args.output_folder.replace('/', os.path.sep).replace(
+        "<timestamp>", time.strftime("%a_%d_%b_%Y_%H-%M-%S", time.localtime()))
+    output_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), output_folder))
+
+    trace = registry.get_trace(args.trace)
+    trace.gen_data(trace_len_limit=args.limit_trace)
+    engine = ExperimentEngine(trace, {"trace": args.trace, "limit_trace": args.limit_trace}, max_parallel=args.jobs,
+                              cache_folder=None if args.no_cache else os.path.join(os.path.dirname(output_folder),
+                                                                                   "result_cache"))
+    t0 = time.perf_counter()
+    searches = plan(engine, base_tiers, policies, args.search, start, minimum, maximum, args.tolerance,
+                    max_migration_io=args.max_migration_io, max_read_time=args.max_read_time)
+
+    s = f'\n{" "*4}>> '
+    s2 = f'\n{" "*8}>> '
+    results = f'Capacity planning of the {base_tiers[0]["name"]} {args.search} in {round(time.perf_counter() - t0, 3)} s' \
+              f' ({engine.cache.hits if engine.cache is not None else 0} values read from the result cache):\n'
+    for search in searches:
+        results += f'\nPolicy "{search.policy_name}", {len(search.simulated)} values simulated:'
+        if search.unreachable:
+            results += f'{s}Targets missed even at {search.maximum}'
+        elif search.failing is None:
+            results += f'{s}Targets met from the minimum, {search.passing}'
+        else:
+            results += f'{s}Smallest value meeting the targets: {search.passing} (missed at {search.failing})'
+        results += f'{s}Pareto frontier of {args.search}, migration IOs, read time:'
+        for value, metrics, meets_targets in pareto_frontier(search.simulated):
+            first_tier_stats = metrics["tier_stats"][base_tiers[0]["name"]]
+            results += f'{s2}{value}: {round(metrics["migration_io_percent"], 2)} % migration IOs, ' \
+                       f'{round(metrics["read_time"], 3)} s reading' + \
+                       (" (meets the targets)" if meets_targets else "") + \
+                       f', {base_tiers[0]["name"]} stats: ' + \
+                       ", ".join([f'{name} {round(stat, 3)}' for name, stat in first_tier_stats.items()])
+    print(results)
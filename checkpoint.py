@@ -0,0 +1,144 @@
+"""
+Checkpoints of a running simulation, to resume a long replay after a crash, or to skip the warm-up of the tiers.
+
+A checkpoint is a compressed .npz archive:
+    - the files of each tier, as columns (path, size, creation time, last modification, last access, user),
+    - a pickled state: trace cursor, simulation time, tier counters, storage manager state, and the state of each
+      policy, see Policy.export_state().
+
+Restoring needs the same trace, and tiers and policies built with the same parameters, in the same order. The
+policies are then given back their state, without replaying any event. Processes other than the trace reading restart
+with the resumed simulation: promotions still happen at multiples of their interval, but time-series sampling starts
+at the resumed time.
+"""
+import os
+import pickle
+import numpy as np
+from storage import File, StorageManager
+
+VERSION = 1
+_FILE_COLUMNS = ("path", "size", "creation_time", "last_modification", "last_access", "user")
+_TIER_COUNTERS = ("used_size", "number_of_reads", "number_of_write", "number_of_eviction_from_this_tier",
+                  "number_of_eviction_to_this_tier", "number_of_prefetching_from_this_tier",
+                  "number_of_prefetching_to_this_tier", "time_spent_reading", "time_spent_writing",
+                  "latency_histograms", "_channel_free_at", "_first_io_at", "busy_time", "queueing_delay",
+                  "queued_operations")
+
+
+def _listeners(storage: StorageManager):
+    """
+    :return: the policies of all tiers, in registration order. A policy registered on several tiers is listed once.
+    """
+    listeners = []
+    for tier in storage.tiers:
+        for listener in tier.listeners:
+            if all([listener is not other for other in listeners]):
+                listeners += [listener]
+    return listeners
+
+
+def _trace_fingerprint(trace):
+    return type(trace).__name__, len(trace.data)
+
+
+def save(path, trace, storage: StorageManager, line, now):
+    """
+    Written to a temporary file first, so that a crash while saving does not lose the previous checkpoint.
+    :param line: index of the next trace line to read
+    :param now: simulation time
+    """
+    listeners = _listeners(storage)
+    policy_indexes = {id(listener): index for index, listener in enumerate(listeners)}
+    prediction_models = []  # online models are shared between policies and not part of their state
+    for listener in listeners:
+        model = getattr(listener, "prediction_model", None)
+        if model is not None and not isinstance(model, dict) and all([model is not other for other in
+                                                                       prediction_models]):
+            prediction_models += [model]
+    state = {"version": VERSION,
+             "trace": _trace_fingerprint(trace),
+             "line": line,
+             "now": now,
+             "trace_cursor": (trace.cursor, trace._next_use_per_path) if trace.next_use is not None else None,
+             "tiers": [{counter: getattr(tier, counter) for counter in _TIER_COUNTERS} for tier in storage.tiers],
+             "policies": [(type(listener).__name__, listener.export_state()) for listener in listeners],
+             "prediction_models": prediction_models,
+             "promotion_queue": [(path, policy_indexes[id(policy)]) for path, policy in
+                                 storage.promotion_queue.items()],
+             "promotion_stats": storage.promotion_stats,
+             "placement_stats": storage.placement_stats}
+
+    arrays = {"state": np.frombuffer(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)}
+    for index, tier in enumerate(storage.tiers):
+        files = list(tier.content.values())
+        arrays[f'tier{index}.path'] = np.array([file.path for file in files], dtype=str)
+        arrays[f'tier{index}.size'] = np.array([file.size for file in files], dtype=np.int64)
+        arrays[f'tier{index}.creation_time'] = np.array([file.creation_time for file in files], dtype=np.float64)
+        arrays[f'tier{index}.last_modification'] = np.array([file.last_modification for file in files],
+                                                            dtype=np.float64)
+        arrays[f'tier{index}.last_access'] = np.array([file.last_access for file in files], dtype=np.float64)
+        arrays[f'tier{index}.user'] = np.array([file.user for file in files], dtype=str)
+
+    temporary_path = f'{path}.tmp.npz'
+    np.savez_compressed(temporary_path, **arrays)
+    os.replace(temporary_path, path)
+
+
+class Checkpoint:
+    def __init__(self, path):
+        """Reads a checkpoint written by save()"""
+        with np.load(path) as archive:
+            self._arrays = {name: archive[name] for name in archive.files}
+        self._state = pickle.loads(self._arrays.pop("state").tobytes())
+        if self._state["version"] != VERSION:
+            raise RuntimeError(f'Checkpoint "{path}" was written by another version of the simulator')
+        self.path = path
+        self.line = self._state["line"]  # index of the next trace line to read
+        self.now = self._state["now"]  # simulation time, to be given to simpy.Environment(initial_time=...)
+        self.policy_names = [name for name, _ in self._state["policies"]]
+
+    def restore(self, trace, storage: StorageManager):
+        """
+        Restores the tiers and policies. Must be called once the policies are built, before simulating.
+        """
+        if _trace_fingerprint(trace) != tuple(self._state["trace"]):
+            raise RuntimeError(f'Checkpoint "{self.path}" was written for another trace: {self._state["trace"]}')
+        listeners = _listeners(storage)
+        if [type(listener).__name__ for listener in listeners] != self.policy_names or \
+                len(storage.tiers) != len(self._state["tiers"]):
+            raise RuntimeError(f'Checkpoint "{self.path}" was written with other tiers or policies: '
+                               f'{self.policy_names}')
+
+        for index, tier in enumerate(storage.tiers):
+            assert len(tier.content) == 0, "Tiers must be empty before restoring a checkpoint"
+            columns = [self._arrays[f'tier{index}.{column}'] for column in _FILE_COLUMNS]
+            for path, size, creation_time, last_modification, last_access, user in zip(*columns):
+                File(str(path), tier, int(size), float(creation_time), float(last_modification), float(last_access),
+                     str(user))
+            for counter, value in self._state["tiers"][index].items():
+                if counter == "latency_histograms":  # merged into the empty ones, the tier holds references to them
+                    for kind, histogram in value.items():
+                        tier.latency_histograms[kind].merge(histogram)
+                else:
+                    setattr(tier, counter, value)
+
+        models = iter(self._state["prediction_models"])
+        restored_models = {}
+        for listener, (_, state) in zip(listeners, self._state["policies"]):
+            listener.import_state(state)
+            model = getattr(listener, "prediction_model", None)
+            if model is not None and not isinstance(model, dict) and id(model) not in restored_models:
+                model.__dict__.update(next(models).__dict__)  # in place, the model may be shared
+                restored_models[id(model)] = model
+
+        storage.promotion_queue.clear()
+        for path, policy_index in self._state["promotion_queue"]:
+            storage.promotion_queue[path] = listeners[policy_index]
+        if self._state["promotion_stats"] is not None:
+            storage.promotion_stats = self._state["promotion_stats"]
+        storage.placement_stats = self._state["placement_stats"]
+
+        if self._state["trace_cursor"] is not None:
+            if trace.next_use is None:
+                trace.gen_next_use_index()
+            trace.cursor, trace._next_use_per_path = self._state["trace_cursor"]
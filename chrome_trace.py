@@ -0,0 +1,164 @@
+"""
+Timeline of a simulation in the Chrome trace event format, to be opened in Perfetto (ui.perfetto.dev) or
+chrome://tracing. Each tier gets a track:
+    - eviction rounds (on_tier_nearly_full calls) are spans,
+    - migrations are slices on the source and destination tracks, linked by a flow arrow,
+    - the used size of each tier is a counter track.
+
+Migrations of an eviction round all happen at the same simulated instant. To make them visible, the timeline runs on
+a virtual clock, advanced by the modelled duration of each migration (read on the source tier, then write on the
+destination tier) and never late on the simulated time. Spans are thus as long as the IO they would really cost.
+
+Events are written as they arrive, the document is never built in memory. Can be used as an event sink of the
+StorageManager during a run, or offline on a binary event log:
+    python chrome_trace.py <event log> -o timeline.json
+"""
+import argparse
+import json
+
+from event_log import CREATE, DELETE, MIGRATION, ROUND_START, ROUND_END
+
+_PID = 1
+
+
+class ChromeTraceSink:
+    def __init__(self, path, time_unit=1., counter_interval=60., tier_models=None):
+        """
+        :param path: JSON file written
+        :param time_unit: seconds per timestamp unit, see Trace.time_unit
+        :param counter_interval: seconds between two used size samples triggered by file creations and deletions.
+        Eviction rounds and migrations always update the counters.
+        :param tier_models: optional, key: tier name, value: (latency, throughput) used to model migration durations.
+        Read from the tiers themselves when used as an event sink.
+        """
+        self.path = path
+        self.time_unit = time_unit
+        self.counter_interval = counter_interval
+        self.tier_models = dict(tier_models) if tier_models is not None else {}
+        self.event_count = 0
+        self._clock = 0.  # us
+        self._flow_id = 0
+        self._tracks = {}  # key: tier name, value: thread id
+        self._used_sizes = {}  # key: tier name, value: octets
+        self._last_counter = {}  # key: tier name, value: us
+        # (path, source tier name, destination tier name) of the last migration. Its CREATE and DELETE events follow
+        # it, before any other migration, and are already accounted. Logs below the debug level have none.
+        self._migration = None
+
+        self._file = open(path, "w")
+        self._file.write('[')
+        self._write({"ph": "M", "pid": _PID, "name": "process_name", "args": {"name": "Storage tiers"}})
+
+    def _write(self, event):
+        self._file.write((",\n" if self.event_count > 0 else "\n") + json.dumps(event, separators=(',', ':')))
+        self.event_count += 1
+
+    def _track(self, name):
+        tid = self._tracks.get(name)
+        if tid is None:
+            tid = len(self._tracks) + 1
+            self._tracks[name] = tid
+            self._used_sizes[name] = 0
+            self._last_counter[name] = float("-inf")
+            self._write({"ph": "M", "pid": _PID, "tid": tid, "name": "thread_name", "args": {"name": name}})
+            self._write({"ph": "M", "pid": _PID, "tid": tid, "name": "thread_sort_index", "args": {"sort_index": tid}})
+        return tid
+
+    def _counter(self, name, ts):
+        self._last_counter[name] = ts
+        self._write({"ph": "C", "pid": _PID, "name": f'{name} used size', "ts": ts,
+                     "args": {"octets": self._used_sizes[name]}})
+
+    def _io_duration(self, name, size):
+        """
+        :return: modelled duration in us, 1 us if the tier model is unknown
+        """
+        if name not in self.tier_models:
+            return 1.
+        latency, throughput = self.tier_models[name]
+        return (latency + size / throughput) * 1e6
+
+    def emit(self, op, timestamp, path=None, source=None, destination=None, size=0):
+        """Event sink interface, see StorageManager.event_sinks"""
+        if op not in (CREATE, DELETE, MIGRATION, ROUND_START, ROUND_END):
+            return
+        for tier in (source, destination):
+            if tier is not None and tier.name not in self.tier_models:
+                self.tier_models[tier.name] = (tier.latency, tier.throughput)
+        self.record(op, timestamp * self.time_unit, path, None if source is None else source.name,
+                    None if destination is None else destination.name, size)
+
+    def record(self, op, seconds, path, source, destination, size):
+        """
+        :param seconds: simulated time of the event
+        :param source: name of the source tier, or of the tier of the operation
+        :param destination: name of the destination tier, for migrations
+        """
+        ts = max(seconds * 1e6, self._clock)
+        tid = self._track(source)
+        if op == CREATE or op == DELETE:
+            if self._migration is not None and self._migration[0] == path:  # already accounted by the migration
+                if op == DELETE and self._migration[1] == source:
+                    self._migration = None
+                return
+            self._used_sizes[source] += size if op == CREATE else -size
+            if ts - self._last_counter[source] >= self.counter_interval * 1e6:
+                self._counter(source, ts)
+        elif op == ROUND_START:
+            self._migration = None
+            self._used_sizes[source] = size
+            self._counter(source, ts)
+            self._write({"ph": "B", "pid": _PID, "tid": tid, "ts": ts, "name": "eviction round",
+                         "args": {"used size": size}})
+        elif op == ROUND_END:
+            self._used_sizes[source] = size
+            self._write({"ph": "E", "pid": _PID, "tid": tid, "ts": ts, "args": {"used size": size}})
+            self._counter(source, ts)
+        elif op == MIGRATION:
+            destination_tid = self._track(destination)
+            read_duration = self._io_duration(source, size)
+            duration = read_duration + self._io_duration(destination, size)
+            self._flow_id += 1
+            args = {"path": path, "size": size}
+            self._write({"ph": "X", "pid": _PID, "tid": tid, "ts": ts, "dur": read_duration,
+                         "name": f'migration to {destination}', "args": args})
+            self._write({"ph": "s", "pid": _PID, "tid": tid, "ts": ts, "id": self._flow_id, "name": "migration",
+                         "cat": "migration"})
+            self._write({"ph": "X", "pid": _PID, "tid": destination_tid, "ts": ts + read_duration,
+                         "dur": duration - read_duration, "name": f'migration from {source}', "args": args})
+            self._write({"ph": "f", "bp": "e", "pid": _PID, "tid": destination_tid, "ts": ts + read_duration,
+                         "id": self._flow_id, "name": "migration", "cat": "migration"})
+            self._clock = ts + duration
+            self._migration = (path, source, destination)
+            self._used_sizes[source] -= size
+            self._used_sizes[destination] += size
+            self._counter(source, self._clock)
+            self._counter(destination, self._clock)
+
+    def close(self):
+        self._file.write('\n]\n')
+        self._file.close()
+
+
+if __name__ == "__main__":
+    from event_log import read_events, OPERATION_NAMES
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="An event log written with --event-log, at the info level or below")
+    parser.add_argument("-o", "--output", help="Chrome trace JSON written", default="timeline.json")
+    parser.add_argument("--tier", help="Latency (seconds) and throughput (octets/seconds) of a tier, to model the "
+                                       "migration durations. Migrations last 1 us on unknown tiers.",
+                        nargs=3, metavar=("NAME", "LATENCY", "THROUGHPUT"), action="append", default=[])
+    parser.add_argument("--counter-interval", help="Seconds between two used size samples triggered by file "
+                                                   "creations and deletions", default=60., type=float)
+    args = parser.parse_args()
+
+    time_unit, events = read_events(args.file)
+    sink = ChromeTraceSink(args.output, time_unit, args.counter_interval,
+                           {name: (float(latency), float(throughput)) for name, latency, throughput in args.tier})
+    op_codes = {name: code for code, name in enumerate(OPERATION_NAMES)}
+    for op, timestamp, path, source, destination, size in events:
+        if op_codes[op] in (CREATE, DELETE, MIGRATION, ROUND_START, ROUND_END):
+            sink.record(op_codes[op], timestamp * time_unit, path, source, destination, size)
+    sink.close()
+    print(f'{sink.event_count} trace events written to "{args.output}"')
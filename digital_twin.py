@@ -0,0 +1,335 @@
+"""
+Digital twin: the simulator runs alongside a real storage system, fed with its events as they happen instead of with a
+trace file.
+
+Events are lines of the IBM object store trace format, eg. "1219008 REST.PUT.OBJECT 8d4fcda3d675bac9 1056", read from
+a Unix socket (any number of connections) or from a FIFO, either newline separated or prefixed by their length (4
+octets, big endian). They go through a bounded queue: once it is full, the twin stops reading, and the senders are
+blocked by the socket or FIFO buffers.
+
+Each event advances the simulation to its timestamp, as fast as possible, or at wall-clock speed times --speed. Events
+older than the simulation time are simulated at the current time and counted as late. Since there is no trace to look
+ahead, oracle policies cannot be used, and the lifetime policy learns lifetimes online.
+
+Commands, sent on a socket connection as events are, are answered with a JSON record framed the same way:
+    - STATS: live Tier.stats() of each tier, with their IO duration percentiles, without waiting for the queue,
+    - HISTOGRAMS: live IO duration histograms of each tier, see LogHistogram.to_dict(),
+    - FLUSH: STATS, answered once the events received before have been simulated,
+    - STOP: stops the twin once the events received before have been simulated, and prints the results.
+
+    python digital_twin.py serve --socket /tmp/twin.sock lru
+    python digital_twin.py replay --socket /tmp/twin.sock -t synthetic -l 100000 --stop
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import struct
+import time
+
+import simpy
+
+import registry
+from simulation import Simulation
+from storage import Tier, StorageManager
+from traces.ibm_object_store_trace import IBMObjectStoreTrace
+from whatif import DEFAULT_STORAGE_CONFIG
+
+ORACLE_POLICIES = ("opt", "opt-size", "criteria")
+COMMANDS = (b"STATS", b"HISTOGRAMS", b"FLUSH", b"STOP")
+_LENGTH = struct.Struct(">I")
+# Events simulated before the consumer yields to the event loop, so that ingestion and STATS or HISTOGRAMS commands are
+# served while the queue is drained
+_EVENTS_PER_YIELD = 32
+
+
+async def read_record(reader: asyncio.StreamReader, length_prefixed):
+    """
+    :return: the next record, without its framing, None at the end of the stream
+    """
+    try:
+        if length_prefixed:
+            length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+            return await reader.readexactly(length)
+        line = await reader.readline()
+        return line.rstrip(b"\r\n") if len(line) > 0 else None
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def frame(record: bytes, length_prefixed):
+    return _LENGTH.pack(len(record)) + record if length_prefixed else record + b"\n"
+
+
+class DigitalTwin:
+    def __init__(self, storage: StorageManager, env: simpy.Environment, trace: IBMObjectStoreTrace, queue_size=10000,
+                 speed=None, length_prefixed=False):
+        """
+        :param trace: reads the events, its data is not used
+        :param queue_size: maximum number of events received but not simulated yet
+        :param speed: optional, simulated seconds per wall-clock second. Events are simulated as fast as possible if
+        None.
+        """
+        self.storage = storage
+        self.env = env
+        self.trace = trace
+        self.queue_size = queue_size
+        self.speed = speed
+        self.length_prefixed = length_prefixed
+        self.event_count = 0
+        self.late_events = 0
+        self.invalid_events = 0
+        self._queue = None  # created in the event loop
+        self._stopped = None
+        self._first_event = None  # (simulated time, wall-clock time) of the first event, for the wall-clock speed
+        self._fifo_write_end = None
+        self._log_stream = open(os.devnull, "w")
+        self._simulation = Simulation([], storage, env, progress_bar_enabled=False, logs_enabled=False)
+        self._t0 = time.perf_counter()
+
+    def stats(self):
+        """
+        :return: JSON serializable live stats
+        """
+        tiers = {}
+        for tier in self.storage.tiers:
+            tiers[tier.name] = dict(tier.stats(), used_size=tier.used_size, max_size=tier.max_size,
+                                    io_durations={kind: {"count": histogram.total_count,
+                                                         "p50": histogram.percentile(50),
+                                                         "p90": histogram.percentile(90),
+                                                         "p99": histogram.percentile(99),
+                                                         "max": histogram.max}
+                                                  for kind, histogram in tier.latency_histograms.items()
+                                                  if histogram.total_count > 0})
+        return {"simulated_seconds": self.env.now * self.trace.time_unit,
+                "events": self.event_count,
+                "late_events": self.late_events,
+                "invalid_events": self.invalid_events,
+                "queued_events": 0 if self._queue is None else self._queue.qsize(),
+                "tiers": tiers}
+
+    def histograms(self):
+        return {tier.name: {kind: histogram.to_dict() for kind, histogram in tier.latency_histograms.items()}
+                for tier in self.storage.tiers}
+
+    def results(self):
+        return self._simulation.results(time.perf_counter() - self._t0)
+
+    def _advance(self, timestamp):
+        """Runs the simulation until the given simulated time, eg. to end the migrations started before"""
+        if timestamp > self.env.now:
+            self.env.run(until=timestamp)
+
+    def _simulate(self, record: bytes):
+        line = IBMObjectStoreTrace.parse_line(record.decode(errors="replace"))
+        if line is None:
+            self.invalid_events += 1
+            return
+        if line[0] < self.env.now:
+            self.late_events += 1
+            line = (self.env.now,) + line[1:]
+        with contextlib.redirect_stdout(self._log_stream):  # as Simulation does, when its logs are disabled
+            self._advance(line[0])
+            try:
+                self.trace.read_data_line(self.env, self.storage, line, False, False)
+            except RuntimeError:  # eg. an access to an object created before the twin started
+                self.invalid_events += 1
+                return
+        self.event_count += 1
+
+    async def _pace(self, timestamp):
+        """Waits until the wall-clock time of a simulated time, at the requested speed"""
+        if self.speed is None:
+            return
+        if self._first_event is None:
+            self._first_event = (timestamp, time.perf_counter())
+        delay = (timestamp - self._first_event[0]) * self.trace.time_unit / self.speed - \
+            (time.perf_counter() - self._first_event[1])
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _consume(self):
+        """Simulates the queued events in order, answers the queued commands"""
+        simulated = 0
+        while True:
+            record, reply = await self._queue.get()
+            if record == b"FLUSH":
+                reply.set_result(self.stats())
+            elif record == b"STOP":
+                reply.set_result(self.stats())
+                self._stopped.set()
+                return
+            else:
+                try:
+                    timestamp = int(record.split(b" ", 1)[0])
+                except ValueError:
+                    timestamp = None
+                if timestamp is not None:
+                    await self._pace(timestamp)
+                self._simulate(record)
+                simulated += 1
+                if simulated % _EVENTS_PER_YIELD == 0:  # queue.get() does not suspend while the queue has items
+                    await asyncio.sleep(0)
+
+    async def _ingest(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter = None):
+        """Queues the events of a stream. Commands are answered when there is a writer to answer to."""
+        while not self._stopped.is_set():
+            record = await read_record(reader, self.length_prefixed)
+            if record is None:
+                break
+            if record in COMMANDS:
+                if record == b"STATS":
+                    answer = self.stats()
+                elif record == b"HISTOGRAMS":
+                    answer = self.histograms()
+                else:
+                    reply = asyncio.get_running_loop().create_future()
+                    await self._queue.put((record, reply))
+                    answer = await reply
+                if writer is not None:
+                    writer.write(frame(json.dumps(answer).encode(), self.length_prefixed))
+                    await writer.drain()
+            elif len(record) > 0:
+                await self._queue.put((record, None))  # waits while the queue is full, which blocks the sender
+        if writer is not None:
+            writer.close()
+
+    async def _open_fifo(self, path):
+        """
+        :return: a reader on the FIFO, which never reaches its end: writers may come and go
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        read_end = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self._fifo_write_end = os.open(path, os.O_WRONLY | os.O_NONBLOCK)  # kept open, so that EOF is never read
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_end, "rb", 0))
+        return reader
+
+    async def serve(self, socket_path=None, fifo_path=None):
+        """Ingests events until a STOP command"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stopped = asyncio.Event()
+        consumer = asyncio.create_task(self._consume())
+        server = None
+        fifo_ingestion = None
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self._ingest, path=socket_path)
+            print(f'Listening on "{socket_path}"')
+        if fifo_path is not None:
+            if not os.path.exists(fifo_path):
+                os.mkfifo(fifo_path)
+            fifo_ingestion = asyncio.create_task(self._ingest(await self._open_fifo(fifo_path)))
+            print(f'Reading "{fifo_path}"')
+        await self._stopped.wait()
+        await consumer
+        self._simulation.finish()
+        if server is not None:
+            server.close()  # not waiting for the connections still open, they are closed with the event loop
+            os.remove(socket_path)
+        if fifo_ingestion is not None:
+            fifo_ingestion.cancel()
+            os.close(self._fifo_write_end)
+
+
+def build_twin(policy_name, storage_config=None, channels=None, **parameters):
+    """
+    :param channels: optional, channels of each tier, see Tier
+    :param parameters: see DigitalTwin
+    """
+    if policy_name in ORACLE_POLICIES:
+        raise RuntimeError(f'Policy {policy_name} needs to know the trace in advance, it cannot be used by a twin')
+    storage_config = DEFAULT_STORAGE_CONFIG if storage_config is None else storage_config
+    env = simpy.Environment()
+    trace = IBMObjectStoreTrace()
+    tiers = [Tier(*config[:-1], channels=channels) for config in storage_config]
+    storage = StorageManager(tiers, env, time_unit=trace.time_unit)
+    lifetime_prediction_model = None
+    if policy_name == "lifetime":
+        from prediction_models.prefix_trie_predictor import PrefixTriePredictor
+        lifetime_prediction_model = PrefixTriePredictor()
+    for config, tier in zip(storage_config, tiers):
+        if config[-1] != "no-policy":
+            registry.build_policy(policy_name if config[-1] == "commandline-policy" else config[-1], tier, storage,
+                                  env, trace, lifetime_prediction_model=lifetime_prediction_model)
+    return DigitalTwin(storage, env, trace, **parameters)
+
+
+def replay(trace, socket_path=None, fifo_path=None, length_prefixed=False, stop=False):
+    """
+    Pushes the lines of a trace to a twin, as fast as the twin takes them.
+    :param stop: ends the replay with a STOP command instead of a FLUSH
+    :return: the stats answered by the twin at the end of the replay, None when replaying to a FIFO
+    """
+    if socket_path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+        stream = connection.makefile("rwb")
+    else:
+        stream = open(fifo_path, "wb")
+    for timestamp, op_code, uid, size, offset_start, offset_end, *_ in trace.data:
+        stream.write(frame(f'{timestamp} REST.{op_code}.OBJECT {uid} {size} {offset_start} {offset_end}'.encode(),
+                           length_prefixed))
+    if socket_path is None:
+        if stop:
+            stream.write(frame(b"STOP", length_prefixed))
+        stream.close()
+        return None
+    stream.write(frame(b"STOP" if stop else b"FLUSH", length_prefixed))
+    stream.flush()
+    if length_prefixed:
+        length, = _LENGTH.unpack(stream.read(_LENGTH.size))
+        answer = stream.read(length)
+    else:
+        answer = stream.readline()
+    stream.close()
+    connection.close()
+    return json.loads(answer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the twin")
+    serve_parser.add_argument("policy", choices=[name for name in registry.available_policies.keys()
+                                                 if name not in ORACLE_POLICIES])
+    serve_parser.add_argument("--queue-size", help="Maximum number of events received but not simulated yet",
+                              default=10000, type=int)
+    serve_parser.add_argument("--speed", help="Simulated seconds per wall-clock second. As fast as possible if not "
+                                              "given", default=None, type=float)
+    serve_parser.add_argument("--channels", help="Model the contention of each tier, see --channels of __main__.py",
+                              default=None, type=int)
+    replay_parser = subparsers.add_parser("replay", help="Push a recorded trace to a running twin")
+    replay_parser.add_argument("-t", "--trace", help="Trace to replay", choices=list(registry.available_traces.keys()),
+                               default="ibm_object_store")
+    replay_parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                               default=-1, type=int)
+    replay_parser.add_argument("--stop", help="Stop the twin at the end of the replay", action="store_true")
+    for subparser in [serve_parser, replay_parser]:
+        subparser.add_argument("--socket", help="Unix socket the events are sent to", default=None)
+        subparser.add_argument("--fifo", help="FIFO the events are written to", default=None)
+        subparser.add_argument("--length-prefixed", help="Events are prefixed by their length instead of separated by "
+                                                         "new lines", action="store_true")
+    args = parser.parse_args()
+    if args.socket is None and args.fifo is None:
+        parser.error("--socket or --fifo is needed")
+
+    if args.mode == "serve":
+        twin = build_twin(args.policy, channels=args.channels, queue_size=args.queue_size, speed=args.speed,
+                          length_prefixed=args.length_prefixed)
+        asyncio.run(twin.serve(socket_path=args.socket, fifo_path=args.fifo))
+        print(f'Twin stopped after {twin.event_count} events ({twin.late_events} late, {twin.invalid_events} '
+              f'invalid), {round(twin.env.now * twin.trace.time_unit, 3)} simulated seconds:\n')
+        print(twin.results())
+    else:
+        trace = registry.get_trace(args.trace)
+        trace.gen_data(trace_len_limit=args.limit_trace)
+        t0 = time.perf_counter()
+        stats = replay(trace, socket_path=args.socket, fifo_path=args.fifo, length_prefixed=args.length_prefixed,
+                       stop=args.stop)
+        print(f'{len(trace.data)} events replayed in {round(time.perf_counter() - t0, 3)} s')
+        if stats is not None:
+            print(json.dumps(stats, indent=2))
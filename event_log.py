@@ -0,0 +1,218 @@
+"""
+Structured event log of a simulation, written in a compact binary format instead of formatted text.
+
+A log file starts with a header (magic, format version, seconds per timestamp unit), followed by fixed size records:
+operation code, timestamp, file id, source tier index, destination tier index and size. Paths and tier names are
+interned: the first time a path is logged, a PATH record gives its id, followed by the utf-8 encoded path.
+
+Events are emitted to the sinks of the StorageManager, see StorageManager.event_sinks. Reading the log back:
+    python event_log.py <log file> [--format text|csv]
+"""
+import argparse
+import queue
+import struct
+import threading
+
+MAGIC = b"SIMEVENT"
+VERSION = 1
+_HEADER = struct.Struct("<8sHd")  # magic, version, time unit
+_RECORD = struct.Struct("<Bdiiiq")  # op, timestamp, file id, source tier, destination tier, size
+
+# Operation codes
+PATH = 0  # file id -> path, size is the length of the encoded path that follows the record
+TIER = 1  # source tier index -> tier name, size is the length of the encoded name that follows the record
+CREATE = 2
+DELETE = 3
+READ = 4
+WRITE = 5
+MIGRATION = 6  # from the source tier to the destination tier
+ROUND_START = 7  # a tier reached its target occupation and its policies start evicting, size is its used size
+ROUND_END = 8  # size is the used size of the tier once the eviction round is over
+MISSING_FILE = 9  # an IO targeted a file that is not on the tier, see Tier.read_file()
+INVALID_LINE = 10  # a trace line was skipped
+
+OPERATION_NAMES = ("PATH", "TIER", "CREATE", "DELETE", "READ", "WRITE", "MIGRATION", "ROUND_START", "ROUND_END",
+                   "MISSING_FILE", "INVALID_LINE")
+
+# Levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING}
+OPERATION_LEVELS = (WARNING, WARNING, DEBUG, DEBUG, DEBUG, DEBUG, INFO, INFO, INFO, WARNING, WARNING)
+
+
+class EventLog:
+    """
+    Event sink writing the binary log. Records are packed into a bounded buffer, written to the disk by a writer
+    thread when full. Events under the log level return before packing anything. If the writer fails, eg. when the
+    disk is full, its exception is raised by the next emit() handing a buffer over, or by close().
+    """
+    def __init__(self, path, level=INFO, time_unit=1., buffer_size=1 << 20, max_pending_buffers=4):
+        """
+        :param path: file written
+        :param level: DEBUG logs every IO, INFO migrations and eviction rounds, WARNING anomalies only
+        :param time_unit: seconds per timestamp unit, see Trace.time_unit
+        :param buffer_size: octets buffered before handing them to the writer thread
+        :param max_pending_buffers: full buffers waiting for the writer before the simulation blocks
+        """
+        self.path = path
+        self.level = level
+        self.record_count = 0
+        self._enabled = [level <= operation_level for operation_level in OPERATION_LEVELS]
+        self._path_ids = {}
+        self._tier_names = set()
+        self._buffer_size = buffer_size
+        self._buffer = bytearray(buffer_size)
+        self._offset = 0
+
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time_unit))
+        self._pending = queue.Queue(maxsize=max_pending_buffers)
+        self._error = None  # exception that stopped the writes
+        self._writer = threading.Thread(target=self._write_buffers, daemon=True)
+        self._writer.start()
+
+    def wants(self, op):
+        return self._enabled[op]
+
+    def emit(self, op, timestamp, path=None, source=None, destination=None, size=0):
+        """
+        :param op: operation code
+        :param path: file path, interned
+        :param source: source tier, or the tier of the operation
+        :param destination: destination tier, for migrations
+        """
+        if not self._enabled[op]:
+            return
+        file_id = -1 if path is None else self._path_ids.get(path)
+        if file_id is None:
+            file_id = len(self._path_ids)
+            self._path_ids[path] = file_id
+            self._emit_string(PATH, file_id, path)
+        self._pack(op, timestamp, file_id, self._tier_index(source), self._tier_index(destination), size)
+
+    def _tier_index(self, tier):
+        if tier is None:
+            return -1
+        if tier.name not in self._tier_names:
+            self._tier_names.add(tier.name)
+            self._emit_string(TIER, tier.index, tier.name)
+        return tier.index
+
+    def _emit_string(self, op, string_id, string):
+        encoded = string.encode()
+        self._pack(op, 0., string_id, string_id, -1, len(encoded))
+        self._append(encoded)
+
+    def _pack(self, op, timestamp, file_id, source, destination, size):
+        if self._offset + _RECORD.size > self._buffer_size:
+            self._hand_over()
+        _RECORD.pack_into(self._buffer, self._offset, op, timestamp, file_id, source, destination, size)
+        self._offset += _RECORD.size
+        self.record_count += 1
+
+    def _append(self, data):
+        if self._offset + len(data) > self._buffer_size:
+            self._hand_over()
+        if len(data) > self._buffer_size:
+            self._check_writer()
+            self._pending.put(bytes(data))
+            return
+        self._buffer[self._offset:self._offset + len(data)] = data
+        self._offset += len(data)
+
+    def _hand_over(self):
+        """Gives the filled part of the buffer to the writer thread, blocking if it is late"""
+        self._check_writer()
+        if self._offset > 0:
+            self._pending.put(bytes(memoryview(self._buffer)[:self._offset]))
+            self._offset = 0
+
+    def _check_writer(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write_buffers(self):
+        while True:
+            data = self._pending.get()
+            if data is None:
+                return
+            if self._error is None:  # after a failure, buffers are still taken so that the simulation never blocks
+                try:
+                    self._file.write(data)
+                except Exception as e:
+                    self._error = e
+
+    def close(self):
+        try:
+            self._hand_over()
+        finally:
+            self._pending.put(None)
+            self._writer.join()
+            self._file.close()
+        self._check_writer()
+
+
+def read_events(path):
+    """
+    :return: the time unit of the log, and a generator of (operation name, timestamp, path, source tier name,
+    destination tier name, size) tuples
+    """
+    with open(path, "rb") as f:
+        magic, version, time_unit = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise RuntimeError(f'"{path}" is not an event log, or was written by another version of the simulator')
+
+    def events():
+        paths = {-1: None}
+        tiers = {-1: None}
+        with open(path, "rb") as f:
+            f.seek(_HEADER.size)
+            while True:
+                record = f.read(_RECORD.size)
+                if len(record) < _RECORD.size:
+                    return
+                op, timestamp, file_id, source, destination, size = _RECORD.unpack(record)
+                if op == PATH:
+                    paths[file_id] = f.read(size).decode()
+                elif op == TIER:
+                    tiers[file_id] = f.read(size).decode()
+                else:
+                    yield OPERATION_NAMES[op], timestamp, paths[file_id], tiers[source], tiers[destination], size
+    return time_unit, events()
+
+
+def to_dataframe(path):
+    """
+    :return: a pandas DataFrame of the events, with their time in seconds
+    """
+    import pandas
+    time_unit, events = read_events(path)
+    dataframe = pandas.DataFrame(events, columns=["op", "timestamp", "path", "source", "destination", "size"])
+    dataframe["time"] = dataframe["timestamp"] * time_unit
+    return dataframe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="An event log written with --event-log")
+    parser.add_argument("-f", "--format", choices=["text", "csv"], default="text")
+    parser.add_argument("--op", help="Only print these operations", nargs='+', choices=OPERATION_NAMES[2:],
+                        default=None)
+    args = parser.parse_args()
+
+    time_unit, events = read_events(args.file)
+    if args.format == "csv":
+        print("op,time,path,source,destination,size")
+    for op, timestamp, path, source, destination, size in events:
+        if args.op is not None and op not in args.op:
+            continue
+        if args.format == "csv":
+            print(f'{op},{timestamp * time_unit},{path or ""},{source or ""},{destination or ""},{size}')
+        elif op == "MIGRATION":
+            print(f'[{round(timestamp * time_unit, 3)} s] {op} {path} from {source} to {destination} ({size} octets)')
+        elif op in ["ROUND_START", "ROUND_END"]:
+            print(f'[{round(timestamp * time_unit, 3)} s] {op} on {source} ({size} octets used)')
+        else:
+            print(f'[{round(timestamp * time_unit, 3)} s] {op} {path or ""} on {source} ({size} octets)')
@@ -0,0 +1,303 @@
+"""
+Runs a whole study described in a config file, see config.cfg:
+    - [TIERS-CONFIG] gives the latency and the read and write throughputs of each tier, as
+      <tier>_tier_latency, <tier>_tier_throughput_read and <tier>_tier_throughput_write, tiers being listed from the
+      fastest to the slowest. An optional <tier>_tier_channels gives the number of IOs the tier serves at the same time,
+      the IOs in flight sharing its throughput,
+    - each [EXP*] section gives the size of each tier, as <tier>_tier_size, and the policies to evaluate on them.
+Values carry their unit: "100 us", "2.1 GB/s", "50TB". Sizes are decimal, 1 GB is 10^9 octets.
+
+Every (experiment, policy) pair is a job. The trace is parsed once, then each job runs in a forked process sharing it.
+Jobs are started as long as there are fewer of them running than the concurrency limit, and their estimated memory fits
+in the memory budget. As in __main__.py, the last tier has no policy, and finished jobs are stored in the result cache.
+
+    python experiment_engine.py -t ibm_object_store -l 1000000 -j 4 [--experiments EXP1 EXP2]
+"""
+import argparse
+import configparser
+import multiprocessing
+import os
+import re
+import time
+
+import simpy
+
+import registry
+from forked_runs import collect_run_stats, peak_rss_mb, run_forked
+from result_cache import ResultCache, run_key
+from simulation import Simulation
+from storage import Tier, StorageManager
+
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1., "min": 60., "h": 3600.}
+_SIZE_UNITS = {"B": 1, "KB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9, "TB": 10 ** 12, "PB": 10 ** 15,
+               "KiB": 2 ** 10, "MiB": 2 ** 20, "GiB": 2 ** 30, "TiB": 2 ** 40, "PiB": 2 ** 50}
+_QUANTITY = re.compile(r'^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*([^\s0-9]*)\s*$')
+# Names given to the tiers of the config file, the other ones are upper cased
+_TIER_NAMES = {"ssd": "SSD", "hdd": "HDD", "tape": "Tapes"}
+
+# Memory of a job before it was observed: the interpreter pages it touches, and each file it may hold with its
+# policy bookkeeping
+_JOB_BASE_MB = 50.
+_BYTES_PER_FILE = 1024
+
+
+def _split_quantity(text: str):
+    match = _QUANTITY.match(text)
+    if match is None:
+        raise ValueError(f'"{text}" is not a number followed by a unit')
+    return float(match.group(1)), match.group(2)
+
+
+def parse_duration(text: str):
+    """
+    :return: seconds, "100 us" -> 1e-4. Bare numbers are seconds.
+    """
+    value, unit = _split_quantity(text)
+    if unit not in _DURATION_UNITS and unit != "":
+        raise ValueError(f'Unknown duration unit in "{text}", expected one of {", ".join(_DURATION_UNITS)}')
+    return value * _DURATION_UNITS.get(unit, 1.)
+
+
+def parse_size(text: str):
+    """
+    :return: octets, "50TB" -> 5e13. Bare numbers are octets.
+    """
+    value, unit = _split_quantity(text)
+    if unit not in _SIZE_UNITS and unit != "":
+        raise ValueError(f'Unknown size unit in "{text}", expected one of {", ".join(_SIZE_UNITS)}')
+    return round(value * _SIZE_UNITS.get(unit, 1))
+
+
+def parse_throughput(text: str):
+    """
+    :return: octets/seconds, "2.1 GB/s" -> 2.1e9. Bare numbers are octets/seconds.
+    """
+    value, unit = _split_quantity(text)
+    if unit == "":
+        return value
+    if unit.count('/') != 1:
+        raise ValueError(f'Throughput "{text}" must be a size per duration, eg. "250 MB/s"')
+    size_unit, duration_unit = unit.split('/')
+    if size_unit not in _SIZE_UNITS or duration_unit not in _DURATION_UNITS:
+        raise ValueError(f'Unknown throughput unit in "{text}"')
+    return value * _SIZE_UNITS[size_unit] / _DURATION_UNITS[duration_unit]
+
+
+def load_experiments(config_file):
+    """
+    :return: list of (experiment name, tiers, policies), tiers being a list of dict of Tier parameters
+    """
+    config = configparser.ConfigParser()
+    if len(config.read(config_file)) == 0:
+        raise RuntimeError(f'Cannot read config file "{config_file}"')
+    tiers_config = config["TIERS-CONFIG"]
+    prefixes = [key[:-len("_tier_latency")] for key in tiers_config.keys() if key.endswith("_tier_latency")]
+    if len(prefixes) == 0:
+        raise RuntimeError(f'No <tier>_tier_latency in the [TIERS-CONFIG] section of "{config_file}"')
+
+    experiments = []
+    for section in [section for section in config.sections() if section.startswith("EXP")]:
+        tiers = []
+        for prefix in prefixes:
+            try:
+                tiers += [{"name": _TIER_NAMES.get(prefix, prefix.upper()),
+                           "max_size": parse_size(config[section][f'{prefix}_tier_size']),
+                           "latency": parse_duration(tiers_config[f'{prefix}_tier_latency']),
+                           "throughput": parse_throughput(tiers_config[f'{prefix}_tier_throughput_read']),
+                           "write_throughput": parse_throughput(tiers_config[f'{prefix}_tier_throughput_write']),
+                           "channels": tiers_config.getint(f'{prefix}_tier_channels', fallback=None)}]
+            except KeyError as e:
+                raise RuntimeError(f'Missing {e} for the {prefix} tier of [{section}] in "{config_file}"')
+        policies = [policy.strip() for policy in config[section]["policies"].split(',') if policy.strip() != ""]
+        for policy in policies:
+            if policy not in registry.available_policies:
+                raise RuntimeError(f'Unknown policy "{policy}" in [{section}] of "{config_file}"')
+        experiments += [(section, tiers, policies)]
+    return experiments
+
+
+def available_memory_mb():
+    """
+    :return: memory available for new processes, None if the platform cannot tell
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def run_job(trace, tiers_config, policy_name):
+    """
+    :param tiers_config: see load_experiments(), a tier may also be given a "target_occupation"
+    :return: the results of the simulation, the run stats and IO duration histograms formatted as in __main__.py, and
+    the Tier.stats() of each tier
+    """
+    env = simpy.Environment()
+    tiers = [Tier(config["name"], config["max_size"], config["latency"], config["throughput"],
+                  target_occupation=config.get("target_occupation", 0.9), write_throughput=config["write_throughput"],
+                  channels=config.get("channels"))
+             for config in tiers_config]
+    storage = StorageManager(tiers, env, time_unit=trace.time_unit)
+    for tier in tiers[:-1]:
+        registry.build_policy(policy_name, tier, storage, env, trace)
+    results = Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False).run()
+    histograms = {tier.name: {kind: histogram.to_dict() for kind, histogram in tier.latency_histograms.items()}
+                  for tier in tiers}
+    return results, collect_run_stats(tiers), histograms, {tier.name: tier.stats() for tier in tiers}
+
+
+def _job_process(trace, tiers_config, policy_name, connection):
+    """Forked process: runs a job and sends its results back"""
+    t0 = time.perf_counter()
+    results, stats, histograms, tier_stats = run_job(trace, tiers_config, policy_name)
+    connection.send({"results": results, "stats": stats, "latency_histograms": histograms, "tier_stats": tier_stats,
+                     "simulated_in": round(time.perf_counter() - t0, 3), "peak_rss_mb": peak_rss_mb()})
+    connection.close()
+
+
+class ExperimentEngine:
+    def __init__(self, trace, trace_parameters: dict, max_parallel=None, memory_budget_mb=None, cache_folder=None):
+        """
+        :param trace: parsed trace, shared by every job
+        :param trace_parameters: JSON serializable values describing how the trace was generated, part of the result
+        cache keys
+        :param max_parallel: maximum number of jobs running at the same time, the number of CPUs by default
+        :param memory_budget_mb: maximum estimated memory of the running jobs, 80% of the available memory by default.
+        A job is always started when none is running.
+        :param cache_folder: optional, folder of the result cache, see result_cache.py
+        """
+        self.trace = trace
+        self.trace_parameters = trace_parameters
+        self.max_parallel = multiprocessing.cpu_count() if max_parallel is None else max_parallel
+        if memory_budget_mb is None and available_memory_mb() is not None:
+            memory_budget_mb = 0.8 * available_memory_mb()
+        self.memory_budget_mb = memory_budget_mb
+        self.cache = None if cache_folder is None else ResultCache(cache_folder)
+        self._trace_fingerprint = trace.fingerprint() if self.cache is not None else None
+        self._file_count = getattr(trace, "unique_files", len(trace.data))
+        self._observed_mb = {}  # key: policy name, value: largest memory increase of its finished jobs
+
+    def estimate_memory_mb(self, policy_name):
+        """
+        :return: memory a job needs besides what it shares with the engine process
+        """
+        return max(_JOB_BASE_MB + self._file_count * _BYTES_PER_FILE / 2 ** 20, self._observed_mb.get(policy_name, 0))
+
+    def _key(self, tiers_config, policy_name):
+        return run_key(self._trace_fingerprint, dict(self.trace_parameters, policy=policy_name, tiers=tiers_config))
+
+    def run(self, experiments):
+        """
+        :param experiments: see load_experiments()
+        :return: dict, key: (experiment name, policy name), value: job results, see _job_process()
+        """
+        pending = []
+        finished = {}
+        for name, tiers_config, policies in experiments:
+            for policy_name in policies:
+                record = None if self.cache is None else self.cache.get(self._key(tiers_config, policy_name))
+                if record is not None:
+                    finished[(name, policy_name)] = record
+                    print(f'{name} - {policy_name}: read from the result cache')
+                else:
+                    pending += [(name, tiers_config, policy_name)]
+        if any([policy_name in ["opt", "opt-size"] for _, _, policy_name in pending]) and \
+                self.trace.next_use is None:
+            self.trace.gen_next_use_index()  # before forking, so that the jobs share it
+
+        engine_rss = peak_rss_mb()
+        estimates = {}  # key: index of a running job in pending, value: its estimated memory
+
+        def can_start(index, running):
+            estimate = self.estimate_memory_mb(pending[index][2])
+            return self.memory_budget_mb is None or \
+                sum([estimates[job] for job in running]) + estimate <= self.memory_budget_mb
+
+        def on_start(index, running):
+            estimates[index] = self.estimate_memory_mb(pending[index][2])
+            print(f'{pending[index][0]} - {pending[index][2]}: started, {round(estimates[index], 1)} Mo estimated, '
+                  f'{len(running)} jobs running')
+
+        for index, result in run_forked([(index, _job_process, (self.trace, tiers_config, policy_name))
+                                         for index, (_, tiers_config, policy_name) in enumerate(pending)],
+                                        self.max_parallel, can_start, on_start):
+            name, tiers_config, policy_name = pending[index]
+            estimates.pop(index)
+            if result is None:
+                print(f'{name} - {policy_name}: the job crashed')
+                continue
+            self._observed_mb[policy_name] = max(self._observed_mb.get(policy_name, 0),
+                                                 result["peak_rss_mb"] - engine_rss)
+            record = {"parameters": dict(self.trace_parameters, policy=policy_name, tiers=tiers_config),
+                      "storage_config": f'{name}: ' + ", ".join(
+                          [f'{config["name"]} {round(config["max_size"] / 10 ** 9, 3)} Go' for config in tiers_config]),
+                      "results": result["results"], "stats": result["stats"],
+                      "latency_histograms": result["latency_histograms"],
+                      "tier_stats": result["tier_stats"], "simulated_in": result["simulated_in"]}
+            if self.cache is not None:
+                self.cache.put(self._key(tiers_config, policy_name), record)
+            finished[(name, policy_name)] = record
+            print(f'{name} - {policy_name}: simulated in {result["simulated_in"]} s, '
+                  f'{round(result["peak_rss_mb"], 1)} Mo peak RSS')
+        return finished
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config-file", help="Config file describing the tiers and the experiments",
+                        default=os.path.join(os.path.dirname(__file__), "config.cfg"))
+    parser.add_argument("-t", "--trace", help="Trace to simulate", choices=list(registry.available_traces.keys()),
+                        default="ibm_object_store")
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default=-1, type=int)
+    parser.add_argument("-e", "--experiments", help="Sections of the config file to run, every [EXP*] by default",
+                        nargs='+', default=None)
+    parser.add_argument("-j", "--jobs", help="Maximum number of jobs running at the same time", default=None, type=int)
+    parser.add_argument("-m", "--memory-budget", help="Maximum estimated memory of the running jobs, in Mo",
+                        default=None, type=float)
+    parser.add_argument("-o", "--output-folder", help="The folder in which results will be saved",
+                        default="logs/<timestamp>", type=str)
+    parser.add_argument("--no-cache", help="Simulate every job, even those whose results are in the result cache "
+                                           "next to the output folder", action="store_true")
+    args = parser.parse_args()
+
+    experiments = load_experiments(args.config_file)
+    if args.experiments is not None:
+        unknown = set(args.experiments) - set([name for name, _, _ in experiments])
+        if len(unknown) > 0:
+            raise RuntimeError(f'Unknown experiments {", ".join(sorted(unknown))} in "{args.config_file}"')
+        experiments = [experiment for experiment in experiments if experiment[0] in args.experiments]
+
+    output_folder = args.output_folder.replace('/', os.path.sep).replace(
+        "<timestamp>", time.strftime("%a_%d_%b_%Y_%H-%M-%S", time.localtime()))
+    output_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), output_folder))
+    os.makedirs(output_folder, exist_ok=True)
+
+    trace = registry.get_trace(args.trace)
+    trace.gen_data(trace_len_limit=args.limit_trace)
+    engine = ExperimentEngine(trace, {"trace": args.trace, "limit_trace": args.limit_trace}, max_parallel=args.jobs,
+                              memory_budget_mb=args.memory_budget,
+                              cache_folder=None if args.no_cache else os.path.join(os.path.dirname(output_folder),
+                                                                                   "result_cache"))
+    print(f'{sum([len(policies) for _, _, policies in experiments])} jobs in {len(experiments)} experiments, '
+          f'{engine.max_parallel} at most at the same time'
+          + (f', within {round(engine.memory_budget_mb)} Mo' if engine.memory_budget_mb is not None else ''))
+    t0 = time.perf_counter()
+    finished = engine.run(experiments)
+
+    formatted_results = ""
+    for name, _, policies in experiments:
+        for policy_name in policies:
+            if (name, policy_name) not in finished:
+                continue
+            record = finished[(name, policy_name)]
+            formatted_results += f'{"#" * 10} {name} - {policy_name} {"#" * 10}\n{record["results"]}\n'
+    with open(os.path.join(output_folder, "formatted_results.txt"), "w") as f:
+        f.write(formatted_results)
+    with open(os.path.join(output_folder, "experiments.json"), "w") as f:
+        json.dump({f'{name} - {policy_name}': record for (name, policy_name), record in finished.items()}, f)
+    print(f'{len(finished)} jobs done in {round(time.perf_counter() - t0, 3)} s'
+          + (f', {engine.cache.hits} read from the result cache' if engine.cache is not None else '')
+          + f'. Results saved in "{output_folder}"')
@@ -0,0 +1,71 @@
+"""
+Simulations run in forked processes, sharing what the parent already built (parsed trace, next use index, warmed
+tiers) copy-on-write. Each process sends its results back through a pipe. Used by the what-if runs, the experiment
+engine, the sharded simulations and the benchmarks.
+"""
+import multiprocessing
+import multiprocessing.connection
+import resource
+import sys
+
+
+def peak_rss_mb():
+    maximum = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximum / 2 ** 20 if sys.platform == "darwin" else maximum / 2 ** 10  # octets on macOS, Ko on Linux
+
+
+def collect_run_stats(tiers):
+    """
+    :return: list of [stat name, value] of each tier, as recorded in the results of __main__.py and plotted
+    """
+    stats = []
+    for tier in tiers:
+        for stat_name, stat_value in [("Nombre d'io", tier.number_of_reads + tier.number_of_write),
+                                      ("Nombre d'io de migration", tier.number_of_prefetching_from_this_tier
+                                                                   + tier.number_of_prefetching_to_this_tier
+                                                                   + tier.number_of_eviction_from_this_tier
+                                                                   + tier.number_of_eviction_to_this_tier),
+                                      ("Time spent reading", round(tier.time_spent_reading, 3)),
+                                      ("Time spent writing", round(tier.time_spent_writing, 3))]:
+            stats += [[f'{tier.name} - {stat_name}', stat_value]]
+    return stats
+
+
+def run_forked(jobs, max_parallel=None, can_start=None, on_start=None):
+    """
+    Runs the jobs in forked processes, in their order, at most max_parallel at the same time.
+    :param jobs: list of (key, target, args). target(*args, connection) runs in the forked process, and sends its
+    results with connection.send()
+    :param max_parallel: the number of CPUs by default
+    :param can_start: optional, can_start(key, keys of the running jobs) tells whether the next job can start while
+    others run, eg. within a memory budget. A job always starts when none is running.
+    :param on_start: optional, on_start(key, keys of the running jobs) is called once a job started
+    :return: generator of (key, results, or None if the process crashed), in completion order. Jobs are only started
+    between two results, so that the caller can update what can_start relies on.
+    """
+    max_parallel = multiprocessing.cpu_count() if max_parallel is None else max_parallel
+    context = multiprocessing.get_context("fork")
+    pending = list(jobs)
+    running = {}  # key: receiving end of the pipe, value: (job key, process)
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < max_parallel:
+            key, target, args = pending[0]
+            if len(running) > 0 and can_start is not None and \
+                    not can_start(key, [job_key for job_key, _ in running.values()]):
+                break
+            pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=target, args=tuple(args) + (sender,))
+            process.start()
+            sender.close()
+            running[receiver] = (key, process)
+            if on_start is not None:
+                on_start(key, [job_key for job_key, _ in running.values()])
+        for receiver in multiprocessing.connection.wait(list(running.keys())):
+            key, process = running.pop(receiver)
+            try:
+                results = receiver.recv()
+            except EOFError:
+                results = None
+            process.join()
+            yield key, results
@@ -0,0 +1,115 @@
+from array import array
+from math import frexp, ldexp
+
+
+class LogHistogram:
+    """
+    HDR-style histogram of positive values: each power of two is split in 2**sub_bucket_bits linear sub-buckets, which
+    bounds the relative error of the reported values to 2**-sub_bucket_bits whatever their magnitude.
+
+    Counts live in a preallocated integer array, recording a value is O(1). Histograms with the same layout can be
+    merged, eg. to aggregate parallel runs.
+    """
+    def __init__(self, sub_bucket_bits=4, min_exponent=-30, max_exponent=20):
+        """
+        :param sub_bucket_bits: the relative resolution is 2**-sub_bucket_bits
+        :param min_exponent: values below 2**(min_exponent-1) are counted in the lowest bucket (~1e-9 by default)
+        :param max_exponent: values above 2**max_exponent are counted in the highest bucket (~1e6 by default)
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.min_exponent = min_exponent
+        self.max_exponent = max_exponent
+        self.sub_buckets = 1 << sub_bucket_bits
+        # bucket 0 counts zeros, the others cover [2**(e-1), 2**e[ in sub_buckets steps for each exponent e
+        self.counts = array('q', [0]) * ((max_exponent - min_exponent + 1) * self.sub_buckets + 1)
+        self.total_count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def _index(self, value):
+        if value <= 0:
+            return 0
+        mantissa, exponent = frexp(value)  # value = mantissa * 2**exponent, mantissa in [0.5, 1[
+        if exponent < self.min_exponent:
+            return 1
+        if exponent > self.max_exponent:
+            return len(self.counts) - 1
+        return (exponent - self.min_exponent) * self.sub_buckets + int((mantissa * 2 - 1) * self.sub_buckets) + 1
+
+    def bucket_bounds(self, index):
+        """
+        :return: the lower and upper bounds of the values counted in a bucket
+        """
+        if index == 0:
+            return 0., 0.
+        exponent, sub_bucket = divmod(index - 1, self.sub_buckets)
+        exponent += self.min_exponent
+        return ldexp(0.5 + sub_bucket / (2 * self.sub_buckets), exponent), \
+            ldexp(0.5 + (sub_bucket + 1) / (2 * self.sub_buckets), exponent)
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.total_count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        :param percent: in [0, 100]
+        :return: the middle of the bucket holding the percentile, 0 if the histogram is empty
+        """
+        if self.total_count == 0:
+            return 0.
+        rank = percent / 100 * self.total_count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= rank:
+                lower, upper = self.bucket_bounds(index)
+                return min((lower + upper) / 2, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / max(1, self.total_count)
+
+    def merge(self, other: "LogHistogram"):
+        assert (self.sub_bucket_bits, self.min_exponent, self.max_exponent) == \
+               (other.sub_bucket_bits, other.min_exponent, other.max_exponent), "Histogram layouts differ"
+        for index, count in enumerate(other.counts):
+            if count > 0:
+                self.counts[index] += count
+        self.total_count += other.total_count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def __iadd__(self, other: "LogHistogram"):
+        return self.merge(other)
+
+    def buckets(self):
+        """
+        :return: (lower bound, upper bound, count) of the non empty buckets, for plotting
+        """
+        return [(*self.bucket_bounds(index), count) for index, count in enumerate(self.counts) if count > 0]
+
+    def to_dict(self):
+        """
+        :return: a JSON serializable export, sparse counts only
+        """
+        return {"sub_bucket_bits": self.sub_bucket_bits,
+                "min_exponent": self.min_exponent,
+                "max_exponent": self.max_exponent,
+                "counts": {index: count for index, count in enumerate(self.counts) if count > 0},
+                "total": self.total,
+                "max": self.max}
+
+    @staticmethod
+    def from_dict(exported: dict):
+        histogram = LogHistogram(exported["sub_bucket_bits"], exported["min_exponent"], exported["max_exponent"])
+        for index, count in exported["counts"].items():
+            histogram.counts[int(index)] = count
+            histogram.total_count += count
+        histogram.total = exported["total"]
+        histogram.max = exported["max"]
+        return histogram
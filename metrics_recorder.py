@@ -0,0 +1,119 @@
+import numpy as np
+from simpy.core import Environment
+from storage import StorageManager
+
+
+class TimeSeriesRecorder:
+    """
+    Samples the state of every tier at a fixed simulated time interval, to observe what end of run totals hide:
+    migration storms, occupancy sawtooth patterns...
+
+    Samples are written in preallocated numpy columns, one per (tier, metric), doubled in size when full. A sample only
+    copies a few counters per tier, so recording every simulated minute costs nothing noticeable compared to the
+    simulation itself.
+    """
+    METRICS = {"used_size": lambda tier: tier.used_size,
+               "file_count": lambda tier: len(tier.content),
+               "reads": lambda tier: tier.number_of_reads,
+               "writes": lambda tier: tier.number_of_write,
+               "evictions_from": lambda tier: tier.number_of_eviction_from_this_tier,
+               "evictions_to": lambda tier: tier.number_of_eviction_to_this_tier,
+               "prefetchings_from": lambda tier: tier.number_of_prefetching_from_this_tier,
+               "prefetchings_to": lambda tier: tier.number_of_prefetching_to_this_tier}
+
+    def __init__(self, storage: StorageManager, env: Environment, interval: float, time_unit: float = 1.,
+                 expected_samples: int = 1024):
+        """
+        :param interval: seconds of simulated time between two samples
+        :param time_unit: seconds per simulation time unit, see Trace.time_unit
+        :param expected_samples: initial capacity of the columns
+        """
+        self._storage = storage
+        self._env = env
+        self.interval = interval
+        self.time_unit = time_unit
+        self.sample_count = 0
+        self._capacity = max(1, expected_samples)
+        self._time = np.zeros(self._capacity, dtype=np.float64)
+        self._columns = {(tier.name, metric): np.zeros(self._capacity, dtype=np.int64)
+                         for tier in storage.tiers for metric in TimeSeriesRecorder.METRICS.keys()}
+        # Flat list of (column, tier, getter), so that a sample does not look anything up
+        self._samplers = [(self._columns[(tier.name, metric)], tier, getter)
+                          for tier in storage.tiers for metric, getter in TimeSeriesRecorder.METRICS.items()]
+
+    def start(self):
+        """Starts sampling, from the current simulation time"""
+        self._env.process(self._sampling_process())
+
+    def _sampling_process(self):
+        timeout = self.interval / self.time_unit
+        while True:
+            self.sample()
+            yield self._env.timeout(timeout)
+
+    def _grow(self):
+        self._capacity *= 2
+        self._time = np.resize(self._time, self._capacity)
+        for key, column in self._columns.items():
+            self._columns[key] = np.resize(column, self._capacity)
+        self._samplers = [(self._columns[(tier.name, metric)], tier, getter)
+                          for tier in self._storage.tiers for metric, getter in TimeSeriesRecorder.METRICS.items()]
+
+    def sample(self):
+        """Records the current state of the tiers. Called by the sampling process, and can be called at the end of a
+        run to record the final state."""
+        if self.sample_count == self._capacity:
+            self._grow()
+        row = self.sample_count
+        self._time[row] = self._env.now * self.time_unit
+        for column, tier, getter in self._samplers:
+            column[row] = getter(tier)
+        self.sample_count += 1
+
+    def columns(self):
+        """
+        :return: the recorded samples, key: "time" (seconds) or "<tier name>.<metric>", value: numpy array
+        """
+        columns = {"time": self._time[:self.sample_count]}
+        for (tier_name, metric), column in self._columns.items():
+            columns[f'{tier_name}.{metric}'] = column[:self.sample_count]
+        return columns
+
+    def flush(self, path_without_extension):
+        """
+        Writes the samples as a Parquet file if pyarrow is installed, as a .npz archive of columns otherwise.
+        :return: the path of the written file
+        """
+        columns = self.columns()
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            path = f'{path_without_extension}.npz'
+            np.savez(path, **columns)
+            return path
+        path = f'{path_without_extension}.parquet'
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+        return path
+
+
+if __name__ == "__main__":
+    # Prints a summary of a recorded time series
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="A .npz or .parquet file written by TimeSeriesRecorder.flush()")
+    args = parser.parse_args()
+
+    if args.file.endswith(".parquet"):
+        import pyarrow.parquet
+        columns = {name: np.asarray(values) for name, values in pyarrow.parquet.read_table(args.file).to_pydict().items()}
+    else:
+        columns = dict(np.load(args.file))
+    time = columns.pop("time")
+    print(f'{len(time)} samples from {time[0] if len(time) else 0} s to {time[-1] if len(time) else 0} s')
+    for name, column in columns.items():
+        if len(column) > 1:
+            steps = np.diff(column)
+            print(f'    >> {name}: last {column[-1]}, max {column.max()}, largest step {steps.max()} '
+                  f'(at {time[1 + steps.argmax()]} s)')
@@ -6,10 +6,34 @@ from collections import OrderedDict
 
 
 class LifetimeOverrunPolicy(Policy):
-    def __init__(self, tier: Tier, storage: StorageManager, env: Environment, prediction_model):
+    def __init__(self, tier: Tier, storage: StorageManager, env: Environment, prediction_model,
+                 direct_placement_lifetime: float = None, evaluate_as_inactive_after: float = 7 * 24 * 3600):
+        """
+        :param prediction_model: maps a path to its predicted lifetime, or to None when it has no prediction yet. If it
+        is not a dictionary and has an update(path, lifetime) method, it is fed with the lifetimes observed when files
+        are deleted or detected as inactive.
+        :param direct_placement_lifetime: if set and if this policy manages the default tier, new files whose
+        predicted lifetime is lower or equal are directly created on the next tier, as they are not expected to be
+        reused.
+        :param evaluate_as_inactive_after: simulation time without access after which a file lifetime is considered
+        over, for online prediction models
+        """
         Policy.__init__(self, tier, storage, env)
         self.lru_file_dict = OrderedDict()
-        self.prediction_model = prediction_model  # is a dictonary
+        self.prediction_model = prediction_model  # is a dictonary, or an online model such as PrefixTriePredictor
+        self.learns_online = not isinstance(prediction_model, dict) and hasattr(prediction_model, "update")
+        self.evaluate_as_inactive_after = evaluate_as_inactive_after
+        self.reported_as_inactive = set()
+        self.direct_placement_lifetime = direct_placement_lifetime
+        if direct_placement_lifetime is not None and tier == storage.get_default_tier() \
+                and storage.tiers.index(tier) + 1 < len(storage.tiers):
+            storage.register_placement_policy(self)
+
+    def choose_initial_tier(self, path: str, size: int, user: str):
+        prediction = self.prediction_model[path]
+        if prediction is not None and prediction <= self.direct_placement_lifetime:
+            return self.storage.tiers[self.storage.tiers.index(self.tier) + 1]
+        return None
 
     def on_file_created(self, file: File):
         self.lru_file_dict[file.path] = file.path
@@ -18,6 +42,10 @@ class LifetimeOverrunPolicy(Policy):
         if file.path in self.lru_file_dict:  # else we don't need to do anything since it's already not there
             self.lru_file_dict.move_to_end(file.path)
             self.lru_file_dict.popitem()
+        reported_as_inactive = file.path in self.reported_as_inactive
+        self.reported_as_inactive.discard(file.path)  # also when the file leaves the tier by a migration
+        if self.learns_online and self.storage.ongoing_migrations == 0 and not reported_as_inactive:
+            self.prediction_model.update(file.path, self.env.now - file.creation_time)  # the file lifetime is over
 
     def on_file_access(self, file: File, is_write: bool):
         if file.path not in self.lru_file_dict:  # else we don't need to do anything since it's already not there
@@ -37,7 +65,14 @@ class LifetimeOverrunPolicy(Policy):
             expired_files = OrderedDict()
             # print("Listing files with expired lifetime... ", end='')
             for file in self.tier.content.values():
-                remaining_lt = self.env.now - file.creation_time - self.prediction_model[file.path]
+                if self.learns_online and self.env.now - file.last_access > self.evaluate_as_inactive_after \
+                        and file.path not in self.reported_as_inactive:
+                    self.prediction_model.update(file.path, file.last_access - file.creation_time)
+                    self.reported_as_inactive.add(file.path)
+                prediction = self.prediction_model[file.path]
+                if prediction is None:  # no prediction yet: left to the LRU eviction
+                    continue
+                remaining_lt = self.env.now - file.creation_time - prediction
                 # TODO: create new file without LRU
                 lifetime_only = True
                 if lifetime_only or remaining_lt > 0:
@@ -2,6 +2,7 @@ from policies.policy import Policy
 from storage import StorageManager, File, Tier
 from simpy.core import Environment
 from collections import OrderedDict
+import sys
 
 
 _DEBUG = False
@@ -39,6 +40,13 @@ class LRUPolicy(Policy):
         else:
             self.lru_file_dict.move_to_end(file.path) # moves it at the end
 
+    def memory_footprint(self):
+        """
+        :return: size in octets of the structures of this policy, not counting the path strings that are shared with
+        the tier content
+        """
+        return sys.getsizeof(self.lru_file_dict)
+
     def on_tier_nearly_full(self):
         target_tier_id = self.storage.tiers.index(self.tier)+1 # iterating to the next tier
         if target_tier_id < len(self.storage.tiers): # checking this next tier do exist
@@ -0,0 +1,166 @@
+from policies.policy import Policy
+from storage import StorageManager, File, Tier
+from simpy.core import Environment
+from traces.trace import Trace
+
+
+class IndexedMaxHeap:
+    """
+    Binary max-heap whose entries can be updated or removed by key in O(log n), thanks to a key -> position index.
+    """
+    def __init__(self):
+        self.keys = []
+        self.priorities = []
+        self.positions = {}  # key -> index in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def push(self, key, priority):
+        if key in self.positions:
+            self.update(key, priority)
+            return
+        self.keys.append(key)
+        self.priorities.append(priority)
+        self.positions[key] = len(self.keys) - 1
+        self._sift_up(len(self.keys) - 1)
+
+    def update(self, key, priority):
+        i = self.positions[key]
+        old_priority = self.priorities[i]
+        self.priorities[i] = priority
+        if priority > old_priority:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, key):
+        i = self.positions.pop(key)
+        last_key = self.keys.pop()
+        last_priority = self.priorities.pop()
+        if i < len(self.keys):
+            self.keys[i] = last_key
+            self.priorities[i] = last_priority
+            self.positions[last_key] = i
+            self._sift_up(i)
+            self._sift_down(self.positions[last_key])
+
+    def peek_max(self):
+        """
+        :return: (key, priority) of the highest priority
+        """
+        return self.keys[0], self.priorities[0]
+
+    def pop_max(self):
+        """
+        :return: the key with the highest priority, removed from the heap
+        """
+        key = self.keys[0]
+        self.remove(key)
+        return key
+
+    def _swap(self, i, j):
+        self.keys[i], self.keys[j] = self.keys[j], self.keys[i]
+        self.priorities[i], self.priorities[j] = self.priorities[j], self.priorities[i]
+        self.positions[self.keys[i]] = i
+        self.positions[self.keys[j]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) >> 1
+            if self.priorities[i] <= self.priorities[parent]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        size = len(self.keys)
+        while True:
+            largest = i
+            left, right = 2 * i + 1, 2 * i + 2
+            if left < size and self.priorities[left] > self.priorities[largest]:
+                largest = left
+            if right < size and self.priorities[right] > self.priorities[largest]:
+                largest = right
+            if largest == i:
+                break
+            self._swap(i, largest)
+            i = largest
+
+
+class OPTPolicy(Policy):
+    """
+    Offline-optimal (Belady) baseline: since the whole trace is known before the simulation, we evict the resident file
+    whose next access is the furthest in the future. It gives the ceiling the online policies can be compared to.
+
+    Next uses are given by Trace.gen_next_use_index(), computed once per trace, and kept in an indexed max-heap.
+    """
+    def __init__(self, tier: Tier, storage: StorageManager, env: Environment, trace: Trace):
+        Policy.__init__(self, tier, storage, env)
+        self.trace = trace
+        if trace.next_use is None:
+            trace.gen_next_use_index()
+        self.heap = IndexedMaxHeap()
+
+    def priority(self, file: File):
+        """
+        :return: the eviction priority of a file, the highest being evicted first
+        """
+        return self.trace.next_use_of(file.path)
+
+    def pop_eviction_candidate(self):
+        """
+        :return: the path of the file to evict, removed from the heap
+        """
+        return self.heap.pop_max()
+
+    def on_file_created(self, file: File):
+        self.heap.push(file.path, self.priority(file))
+
+    def on_file_deleted(self, file: File):
+        if file.path in self.heap:  # else it was already popped for eviction
+            self.heap.remove(file.path)
+
+    def on_file_access(self, file: File, is_write: bool):
+        if file.path in self.heap:  # else it was already popped for eviction
+            self.heap.update(file.path, self.priority(file))
+
+    def on_tier_nearly_full(self):
+        target_tier_id = self.storage.tiers.index(self.tier)+1  # iterating to the next tier
+        if target_tier_id < len(self.storage.tiers):  # checking this next tier do exist
+            while self.tier.used_size > self.tier.max_size * (self.tier.target_occupation - 0.15):
+                if len(self.heap) == 0:
+                    break
+                self.storage.migrate(self.tier.content[self.pop_eviction_candidate()],
+                                     self.storage.tiers[target_tier_id], self.env.now)  # migrating
+        else:
+            print(f'Tier {self.tier.name} is nearly full, but there is no other tier to discharge load.')
+
+
+class SizeAwareOPTPolicy(OPTPolicy):
+    """
+    Size-aware variant of the OPT baseline: we evict the file with the highest size * distance to its next use, so that
+    one big file reused late is evicted before several small ones. Files never reused have an infinite priority, and
+    are always evicted first.
+
+    Priorities are computed against the cursor of the trace when the file is created or accessed, and only decrease as
+    the cursor advances: the stored ones are upper bounds of the current ones. When evicting, the top of the heap is
+    re-keyed against the current cursor until it still ranks first, which gives the same choice as refreshing every
+    priority, with the heap operations kept in O(log n).
+    """
+    def priority(self, file: File):
+        next_use = self.trace.next_use_of(file.path)
+        if next_use == len(self.trace.data):
+            return float("inf")
+        return (next_use - self.trace.cursor) * max(1, file.size)
+
+    def pop_eviction_candidate(self):
+        while True:
+            path, stored_priority = self.heap.peek_max()
+            priority = self.priority(self.tier.content[path])
+            if priority == stored_priority:
+                return self.heap.pop_max()
+            self.heap.update(path, priority)
@@ -3,6 +3,11 @@ from simpy.core import Environment
 
 
 class Policy:
+    checkpointable = True  # see export_state(). Runs with policies that are not cannot be checkpointed nor resumed
+    # Attributes left out of export_state(): links to the simulation, given again to the constructor on restore
+    _NOT_EXPORTED = ("tier", "storage", "env", "prediction_model", "trace",
+                     "on_file_created", "on_file_deleted", "on_file_access", "on_tier_nearly_full")  # profiled hooks
+
     def __init__(self, tier: Tier, storage: StorageManager, env: Environment):
         """
         :param storage:
@@ -24,3 +29,28 @@ class Policy:
 
     def on_tier_nearly_full(self):
         pass
+
+    def on_simulation_end(self):
+        """Called once when the simulation finished, eg. to stop the background workers of the policy"""
+        pass
+
+    def choose_initial_tier(self, path: str, size: int, user: str):
+        """
+        Only called if the policy was registered with StorageManager.register_placement_policy().
+        :return: the tier on which a new file must be created, or None to let the next placement policies decide
+        """
+        return None
+
+    def export_state(self):
+        """
+        :return: the picklable internal state of the policy, see checkpoint.py. By default, every attribute but the
+        ones listed in _NOT_EXPORTED. Policies holding unpicklable objects must override it.
+        """
+        return {name: value for name, value in self.__dict__.items() if name not in self._NOT_EXPORTED}
+
+    def import_state(self, state: dict):
+        """
+        Restores a state returned by export_state(), on a policy newly built with the same parameters and on the same
+        tier.
+        """
+        self.__dict__.update(state)
@@ -0,0 +1,87 @@
+from policies.policy import Policy
+from storage import StorageManager, File, Tier
+from simpy.core import Environment
+
+
+class PromotionPolicy(Policy):
+    """
+    Tracks user accesses on a lower tier, and proposes the files that became hot for a promotion back to the default
+    tier. Promotions themselves are done by StorageManager.drain_promotion_queue(), under a byte budget per interval.
+    To be registered on each lower tier, alongside its eviction policy. StorageManager.start_promotions() must be called.
+
+    The heat of a file is an access counter decaying exponentially with the given half-life. Hysteresis prevents
+    promotion ping-pong:
+        - A file is queued once its heat reaches promote_threshold, but is only promoted if its heat is still above
+          keep_threshold when the queue is drained.
+        - Each time a promoted file is evicted again from the default tier, the heat it needs to be queued doubles.
+
+    The policy also listens to the default tier, to account for the read time saved by reading promoted files there.
+    """
+    _NOT_EXPORTED = Policy._NOT_EXPORTED + ("default_tier",)
+
+    def __init__(self, tier: Tier, storage: StorageManager, env: Environment, promote_threshold: float = 3.,
+                 keep_threshold: float = 1.5, half_life: float = 3600.):
+        """
+        :param promote_threshold: heat at which a file is queued for promotion
+        :param keep_threshold: heat under which a queued file is dropped from the promotion queue
+        :param half_life: simulation time after which the heat of a file not accessed is halved
+        """
+        Policy.__init__(self, tier, storage, env)
+        self.default_tier = storage.get_default_tier()
+        assert self.default_tier != tier
+        self.default_tier.register_listener(self)
+        self.promote_threshold = promote_threshold
+        self.keep_threshold = keep_threshold
+        self.half_life = half_life
+        self.heat = {}  # key: path of a file of self.tier accessed by users, value: [heat, time of the last update]
+        self.promoted = set()  # paths of the files promoted from self.tier and still on the default tier
+        self.bounces = {}  # key: path, value: number of times the file was evicted again after a promotion
+
+    def _current_heat(self, path):
+        heat, last_update = self.heat[path]
+        return heat * 0.5 ** ((self.env.now - last_update) / self.half_life)
+
+    def is_still_hot(self, path):
+        return path in self.heat and self._current_heat(path) >= self.keep_threshold
+
+    def on_file_promoted(self, file: File):
+        """Called by the storage manager once the file was migrated to the default tier"""
+        self.promoted.add(file.path)
+
+    def on_file_created(self, file: File):
+        pass
+
+    def on_file_deleted(self, file: File):
+        if file.tier == self.tier:
+            self.heat.pop(file.path, None)
+        elif file.path in self.promoted:
+            self.promoted.remove(file.path)
+            if self.storage.ongoing_migrations > 0:  # evicted again
+                self.bounces[file.path] = self.bounces.get(file.path, 0) + 1
+                self.storage.promotion_stats["evicted_again"] += 1
+            else:
+                self.bounces.pop(file.path, None)
+
+    def on_file_access(self, file: File, is_write: bool):
+        if self.storage.ongoing_migrations > 0:
+            return
+        if file.tier == self.tier:
+            if file.path in self.heat:
+                heat = self._current_heat(file.path) + 1
+            else:
+                heat = 1.
+            self.heat[file.path] = [heat, self.env.now]
+            if heat >= self.promote_threshold * 2 ** self.bounces.get(file.path, 0) and \
+                    file.path not in self.storage.promotion_queue:
+                if file.size > self.storage.promotion_size_limit():  # would never fit in a drain
+                    self.storage.promotion_stats["larger_than_budget"] += 1
+                else:
+                    self.storage.promotion_queue[file.path] = self
+                    self.storage.promotion_stats["candidates"] += 1
+        elif file.path in self.promoted and not is_write:
+            self.storage.promotion_stats["saved_read_time"] += \
+                self.tier.latency + file.size / self.tier.throughput - \
+                (file.tier.latency + file.size / file.tier.throughput)
+
+    def on_tier_nearly_full(self):
+        pass  # eviction is left to the other policy of the tier
@@ -27,7 +27,6 @@ class RandomPolicy(Policy):
                 choice = random.choice(self.rand_list)
                 self.rand_list.remove(choice)
                 if choice in self.tier.content.keys():
-                    # TODO: FIX ME
-                    self.storage.migrate(self.tier.content[random.choice(self.rand_list)], self.storage.tiers[target_tier_id], self.env.now) # migrating
+                    self.storage.migrate(self.tier.content[choice], self.storage.tiers[target_tier_id], self.env.now) # migrating
         else:
             print(f'Tier {self.tier.name} is nearly full, but there is no other tier to discharge load.')
\ No newline at end of file
@@ -2,6 +2,9 @@ from policies.policy import Policy
 from storage import StorageManager, File, Tier
 from simpy.core import Environment
 from reinforcement_learning.ddgd import DDGD
+from reinforcement_learning.actor_critics import ExampleActor, ExampleCritic
+from reinforcement_learning.inference_queue import InferenceQueue
+from reinforcement_learning.async_learner import AsyncLearner, train
 import math
 
 import reinforcement_learning.utils as utils
@@ -62,6 +65,8 @@ class DDGD_LRU_LO_Policy(Policy):
     Improvements done:
         - When a file is inactive, we use its last access - that is more accurate - instead of its predicted
           lifetime for file removal.
+        - Lifetime predictions are batched: files created within the same time window are predicted in a single
+          forward pass, flushed before any decision relying on them.
 
     TODO:
         - We could update the lifetime prediction daily. We would then be able to add last_access-creation_time,
@@ -73,34 +78,66 @@ class DDGD_LRU_LO_Policy(Policy):
           multiple times. Same for file deletion / file migration.
         - Create a good ol' DQN version
     """
+    checkpointable = False  # the agent, its learner thread and the evaluation process cannot be exported
+
     def __init__(self, tier: Tier, storage: StorageManager, env: Environment, evaluation_period=60*60*24,
-                 evaluate_as_inactive_after=7*24*3600):
+                 evaluate_as_inactive_after=7*24*3600, max_inference_batch_size=4096, max_prediction_staleness=0.,
+                 learner_mode=None, prioritized_replay=False, hidden_size=256):
+        """
+        :param max_inference_batch_size: maximum number of lifetimes predicted in a single forward pass
+        :param max_prediction_staleness: maximum simulation time a created file can wait for its lifetime prediction
+        :param learner_mode: None to train the agent inline, in the evaluation process. "deterministic" or
+        "free-running" to train it in a background thread, see AsyncLearner. Weights are refreshed every
+        evaluation_period.
+        :param prioritized_replay: see DDGD
+        :param hidden_size: width of the hidden layers of the actor and the critic
+        """
         # LRU Policy
         Policy.__init__(self, tier, storage, env)
         self.lru_file_list = list()
 
         # LO Policy
-        self.regression_agent = DDGD("actor", "actor_target", "critic", "critic_target")
+        # The state is the encoded path, the action the predicted lifetime
+        state_size = utils.STR2TENSOR_OUTPUT_SIZE
+        self.regression_agent = DDGD(ExampleActor(state_size, hidden_size, 1), ExampleActor(state_size, hidden_size, 1),
+                                     ExampleCritic(state_size + 1, hidden_size, 1),
+                                     ExampleCritic(state_size + 1, hidden_size, 1),
+                                     prioritized_replay=prioritized_replay)
+        self.inference_queue = InferenceQueue(self.regression_agent, max_inference_batch_size,
+                                              max_prediction_staleness)
+        if learner_mode is None:
+            self.learner = None
+        else:
+            self.learner = AsyncLearner(self.regression_agent, deterministic=learner_mode == "deterministic")
         self.prediction_data = {}  # we add the files that are awaiting evaluation here
         self.next_batch_size = 0  # we update the model once every time a file is added to the history.
         if evaluate_as_inactive_after > 0 and evaluation_period > 0:
-            self.evaluation = env.process(self, self.daily_process(evaluation_period, evaluate_as_inactive_after))
+            self.evaluation = env.process(self.daily_process(evaluation_period, evaluate_as_inactive_after))
+
+    def remember(self, state, action, reward):
+        """Adds a lifetime feedback to the replay memory of the agent"""
+        if self.learner is None:
+            self.regression_agent.memory.push(state=state, action=action, reward=reward, next_state=None, done=True)
+        else:
+            self.learner.push(state=state, action=action, reward=reward, next_state=None, done=True)
+        self.next_batch_size += 1
 
     def daily_process(self, period=60 * 60 * 24, evaluate_as_inactive_after=7 * 24 * 3600):
         while True:
+            self.inference_queue.flush()
+
             # Updating agent
-            self.regression_agent.update(self.next_batch_size)
+            if self.learner is None:
+                train(self.regression_agent, self.next_batch_size)
+            else:
+                self.learner.sync(self.next_batch_size)
             self.next_batch_size = 0
 
             # Evaluation
             for file, data in self.prediction_data.items():
                 if file.last_access + evaluate_as_inactive_after > self.env.now:
-                    self.regression_agent.memory.push(state=data["state"],
-                                                      action=data["prediction"],
-                                                      reward=reward(data["prediction"],
-                                                                    self.env.now - file.creation_time),
-                                                      next_state=None, done=True)
-                    self.next_batch_size += 1
+                    self.remember(data["state"], data["prediction"],
+                                  reward(data["prediction"], self.env.now - file.creation_time))
                     data["inactive_since"] = file.last_access
                 else:
                     data["inactive_since"] = None
@@ -114,9 +151,11 @@ class DDGD_LRU_LO_Policy(Policy):
         state = utils.str2array(file.path)
 
         # LO Policy
-        self.prediction_data[file] = {"prediction":self.regression_agent.get_action(state),  # dict slower but readable
-                                      "state": utils.str2array(file.path),
-                                      "inactive_since":None}
+        data = {"prediction": None,  # dict slower but readable, prediction is set once the inference batch is run
+                "state": state,
+                "inactive_since": None}
+        self.prediction_data[file] = data
+        self.inference_queue.push(data, state, self.env.now)
 
     def on_file_deleted(self, file: File):
         # LRU Policy
@@ -125,19 +164,21 @@ class DDGD_LRU_LO_Policy(Policy):
         # LO Policy
         # FIXME We lose tracking on migrated files?
         data = self.prediction_data.pop(file)
-        self.regression_agent.memory.push(state=data["state"],
-                                          action=data["prediction"],
-                                          reward=reward(data["prediction"],
-                                                        self.env.now - file.creation_time),
-                                          next_state=None, done=True)
-        self.next_batch_size += 1
+        if data["prediction"] is None:
+            self.inference_queue.flush()
+        self.remember(data["state"], data["prediction"], reward(data["prediction"], self.env.now - file.creation_time))
 
     def on_file_access(self, file: File, is_write: bool):
         # LRU Policy
         self.lru_file_list.remove(file)
         self.lru_file_list += [file]
 
+    def on_simulation_end(self):
+        if self.learner is not None:
+            self.learner.close()
+
     def on_tier_nearly_full(self):
+        self.inference_queue.flush()
         target_tier_id = self.storage.tiers.index(self.tier)+1  # iterating to the next tier
         self.prediction_data = dict(sorted(self.prediction_data.items(), # sorting predicted lifetimes
                                            key=lambda item: item[0].creation_time+
@@ -147,14 +188,15 @@ class DDGD_LRU_LO_Policy(Policy):
         if target_tier_id < len(self.storage.tiers):  # checking if the next tier do exist
             while self.tier.used_size > self.tier.max_size * self.tier.target_occupation:
                 # LO Policy
-                if len(self.prediction_data.keys()>0):
-                    file, data = list(self.prediction_data.items())[0]
-                    if file.creation_time + data["lifetime"] < self.env.now:
-                        self.storage.migrate(file, self.storage.tiers[target_tier_id])
+                if len(self.prediction_data) > 0:
+                    file, data = next(iter(self.prediction_data.items()))
+                    lifetime = data["prediction"] if data["inactive_since"] is None else data["inactive_since"]
+                    if file.creation_time + lifetime < self.env.now:
+                        self.storage.migrate(file, self.storage.tiers[target_tier_id], self.env.now)
                         continue
 
                 # When the LO Policy is not applicable (all files alive), LRU Policy is applied
-                self.storage.migrate(self.lru_file_list[0], self.storage.tiers[target_tier_id])
+                self.storage.migrate(self.lru_file_list[0], self.storage.tiers[target_tier_id], self.env.now)
 
                 # In both policies, file will be removed from the FIFO list in the 'delete' event during migration
         else:
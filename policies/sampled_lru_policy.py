@@ -0,0 +1,140 @@
+from policies.policy import Policy
+from storage import StorageManager, File, Tier
+from simpy.core import Environment
+import random
+import sys
+
+
+class SampledLRUPolicy(Policy):
+    """
+    Approximated LRU, in the fashion of the Redis eviction: instead of keeping every resident file in a recency ordered
+    structure, we sample a few resident files at eviction time and migrate the one accessed the least recently.
+
+    The recency of a file is its `last_access` metadata, that is already kept up to date by the tier. The only
+    per-file structure of this policy is thus a flat list of paths (one pointer per resident file) used for random
+    sampling, instead of the ~100 octets per entry of the OrderedDict used by LRUPolicy. Accesses cost nothing.
+
+    Entries of files that left the tier (deleted or migrated) are not removed right away: they are dropped when they
+    are sampled, and the whole list is rebuilt from the tier content when it gets too much stale entries.
+    """
+    def __init__(self, tier: Tier, storage: StorageManager, env: Environment, sample_size: int = 5,
+                 pool_size: int = 16, seed: int = 0):
+        """
+        :param sample_size: number of files sampled for each eviction. Higher is closer to an exact LRU, but slower.
+        :param pool_size: number of best eviction candidates kept between two evictions
+        :param seed: seed of the sampling random generator, so that runs can be reproduced
+        """
+        Policy.__init__(self, tier, storage, env)
+        self.sample_size = sample_size
+        self.pool_size = pool_size
+        self.resident_paths = list()  # may contain stale entries, see class doc
+        self.eviction_pool = list()  # (last_access, path), sorted by last access
+        self.rng = random.Random(seed)
+
+    def on_file_created(self, file: File):
+        self.resident_paths.append(file.path)
+        if len(self.resident_paths) > 2 * len(self.tier.content) + 1024:
+            self.resident_paths = list(self.tier.content.keys())
+
+    def on_file_deleted(self, file: File):
+        pass  # stale entries are lazily removed
+
+    def on_file_access(self, file: File, is_write: bool):
+        pass  # the tier already updates file.last_access
+
+    def memory_footprint(self):
+        """
+        :return: size in octets of the structures of this policy, not counting the path strings that are shared with
+        the tier content
+        """
+        return sys.getsizeof(self.resident_paths) + sys.getsizeof(self.eviction_pool) + \
+            sum(sys.getsizeof(candidate) for candidate in self.eviction_pool)
+
+    def _sample(self):
+        """Sample resident files into the eviction pool, dropping stale entries encountered on the way"""
+        content = self.tier.content
+        sampled = 0
+        while sampled < self.sample_size and len(self.resident_paths) > 0:
+            i = self.rng.randrange(len(self.resident_paths))
+            path = self.resident_paths[i]
+            file = content.get(path)
+            if file is None:
+                self.resident_paths[i] = self.resident_paths[-1]
+                self.resident_paths.pop()
+                continue
+            self.eviction_pool.append((file.last_access, path))
+            sampled += 1
+        self.eviction_pool.sort()
+        del self.eviction_pool[self.pool_size:]
+
+    def _pick_victim(self):
+        """
+        :return: the least recently accessed file of the eviction pool, or None if the tier has no file left
+        """
+        content = self.tier.content
+        while len(self.resident_paths) > 0:
+            self._sample()
+            while len(self.eviction_pool) > 0:
+                last_access, path = self.eviction_pool.pop(0)
+                file = content.get(path)
+                if file is not None and file.last_access == last_access:  # else it moved or was accessed since
+                    return file
+        return None
+
+    def on_tier_nearly_full(self):
+        target_tier_id = self.storage.tiers.index(self.tier)+1  # iterating to the next tier
+        if target_tier_id < len(self.storage.tiers):  # checking this next tier do exist
+            while self.tier.used_size > self.tier.max_size * (self.tier.target_occupation - 0.15):
+                file = self._pick_victim()
+                if file is None:
+                    break
+                self.storage.migrate(file, self.storage.tiers[target_tier_id], self.env.now)  # migrating
+        else:
+            print(f'Tier {self.tier.name} is nearly full, but there is no other tier to discharge load.')
+
+
+if __name__ == "__main__":
+    # Compares the memory footprint and the hit ratio of this policy against the exact LRUPolicy, on the same run.
+    import argparse
+    import simpy
+    from simulation import Simulation
+    from policies.lru_policy import LRUPolicy
+    from traces.ibm_object_store_trace import IBMObjectStoreTrace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default="-1", type=int)
+    parser.add_argument("-s", "--ssd-size", help="Size of the SSD tier in octets", default=round(0.03125 * 10 ** 9),
+                        type=int)
+    parser.add_argument("-k", "--sample-size", help="Number of files sampled for each eviction", default=5, type=int)
+    args = parser.parse_args()
+
+    trace = IBMObjectStoreTrace()
+    trace.gen_data(trace_len_limit=args.limit_trace)
+
+    results = {}
+    footprints = {}  # key: policy name, value: (octets, resident files) of its structures at the end of the run
+    for name, policy_class in [("lru", LRUPolicy), ("sampled-lru", SampledLRUPolicy)]:
+        env = simpy.Environment()
+        tiers = [Tier('SSD', args.ssd_size, 100e-6, 2e9), Tier('HDD', 8 * 10 ** 9, 10e-3, 250e6),
+                 Tier('Tapes', 50 * 10 ** 9, 20, 315e6)]
+        storage = StorageManager(tiers, env)
+        if policy_class == SampledLRUPolicy:
+            policies = [policy_class(tier, storage, env, sample_size=args.sample_size) for tier in tiers[:2]]
+        else:
+            policies = [policy_class(tier, storage, env) for tier in tiers[:2]]
+        Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False).run()
+        user_reads = [tier.number_of_reads - tier.number_of_prefetching_from_this_tier
+                      - tier.number_of_eviction_from_this_tier for tier in tiers]
+        results[name] = user_reads[0] / max(1, sum(user_reads))
+        footprints[name] = (sum([policy.memory_footprint() for policy in policies]),
+                            sum([len(tier.content) for tier in tiers[:2]]))
+
+    print(f'Memory footprint of the policy structures at the end of the run:' +
+          "".join([f'\n    >> {name}: {size} octets for {file_count} resident files, '
+                   f'{round(size / max(1, file_count), 1)} octets per file'
+                   for name, (size, file_count) in footprints.items()]))
+    print(f'SSD hit ratio on user reads:'
+          f'\n    >> lru: {round(results["lru"] * 100, 3)}%'
+          f'\n    >> sampled-lru: {round(results["sampled-lru"] * 100, 3)}%'
+          f'\n    >> gap: {round((results["lru"] - results["sampled-lru"]) * 100, 3)} points')
@@ -0,0 +1,170 @@
+from math import log1p, expm1
+
+
+class _Node:
+    __slots__ = ("label", "children", "count", "log_sum", "sketch")
+
+    def __init__(self, label):
+        self.label = label  # tuple of the path components leading from the parent to this node
+        self.children = {}  # key: first component of the child label, value: child node
+        self.count = 0
+        self.log_sum = 0.
+        self.sketch = {}  # key: bucket of log1p(lifetime), value: count
+
+    def copy_stats(self, other: "_Node"):
+        self.count = other.count
+        self.log_sum = other.log_sum
+        self.sketch = dict(other.sketch)
+
+    def add(self, log_lifetime, bucket):
+        self.count += 1
+        self.log_sum += log_lifetime
+        self.sketch[bucket] = self.sketch.get(bucket, 0) + 1
+
+
+class PrefixTriePredictor:
+    """
+    Online lifetime predictor, lightweight alternative to the CNN actor: a compressed prefix trie over the path
+    components, each node keeping streaming statistics of the lifetimes observed under it. The lifetime of a file is
+    predicted from the deepest node of its path having at least min_support observations.
+
+    Statistics per node: observation count, sum of log1p(lifetime) for the log-mean, and a sparse histogram of
+    log1p(lifetime) in buckets of bucket_width, used as a quantile sketch.
+
+    Paths are split on the separator. Paths without separator (eg. object ids) are split in chunks of chunk_size
+    characters instead. Only the first max_depth components are used, which bounds the depth of the trie.
+
+    Can be used as the prediction_model of LifetimeOverrunPolicy: it reads predictions with predictor[path], and feeds
+    the observed lifetimes back with update(path, lifetime). Until the root reaches min_support, there is no prediction
+    to make: None is returned by default, so that cold-start files are not mistaken for short-lived ones.
+    """
+    def __init__(self, min_support=8, quantile=None, separator='/', chunk_size=4, max_depth=8, bucket_width=0.25,
+                 default_lifetime=None):
+        """
+        :param min_support: observations needed by a node before it is used for predictions
+        :param quantile: None to predict the log-mean lifetime, else the quantile to predict, in [0, 1]
+        :param separator: path components separator
+        :param chunk_size: chunk length used to split paths without separator
+        :param max_depth: maximum number of components used
+        :param bucket_width: width of the quantile sketch buckets, in log1p(lifetime)
+        :param default_lifetime: prediction returned until the root reaches min_support, None for no prediction
+        """
+        self.min_support = min_support
+        self.quantile = quantile
+        self.separator = separator
+        self.chunk_size = chunk_size
+        self.max_depth = max_depth
+        self.bucket_width = bucket_width
+        self.default_lifetime = default_lifetime
+        self.root = _Node(())
+        self.node_count = 1
+
+    def _components(self, path):
+        components = path.split(self.separator)
+        if len(components) == 1:
+            components = [path[i:i + self.chunk_size] for i in range(0, len(path), self.chunk_size)]
+        return components[:self.max_depth]
+
+    def update(self, path, lifetime):
+        """Adds an observed lifetime to every node along the path, creating or splitting nodes as needed"""
+        log_lifetime = log1p(max(0., lifetime))
+        bucket = int(log_lifetime / self.bucket_width)
+        components = self._components(path)
+        node = self.root
+        node.add(log_lifetime, bucket)
+        i = 0
+        while i < len(components):
+            child = node.children.get(components[i])
+            if child is None:
+                child = _Node(tuple(components[i:]))
+                node.children[components[i]] = child
+                child.add(log_lifetime, bucket)
+                self.node_count += 1
+                return
+            label = child.label
+            common = 1
+            while common < len(label) and i + common < len(components) and label[common] == components[i + common]:
+                common += 1
+            if common < len(label):  # the path leaves or ends within the label: splitting it
+                middle = _Node(label[:common])
+                middle.copy_stats(child)
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[components[i]] = middle
+                self.node_count += 1
+                child = middle
+            child.add(log_lifetime, bucket)
+            node = child
+            i += common
+
+    def _support_node(self, path):
+        """
+        :return: the deepest node along the path having enough observations, or None
+        """
+        components = self._components(path)
+        node = self.root
+        best = node if node.count >= self.min_support else None
+        i = 0
+        while i < len(components):
+            child = node.children.get(components[i])
+            if child is None or tuple(components[i:i + len(child.label)]) != child.label:
+                break
+            if child.count < self.min_support:
+                break  # children never have more observations than their parent
+            best = child
+            node = child
+            i += len(child.label)
+        return best
+
+    def predict(self, path):
+        node = self._support_node(path)
+        if node is None:
+            return self.default_lifetime
+        if self.quantile is None:
+            return expm1(node.log_sum / node.count)
+        rank = self.quantile * node.count
+        seen = 0
+        for bucket in sorted(node.sketch.keys()):
+            seen += node.sketch[bucket]
+            if seen >= rank:
+                return expm1((bucket + 0.5) * self.bucket_width)
+        return expm1(node.log_sum / node.count)
+
+    def __getitem__(self, path):
+        return self.predict(path)
+
+
+if __name__ == "__main__":
+    # Trains the predictor on the lifetimes of the IBM trace, then reports its error and per-prediction cost.
+    import argparse
+    import random
+    import time
+    from math import log10
+    from traces.ibm_object_store_trace import IBMObjectStoreTrace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default="-1", type=int)
+    args = parser.parse_args()
+
+    trace = IBMObjectStoreTrace()
+    trace.gen_data(trace_len_limit=args.limit_trace)
+    lifetimes = list(trace.lifetime_per_fileid.items())
+    random.Random(0).shuffle(lifetimes)
+    training, evaluation = lifetimes[:len(lifetimes) // 2], lifetimes[len(lifetimes) // 2:]
+
+    predictor = PrefixTriePredictor()
+    t0 = time.perf_counter()
+    for path, lifetime in training:
+        predictor.update(path, lifetime)
+    t1 = time.perf_counter()
+    predictions = [predictor[path] for path, _ in evaluation]
+    t2 = time.perf_counter()
+
+    errors = sorted(abs(log10(1 + prediction) - log10(1 + lifetime))
+                    for prediction, (_, lifetime) in zip(predictions, evaluation) if prediction is not None)
+    print(f'Trained on {len(training)} lifetimes, {predictor.node_count} nodes.'
+          f'\n    >> {round((t1 - t0) / max(1, len(training)) * 1e6, 3)} us per update'
+          f'\n    >> {round((t2 - t1) / max(1, len(evaluation)) * 1e6, 3)} us per prediction'
+          f'\n    >> median error of {round(errors[len(errors) // 2], 3) if len(errors) > 0 else None} orders of '
+          'magnitude')
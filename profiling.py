@@ -0,0 +1,71 @@
+from time import perf_counter_ns
+
+
+class CallbackProfiler:
+    """
+    Opt-in CPU time accounting of the policy hooks and of the trace line reading. Functions are wrapped once, when the
+    policies are registered on their tier, so that the simulation pays nothing when profiling is disabled.
+
+    Timings are inclusive: the time of on_tier_nearly_full also counts the hooks called by the migrations it triggers.
+    """
+    HOOKS = ("on_file_created", "on_file_deleted", "on_file_access", "on_tier_nearly_full")
+
+    def __init__(self):
+        self.stats = {}  # key: (object class name, tier name, function name), value: [calls, total ns, max ns]
+        self._instrumented = set()
+
+    def wrap(self, key, function):
+        """
+        :return: the function, accounting its calls under the given key
+        """
+        stats = self.stats.setdefault(key, [0, 0, 0])
+
+        def timed(*args, **kwargs):
+            t0 = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = perf_counter_ns() - t0
+                stats[0] += 1
+                stats[1] += duration
+                if duration > stats[2]:
+                    stats[2] = duration
+        return timed
+
+    def instrument_listener(self, listener, tier):
+        """
+        Wraps the hooks of a listener. A listener registered on several tiers is only wrapped once, and accounted
+        under its own tier.
+        """
+        if id(listener) in self._instrumented:
+            return
+        self._instrumented.add(id(listener))
+        tier_name = getattr(listener, "tier", tier).name
+        for hook in CallbackProfiler.HOOKS:
+            setattr(listener, hook, self.wrap((type(listener).__name__, tier_name, hook), getattr(listener, hook)))
+
+    def total_time(self, function_name):
+        """
+        :return: seconds spent in all the functions with this name
+        """
+        return sum([stats[1] for key, stats in self.stats.items() if key[2] == function_name]) / 1e9
+
+    def report(self, run_time=None):
+        """
+        :param run_time: optional, seconds taken by the whole simulation, to account the time spent outside the trace
+        reading (SimPy and simulation loop)
+        :return: the formatted statistics, slowest functions first
+        """
+        s = f'\n{" "*4}>> '
+        output = 'CPU time per callback (inclusive):'
+        if run_time is not None:
+            read_time = self.total_time("read_data_line")
+            output += f'{s}{round(run_time, 3)} s in total, {round(read_time, 3)} s reading trace lines, ' \
+                      f'{round(run_time - read_time, 3)} s in SimPy and the simulation loop'
+        for (name, tier_name, function_name), (calls, total, maximum) in \
+                sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            if calls == 0:
+                continue
+            output += f'{s}{name} - {tier_name} - {function_name}: {calls} calls, {round(total / 1e9, 3)} s total, ' \
+                      f'{round(total / calls / 1e3, 3)} us mean, {round(maximum / 1e3, 3)} us max'
+        return output + '\n\n'
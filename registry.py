@@ -0,0 +1,84 @@
+"""
+Policies and traces available from the command line. They are registered by name and only imported when used, so that
+starting the simulator (or printing its help) does not import every trace parser, dataset listing or learning library.
+"""
+import importlib
+import time
+
+import_times = {}  # key: module name, value: seconds spent importing it the first time, see load()
+
+available_policies = {"lru": "policies.lru_policy:LRUPolicy",
+                      "sampled-lru": "policies.sampled_lru_policy:SampledLRUPolicy",
+                      "fifo": "policies.fifo_policy:FIFOPolicy",
+                      "lifetime": "policies.lifetime_overun_policy:LifetimeOverrunPolicy",
+                      "criteria": "policies.criteria_based_policy:CriteriaBasedPolicy",
+                      "random": "policies.random_policy:RandomPolicy",
+                      "opt": "policies.opt_policy:OPTPolicy",
+                      "opt-size": "policies.opt_policy:SizeAwareOPTPolicy",
+                      "rl-lru-lo": "policies.rl_policies:DDGD_LRU_LO_Policy"}
+
+# Policies needing the next use of every path in advance, see Trace.gen_next_use_index()
+next_use_policies = ("opt", "opt-size")
+# Policies needing optional dependencies (torch), only run when asked by name
+experimental_policies = ("rl-lru-lo",)
+
+available_traces = {"snia": ("traces.snia_trace:SNIATrace", "TENCENT_DATASET_FILE_THREAD1"),
+                    "augmented-snia": ("traces.augmented_snia_trace:AugmentedSNIATrace",
+                                       "TENCENT_DATASET_FILE_THREAD1"),
+                    "augmented-ibm": ("traces.augmented_ibm_object_store_trace:AugmentedIBMObjectStoreTrace", None),
+                    "ibm_object_store": ("traces.ibm_object_store_trace:IBMObjectStoreTrace", None),
+                    "synthetic": ("traces.synthetic_trace:SyntheticTrace", None),
+                    "streaming-synthetic": ("traces.streaming_synthetic_trace:StreamingSyntheticTrace", None)}
+# Traces generated while they are simulated: next uses cannot be known in advance, and lifetimes only of live objects
+streaming_traces = ("streaming-synthetic",)
+
+
+def load(spec: str):
+    """
+    :param spec: "module:attribute"
+    :return: the attribute, importing its module if needed
+    """
+    module_name, attribute = spec.split(':')
+    t0 = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if module_name not in import_times:
+        import_times[module_name] = time.perf_counter() - t0
+    return getattr(module, attribute)
+
+
+def get_policy_class(name: str):
+    return load(available_policies[name])
+
+
+def get_trace(name: str):
+    """
+    :return: a new instance of the trace
+    """
+    class_spec, resource = available_traces[name]
+    trace_class = load(class_spec)
+    if resource is None:
+        return trace_class()
+    return trace_class(load(f'resources:{resource}'))
+
+
+def build_policy(name: str, tier, storage, env, trace, lifetime_prediction_model=None,
+                 direct_placement_lifetime=None, prioritized_replay=False, learner_mode=None):
+    """
+    Instantiates a policy on a tier, giving it the extra parameters it needs.
+    :param lifetime_prediction_model: prediction model of the lifetime policy, the exact trace lifetimes if None
+    :param prioritized_replay: whether the learning policies sample their experiences by priority
+    :param learner_mode: how the learning policies train their agent, see DDGD_LRU_LO_Policy
+    """
+    policy_class = get_policy_class(name)
+    if name == "lifetime":
+        if lifetime_prediction_model is None:
+            lifetime_prediction_model = trace.lifetime_per_fileid
+        return policy_class(tier, storage, env, lifetime_prediction_model,
+                            direct_placement_lifetime=direct_placement_lifetime)
+    elif name == "criteria":
+        return policy_class(tier, storage, env, trace.lifetime_per_fileid)
+    elif name in ["opt", "opt-size"]:
+        return policy_class(tier, storage, env, trace)
+    elif name == "rl-lru-lo":
+        return policy_class(tier, storage, env, learner_mode=learner_mode, prioritized_replay=prioritized_replay)
+    return policy_class(tier, storage, env)
@@ -0,0 +1,119 @@
+import copy
+import queue
+import threading
+
+
+def train(agent, batch_size):
+    """
+    Runs a training step of the agent on at most batch_size experiences, none while its memory is empty. Used by both
+    the inline and the threaded training, so that they train alike.
+    :return: whether a step was run
+    """
+    batch_size = min(batch_size, len(agent.memory))
+    if batch_size > 0:
+        agent.update(batch_size)
+    return batch_size > 0
+
+
+class AsyncLearner:
+    """
+    Trains a DDGD agent in a worker thread, so that gradient steps do not stall the simulation. The worker trains its
+    own copy of the agent, fed with the experiences pushed by the simulation, and publishes its actor weights. They
+    are loaded into the agent used for inference when the simulation calls sync().
+
+    Two modes:
+        - deterministic: sync() hands the training steps to the worker and waits for them, so that a run gives the same
+          results as an inline training, only the thread differs.
+        - free-running: the worker trains continuously as experiences arrive, and sync() loads the latest published
+          weights without waiting.
+    If the worker crashes, its exception is raised by the next sync() or close().
+    """
+    def __init__(self, agent, deterministic=True, batch_size=64, publish_every=100):
+        """
+        :param agent: the agent used by the simulation for inference. Not trained directly.
+        :param deterministic: see class doc
+        :param batch_size: batch size of each training step, in free-running mode
+        :param publish_every: number of training steps between two weights publications, in free-running mode
+        """
+        self.agent = agent
+        self.learner = copy.deepcopy(agent)
+        self.deterministic = deterministic
+        self.batch_size = batch_size
+        self.publish_every = publish_every
+        self.training_steps = 0
+
+        self._inbox = queue.Queue()  # ("push", experience), ("train", batch size) or ("stop", None), in order
+        self._trained = threading.Event()
+        self._lock = threading.Lock()
+        self._published_weights = None
+        self._published_version = 0
+        self._loaded_version = 0
+        self._error = None  # exception that stopped the worker
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def push(self, state, action, reward, next_state, done):
+        """Same signature as Memory.push()"""
+        self._inbox.put(("push", (state, action, reward, next_state, done)))
+
+    def sync(self, batch_size):
+        """
+        To be called at each period boundary of the simulation.
+        :param batch_size: in deterministic mode, size of the training batch to run before publishing
+        """
+        if self.deterministic and self._error is None:
+            self._trained.clear()
+            self._inbox.put(("train", batch_size))
+            while not self._trained.wait(timeout=1.) and self._thread.is_alive():
+                pass
+        if self._error is not None:
+            raise self._error
+        with self._lock:
+            if self._published_version > self._loaded_version:
+                self.agent.actor.load_state_dict(self._published_weights)
+                self._loaded_version = self._published_version
+
+    def close(self):
+        self._inbox.put(("stop", None))
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _publish(self):
+        weights = {name: tensor.detach().clone() for name, tensor in self.learner.actor.state_dict().items()}
+        with self._lock:
+            self._published_weights = weights
+            self._published_version += 1
+
+    def _train(self, batch_size):
+        if train(self.learner, batch_size):
+            self.training_steps += 1
+
+    def _run(self):
+        try:
+            self._serve_inbox()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._trained.set()  # a crash must not leave sync() waiting
+
+    def _serve_inbox(self):
+        while True:
+            if self.deterministic or len(self.learner.memory) < self.batch_size:
+                kind, content = self._inbox.get()
+            else:
+                try:
+                    kind, content = self._inbox.get_nowait()
+                except queue.Empty:
+                    self._train(self.batch_size)
+                    if self.training_steps % self.publish_every == 0:
+                        self._publish()
+                    continue
+            if kind == "push":
+                self.learner.memory.push(*content)
+            elif kind == "train":
+                self._train(content)
+                self._publish()
+                self._trained.set()
+            elif kind == "stop":
+                return
@@ -1,8 +1,8 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.autograd import Variable
-from reinforcement_learning.replay_memory import Memory
+import numpy as np
+from reinforcement_learning.replay_memory import Memory, PrioritizedMemory
 
 
 class DDGD:
@@ -24,7 +24,12 @@ class DDGD:
                  critic_learning_rate=1e-3,
                  gamma=0.99,
                  tau=1e-2,
-                 max_memory_size=50000):
+                 max_memory_size=50000,
+                 prioritized_replay=False):
+        """
+        :param prioritized_replay: replay the experiences proportionally to their last TD error instead of uniformly,
+        see PrioritizedMemory. The critic loss is then weighted by their importance-sampling weights.
+        """
         self.actor = actor
         self.actor_target = actor_target
         self.critic = critic
@@ -39,31 +44,46 @@ class DDGD:
             target_param.data.copy_(param.data)
 
             # Training
-        self.memory = Memory(max_memory_size)
+        self.memory = PrioritizedMemory(max_memory_size) if prioritized_replay else Memory(max_memory_size)
         self.critic_criterion = nn.MSELoss()
         self.actor_optimizer = optim.Adam(self.actor.parameters(), lr=actor_learning_rate)
         self.critic_optimizer = optim.Adam(self.critic.parameters(), lr=critic_learning_rate)
 
     def get_action(self, state):
-        state = Variable(torch.from_numpy(state).float().unsqueeze(0))
-        action = self.actor.forward(state)
-        action = action.detach().numpy()[0, 0]
-        return action
+        return self.get_actions(np.asarray(state)[None])[0]
+
+    def get_actions(self, states):
+        """
+        Batched inference, without building the autograd graph.
+        :param states: array of states, the first dimension being the batch
+        :return: array of actions, one per state
+        """
+        with torch.inference_mode():
+            actions = self.actor.forward(torch.from_numpy(states).float())
+        return actions[:, 0].cpu().numpy()
 
     def update(self, batch_size):
-        states, actions, rewards, next_states, _ = self.memory.sample(batch_size)
-        states = torch.FloatTensor(states)
-        actions = torch.FloatTensor(actions)
-        rewards = torch.FloatTensor(rewards)
-        next_states = torch.FloatTensor(next_states)
+        if isinstance(self.memory, PrioritizedMemory):
+            (states, actions, rewards, next_states, _), indices, weights = self.memory.sample_with_weights(batch_size)
+        else:
+            states, actions, rewards, next_states, _ = self.memory.sample(batch_size)
+            indices, weights = None, None
+        states = torch.from_numpy(states)
+        actions = torch.from_numpy(actions.reshape(len(actions), -1))  # scalar actions are stored as a flat array
+        rewards = torch.from_numpy(rewards)
+        next_states = torch.from_numpy(next_states)
         
         # Critic/Q-function updates
         Qvals = self.critic.forward(states, actions)
         next_actions = self.actor_target.forward(next_states)
         next_Q = self.critic_target.forward(next_states, next_actions.detach())
-        Qprime = rewards + self.gamma * next_Q
+        Qprime = (rewards + self.gamma * next_Q).detach()
 
-        critic_loss = nn.MSELoss(Qvals, Qprime)
+        if weights is None:
+            critic_loss = self.critic_criterion(Qvals, Qprime)
+        else:
+            critic_loss = (torch.from_numpy(weights)[:, None] * (Qvals - Qprime) ** 2).mean()
+            self.memory.update_priorities(indices, (Qprime - Qvals).detach()[:, 0].cpu().numpy())
         self.critic_optimizer.zero_grad()
         critic_loss.backward()
         self.critic_optimizer.step()
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class InferenceQueue:
+    """
+    Collects the states awaiting a prediction, and runs them through the agent as a single batch instead of one forward
+    pass per state.
+
+    The queue is flushed when a state is pushed more than max_staleness simulation time after the oldest pending one,
+    when max_batch_size states are pending, or explicitly (eg. before any decision relying on the predictions).
+    With max_staleness=0, states pushed at the same timestamp are batched together.
+    """
+    def __init__(self, agent, max_batch_size=4096, max_staleness=0.):
+        """
+        :param agent: the agent predicting the actions, must provide get_actions(states)
+        :param max_batch_size: maximum number of states in a batch
+        :param max_staleness: maximum simulation time a state can wait for its prediction
+        """
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_staleness = max_staleness
+        self.entries = []
+        self.states = []
+        self.window_start = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, entry: dict, state, now):
+        """
+        :param entry: a dict whose "prediction" key will be set once the batch is processed
+        :param state: the state given to the agent
+        :param now: current simulation time
+        """
+        if len(self.entries) > 0 and (now - self.window_start > self.max_staleness
+                                      or len(self.entries) >= self.max_batch_size):
+            self.flush()
+        if len(self.entries) == 0:
+            self.window_start = now
+        self.entries.append(entry)
+        self.states.append(state)
+
+    def flush(self):
+        """Runs the pending states through the agent and writes the predictions back into their entries"""
+        if len(self.entries) == 0:
+            return
+        actions = self.agent.get_actions(np.asarray(self.states))
+        for entry, action in zip(self.entries, actions):
+            entry["prediction"] = action
+        self.entries = []
+        self.states = []
+        self.window_start = None
@@ -1,37 +1,148 @@
-import random
-from collections import deque
 import numpy as np
 
 
 class Memory:
     """
-    https://gist.github.com/cyoon1729
+    Fixed-capacity ring buffer of experiences, stored in preallocated typed arrays (one row per experience) that are
+    allocated on the first push, from the shapes of the first experience. Once full, the oldest experiences are
+    overwritten.
+
+    Samples are returned as contiguous arrays, that torch.from_numpy() can wrap without copy.
+
+    Originally from https://gist.github.com/cyoon1729
     """
-    def __init__(self, max_size):
-        self.buffer = deque(maxlen=max_size)
+    def __init__(self, max_size, seed=None):
+        self.max_size = max_size
+        self.size = 0
+        self.position = 0  # index of the next row to be written
+        self.rng = np.random.default_rng(seed)
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.dones = None
+
+    def _allocate(self, state, action):
+        state_shape = np.shape(state)
+        self.states = np.zeros((self.max_size, *state_shape), dtype=np.float32)
+        self.actions = np.zeros((self.max_size, *np.shape(action)), dtype=np.float32)
+        self.rewards = np.zeros((self.max_size, 1), dtype=np.float32)
+        self.next_states = np.zeros((self.max_size, *state_shape), dtype=np.float32)
+        self.dones = np.zeros(self.max_size, dtype=np.bool_)
 
     def push(self, state, action, reward, next_state, done):
-        experience = (state, action, np.array([reward]), next_state, done)
-        self.buffer.append(experience)
+        """
+        :return: the row in which the experience was written
+        """
+        if self.states is None:
+            self._allocate(state, action)
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i, 0] = reward
+        if next_state is None:  # terminal state
+            self.next_states[i] = 0
+        else:
+            self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (self.position + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+        return i
+
+    def _gather(self, indices):
+        return self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], \
+            self.dones[indices]
 
     def sample(self, batch_size):
-        state_batch = []
-        action_batch = []
-        reward_batch = []
-        next_state_batch = []
-        done_batch = []
+        """
+        :return: states, actions, rewards, next_states and dones arrays of batch_size rows, drawn without replacement
+        """
+        indices = self.rng.choice(self.size, size=batch_size, replace=False)
+        return self._gather(indices)
+
+    def __len__(self):
+        return self.size
 
-        batch = random.sample(self.buffer, batch_size)
 
-        for experience in batch:
-            state, action, reward, next_state, done = experience
-            state_batch.append(state)
-            action_batch.append(action)
-            reward_batch.append(reward)
-            next_state_batch.append(next_state)
-            done_batch.append(done)
+class SumTree:
+    """
+    Binary tree whose leaves are priorities and whose nodes are the sum of their children, stored as a flat array
+    (node i having children 2i and 2i+1, leaves starting at index `capacity`). Allows drawing leaves proportionally to
+    their priority in O(log n), for a whole batch at once.
+    """
+    def __init__(self, capacity):
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.tree = np.zeros(2 * self.capacity, dtype=np.float64)
 
-        return state_batch, action_batch, reward_batch, next_state_batch, done_batch
+    def total(self):
+        return self.tree[1]
 
-    def __len__(self):
-        return len(self.buffer)
\ No newline at end of file
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+        :param values: array of floats in [0, total()[
+        :return: the leaf index for each value, leaves covering ranges of values proportional to their priorities
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedMemory(Memory):
+    """
+    Prioritized experience replay (https://arxiv.org/abs/1511.05952): experiences are drawn proportionally to
+    priority ** alpha. New experiences get the highest priority seen so far, so that they are replayed at least once.
+    """
+    def __init__(self, max_size, alpha=0.6, epsilon=1e-6, seed=None):
+        Memory.__init__(self, max_size, seed)
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.priorities = SumTree(max_size)
+        self.max_priority = 1.
+
+    def push(self, state, action, reward, next_state, done):
+        i = Memory.push(self, state, action, reward, next_state, done)
+        self.priorities.update([i], [self.max_priority ** self.alpha])
+        return i
+
+    def sample(self, batch_size):
+        return self.sample_with_weights(batch_size)[0]
+
+    def sample_with_weights(self, batch_size, beta=0.4):
+        """
+        Stratified sampling: the total priority is split in batch_size segments, one experience being drawn per segment.
+        :return: (states, actions, rewards, next_states, dones), the sampled rows, and their importance-sampling weights
+        """
+        total = self.priorities.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = np.minimum(self.priorities.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+        probabilities = self.priorities.tree[indices + self.priorities.capacity] / total
+        weights = (self.size * probabilities) ** -beta
+        weights = (weights / weights.max()).astype(np.float32)
+        return self._gather(indices), indices, weights
+
+    def update_priorities(self, indices, errors):
+        """
+        :param indices: rows returned by sample_with_weights()
+        :param errors: new priorities of these rows, typically their absolute TD errors
+        """
+        priorities = np.abs(errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.priorities.update(indices, priorities ** self.alpha)
@@ -1,28 +1,102 @@
 import string
-import torch
+import functools
+import numpy as np
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 VOCAB = list(string.printable[:-5])+['é', 'è', 'ê', 'ë', 'ù']
 VOCAB_LEN = len(VOCAB)
 STR2TENSOR_OUTPUT_SIZE = 128
 
 
+def __getattr__(name):
+    # torch is only imported when the device is needed, so that the path encoder can be used without it
+    if name == "DEVICE":
+        import torch
+        global DEVICE
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+        return DEVICE
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 def get_output_shape(model, image_dim):
     """
     To be used in a model constructor to reliably get the output shape of a layer. Not to be used in forward: it's slow.
     """
+    import torch
     return model(torch.rand(*(image_dim))).data.shape
 
 
+class PathEncoder:
+    """
+    Converts paths to fixed-width arrays of vocabulary indices: characters out of the vocabulary are encoded as a
+    space, paths are left-padded with zeros, and only the last output_size characters of longer paths are kept.
+
+    Characters are mapped through a lookup table indexed by code point, and the encoding of directory prefixes is kept
+    in a LRU cache, since a lot of paths share the same directories.
+    """
+    def __init__(self, vocab=VOCAB, output_size=STR2TENSOR_OUTPUT_SIZE, cache_size=4096):
+        self.output_size = output_size
+        self.lookup = np.full(max(ord(char) for char in vocab) + 2, vocab.index(' '), dtype=np.int64)
+        for i, char in enumerate(vocab):
+            self.lookup[ord(char)] = i
+        self._encode_prefix = functools.lru_cache(maxsize=cache_size)(self._encode_chars)
+
+    def _encode_chars(self, input_string):
+        codes = np.frombuffer(input_string.encode('utf-32-le'), dtype=np.uint32)
+        encoded = self.lookup.take(np.minimum(codes, len(self.lookup) - 1))
+        encoded.flags.writeable = False  # may be shared through the cache
+        return encoded
+
+    def encode(self, path, out=None):
+        """
+        :param path:
+        :param out: optional, a preallocated integer array of output_size elements to write into
+        :return: the encoded path
+        """
+        if out is None:
+            out = np.zeros(self.output_size, dtype=np.int64)
+        else:
+            out[:] = 0
+        prefix, separator, name = path.rpartition('/')
+        name = self._encode_chars(name)[-self.output_size:]
+        out[self.output_size - len(name):] = name
+        remaining = self.output_size - len(name)
+        if len(separator) > 0 and remaining > 0:
+            prefix = self._encode_prefix(prefix + separator)[-remaining:]
+            out[remaining - len(prefix):remaining] = prefix
+        return out
+
+    def encode_batch(self, paths, out=None):
+        """
+        Encodes all the paths with a single lookup over their concatenation.
+        :param paths: list of paths
+        :param out: optional, a preallocated integer array of shape (len(paths), output_size) to write into
+        :return: the encoded paths, one per row
+        """
+        if out is None:
+            out = np.zeros((len(paths), self.output_size), dtype=np.int64)
+        else:
+            out[:] = 0
+        lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+        encoded = self._encode_chars(''.join(paths))
+        ends = np.cumsum(lengths)
+        positions = ends[:, None] - self.output_size + np.arange(self.output_size)[None, :]
+        mask = positions >= (ends - lengths)[:, None]
+        out[mask] = encoded[positions[mask]]
+        return out
+
+
+_DEFAULT_PATH_ENCODER = None
+
+
 def str2array(input_string, vocab=VOCAB):
     """
     :param input_string:
-    :param target_output_size:
     :param vocab:
-    :return: the str converted to an integer array
+    :return: the str converted to an integer array of STR2TENSOR_OUTPUT_SIZE elements, see PathEncoder
     """
-    path_embedded = [vocab.index(char) if char in vocab else vocab.index(' ') for char in input_string]
-    if len(path_embedded) > STR2TENSOR_OUTPUT_SIZE:
-        return path_embedded[len(path_embedded) - STR2TENSOR_OUTPUT_SIZE:len(path_embedded):1]
-    elif len(path_embedded) < STR2TENSOR_OUTPUT_SIZE:
-        return [0 for _ in range(STR2TENSOR_OUTPUT_SIZE - len(path_embedded))] + path_embedded
+    global _DEFAULT_PATH_ENCODER
+    if vocab is not VOCAB:
+        return PathEncoder(vocab).encode(input_string)
+    if _DEFAULT_PATH_ENCODER is None:
+        _DEFAULT_PATH_ENCODER = PathEncoder()
+    return _DEFAULT_PATH_ENCODER.encode(input_string)
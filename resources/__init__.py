@@ -4,5 +4,14 @@ PATH = os.path.dirname(__file__)
 
 TENCENT_DATASET_FILE_THREAD1 = os.path.join(PATH, "dataset_tencent/http_thread1_normal.log.17-24")
 
-IBM_OBJECT_STORE_FILES = sorted([f'{PATH}/dataset_ibm/{path}' for path in os.listdir(os.path.join(PATH, "dataset_ibm"))
-                          if path.split('.')[-1] not in ["tgz", "sh", "bat"]])
\ No newline at end of file
+
+def ibm_object_store_files():
+    """Lists the IBM dataset directory. Not done at import, so that the dataset is only required when used."""
+    return sorted([f'{PATH}/dataset_ibm/{path}' for path in os.listdir(os.path.join(PATH, "dataset_ibm"))
+                   if path.split('.')[-1] not in ["tgz", "sh", "bat"]])
+
+
+def __getattr__(name):
+    if name == "IBM_OBJECT_STORE_FILES":
+        return ibm_object_store_files()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,109 @@
+"""
+Content-addressed cache of finished simulation runs, so that re-plotting or adding a policy to a sweep only simulates
+the new runs.
+
+A run is keyed by the hash of:
+    - the fingerprint of the trace data, see Trace.fingerprint(),
+    - the parameters changing its results (trace, line limit, noise, policy, tier config, promotion...),
+    - the source of the code simulating it and recording its results: simulation, storage, policies and their learning
+      code, prediction models, trace readers, and the entry points choosing the recorded stats.
+Editing any of these files invalidates every cached run. Runs that are not deterministic, eg. with noised lifetimes, must
+not be cached.
+
+Each run is a JSON record named after its key, in a "result_cache" folder next to the output folders.
+"""
+import hashlib
+import json
+import os
+
+VERSION = 2  # 2: records of the experiment engine hold the Tier.stats() of each tier
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_SOURCE_FILES = ("simulation.py", "storage.py", "histograms.py", "registry.py", "profiling.py", "__main__.py",
+                 "experiment_engine.py", "forked_runs.py")
+_SOURCE_FOLDERS = ("policies", "prediction_models", "reinforcement_learning", "traces")
+
+_source_hash = None
+
+
+def source_hash():
+    """
+    :return: hash of the simulation code, computed once
+    """
+    global _source_hash
+    if _source_hash is None:
+        paths = [os.path.join(_ROOT, name) for name in _SOURCE_FILES]
+        for folder in _SOURCE_FOLDERS:
+            paths += [os.path.join(_ROOT, folder, name) for name in os.listdir(os.path.join(_ROOT, folder))
+                      if name.endswith(".py")]
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            digest.update(os.path.relpath(path, _ROOT).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        _source_hash = digest.hexdigest()
+    return _source_hash
+
+
+def run_key(trace_fingerprint, parameters: dict):
+    """
+    :param parameters: JSON serializable values changing the results of the run
+    """
+    content = json.dumps({"version": VERSION, "trace": trace_fingerprint, "parameters": parameters,
+                          "source": source_hash()}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, folder):
+        """
+        :param folder: created when the first record is written
+        """
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    def get(self, key):
+        """
+        :return: the record stored by put(), None if the run was never cached or its record cannot be read
+        """
+        try:
+            with open(self._path(key)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def put(self, key, record: dict):
+        """
+        Written to a temporary file first, so that concurrent runs never read a partial record.
+        :param record: JSON serializable
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_path = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(temporary_path, "w") as f:
+            json.dump(record, f)
+        os.replace(temporary_path, self._path(key))
+
+
+if __name__ == "__main__":
+    # Lists the cached runs of a cache folder
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", help="Cache folder, eg. logs/result_cache")
+    args = parser.parse_args()
+
+    names = sorted([name for name in os.listdir(args.folder) if name.endswith(".json")])
+    for name in names:
+        with open(os.path.join(args.folder, name)) as f:
+            record = json.load(f)
+        parameters = record["parameters"]
+        print(f'{name[:12]}: policy {parameters["policy"]} on {parameters["trace"]} '
+              f'({parameters["limit_trace"]} lines), {record["storage_config"]}, '
+              f'{record["simulated_in"]} s')
+    print(f'{len(names)} cached runs, source hash of the current code: {source_hash()[:12]}')
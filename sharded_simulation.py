@@ -0,0 +1,220 @@
+"""
+Sharded simulation: the object namespace is split into K shards by the CRC32 of the paths, and each shard is simulated
+in its own forked process, on tiers of 1/K of the capacity, reading only the trace lines of its paths. Tier counters
+and IO duration histograms of the shards are then merged.
+
+This is an approximation of the unsharded run, for quick turnaround, not a replacement:
+    - eviction rounds are triggered per shard: a shard whose paths hold more data than the others evicts earlier, and
+      large objects make the shards uneven, all the more as K grows and as the trace shrinks,
+    - policies only compare the files of their shard: LRU evicts the least recently used file of a shard, not of the
+      whole tier, which behaves as a sample of the global order, like hash-sampled cache simulations,
+    - policies learning online (eg. the prefix trie lifetime model) learn from 1/K of the trace each,
+    - oracle policies compute next uses over their shard stream, which keeps them exact for the shard's own paths,
+    - tiers with channels (see Tier) are rejected: the IOs of the other shards would not wait in their queues.
+Run with --compare to simulate the unsharded run too, and report the relative error of each merged metric.
+
+    python sharded_simulation.py -t ibm_object_store -l 10000000 -k 8 --compare lru lifetime
+"""
+import argparse
+import multiprocessing
+import time
+import zlib
+from array import array
+
+import simpy
+
+import registry
+from experiment_engine import load_experiments
+from forked_runs import peak_rss_mb, run_forked
+from histograms import LogHistogram
+from simulation import Simulation
+from storage import Tier, StorageManager
+from whatif import DEFAULT_STORAGE_CONFIG, build_policies
+
+COUNTERS = ("number_of_reads", "number_of_write", "number_of_eviction_from_this_tier",
+            "number_of_eviction_to_this_tier", "number_of_prefetching_from_this_tier",
+            "number_of_prefetching_to_this_tier", "time_spent_reading", "time_spent_writing", "used_size")
+PERCENTILES = (50, 90, 99)
+
+
+def shard_of(path, shard_count):
+    return zlib.crc32(str(path).encode()) % shard_count
+
+
+class _ShardLines:
+    """Lines of a shard, filtered while the data is iterated, for traces that cannot be indexed"""
+    def __init__(self, trace, data, shard, shard_count):
+        self._trace = trace
+        self._data = data
+        self._shard = shard
+        self._shard_count = shard_count
+
+    def __len__(self):
+        return len(self._data) // self._shard_count  # only an estimate, for progress bars
+
+    def __iter__(self):
+        return (line for line in self._data
+                if shard_of(self._trace.path_from_line(line), self._shard_count) == self._shard)
+
+
+def _simulate(trace, storage_config, policy_name, capacity_ratio, connection):
+    """Forked process: simulates the trace as it is in this process, sends back the metrics of each tier"""
+    t0 = time.perf_counter()
+    env = simpy.Environment()
+    # Same Tier parameters as the config, only the capacity is scaled
+    tiers = [Tier(config[0], max(1, round(config[1] * capacity_ratio)), *config[2:-1]) for config in storage_config]
+    storage = StorageManager(tiers, env, time_unit=trace.time_unit)
+    build_policies(policy_name, storage_config, tiers, storage, env, trace)
+    Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False).run()
+    connection.send({"tiers": {tier.name: {"counters": {counter: getattr(tier, counter) for counter in COUNTERS},
+                                           "histograms": {kind: histogram.to_dict() for kind, histogram
+                                                          in tier.latency_histograms.items()}}
+                               for tier in tiers},
+                     "wall_time": time.perf_counter() - t0,
+                     "peak_rss_mb": peak_rss_mb()})
+    connection.close()
+
+
+def _simulate_shard(trace, storage_config, policy_name, shard, shard_count, shard_per_line, connection):
+    """Forked process: keeps the lines of its shard, and simulates them on tiers of 1/shard_count of the capacity"""
+    if shard_per_line is not None:
+        trace.data = [line for line, line_shard in zip(trace.data, shard_per_line) if line_shard == shard]
+    else:
+        trace.data = _ShardLines(trace, trace.data, shard, shard_count)
+    trace.next_use = None  # regenerated on the shard lines by the oracle policies
+    _simulate(trace, storage_config, policy_name, 1 / shard_count, connection)
+
+
+def merge_shards(shard_results):
+    """
+    :return: the metrics of each tier, counters summed and histograms merged, formatted as the ones of a shard
+    """
+    merged = {}
+    for result in shard_results:
+        for name, tier in result["tiers"].items():
+            if name not in merged:
+                merged[name] = {"counters": {counter: 0 for counter in COUNTERS}, "histograms": {}}
+            for counter, value in tier["counters"].items():
+                merged[name]["counters"][counter] += value
+            for kind, exported in tier["histograms"].items():
+                if kind not in merged[name]["histograms"]:
+                    merged[name]["histograms"][kind] = LogHistogram.from_dict(exported)
+                else:
+                    merged[name]["histograms"][kind].merge(LogHistogram.from_dict(exported))
+    for tier in merged.values():
+        tier["histograms"] = {kind: histogram.to_dict() for kind, histogram in tier["histograms"].items()}
+    return {"tiers": merged,
+            "wall_time": max([result["wall_time"] for result in shard_results]),
+            "peak_rss_mb": sum([result["peak_rss_mb"] for result in shard_results])}
+
+
+def approximation_errors(sharded, unsharded):
+    """
+    :return: list of (tier name, metric, sharded value, unsharded value, relative error), relative errors being None
+    when the unsharded value is 0
+    """
+    errors = []
+    for name, tier in unsharded["tiers"].items():
+        metrics = [(counter, sharded["tiers"][name]["counters"][counter], value)
+                   for counter, value in tier["counters"].items()]
+        for kind, exported in tier["histograms"].items():
+            histogram = LogHistogram.from_dict(exported)
+            if histogram.total_count == 0:
+                continue
+            sharded_histogram = LogHistogram.from_dict(sharded["tiers"][name]["histograms"][kind])
+            metrics += [(f'{kind} p{percent}', sharded_histogram.percentile(percent), histogram.percentile(percent))
+                        for percent in PERCENTILES]
+        for metric, sharded_value, value in metrics:
+            errors += [(name, metric, sharded_value, value, None if value == 0 else (sharded_value - value) / value)]
+    return errors
+
+
+def experiment_storage_config(config_file, experiment):
+    """
+    :return: the storage config of an experiment of an experiment_engine.py config file, the last tier without policy
+    """
+    experiments = {name: tiers_config for name, tiers_config, _ in load_experiments(config_file)}
+    if experiment not in experiments:
+        raise RuntimeError(f'Unknown experiment {experiment} in "{config_file}"')
+    tiers_config = experiments[experiment]
+    return [[config["name"], config["max_size"], config["latency"], config["throughput"],
+             config.get("target_occupation", 0.9), config["write_throughput"], config["channels"],
+             "commandline-policy" if index < len(tiers_config) - 1 else "no-policy"]
+            for index, config in enumerate(tiers_config)]
+
+
+def run_sharded(trace, policy_name, shard_count, storage_config=None, compare=False, max_parallel=None):
+    """
+    :param storage_config: one list per tier, as in __main__.py: the Tier parameters (name, max size, latency,
+    throughput, and optionally target occupation, write throughput...) followed by the policy. DEFAULT_STORAGE_CONFIG by
+    default, see experiment_storage_config() for the tiers of a config file.
+    :param compare: also simulate the unsharded run, at the same time as the shards
+    :return: the merged metrics, and the unsharded ones if compared
+    """
+    storage_config = DEFAULT_STORAGE_CONFIG if storage_config is None else storage_config
+    if any([Tier(*config[:-1]).channels is not None for config in storage_config]):
+        raise RuntimeError("Sharded runs cannot model the contention of tiers with channels: each shard would queue "
+                           "its share of the IOs alone on every channel of the tiers")
+    shard_per_line = None
+    if isinstance(trace.data, list):  # computed once, before forking, instead of by each shard
+        shard_per_line = array('H', [shard_of(trace.path_from_line(line), shard_count) for line in trace.data])
+
+    jobs = [("unsharded", _simulate, (trace, storage_config, policy_name, 1.))] if compare else []
+    jobs += [(shard, _simulate_shard, (trace, storage_config, policy_name, shard, shard_count, shard_per_line))
+             for shard in range(shard_count)]
+    results = {}
+    for shard, result in run_forked(jobs, max_parallel):
+        if result is None:
+            raise RuntimeError(f'Shard {shard} of policy {policy_name} crashed')
+        results[shard] = result
+    return merge_shards([results[shard] for shard in range(shard_count)]), results.get("unsharded")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--trace", help="Trace to simulate", choices=list(registry.available_traces.keys()),
+                        default="ibm_object_store")
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default=-1, type=int)
+    parser.add_argument("-k", "--shards", help="Number of shards", default=multiprocessing.cpu_count(), type=int)
+    parser.add_argument("-j", "--jobs", help="Maximum number of processes running at the same time", default=None,
+                        type=int)
+    parser.add_argument("-c", "--config-file", help="Config file of experiment_engine.py to take the tiers from, the "
+                                                    "default tiers of __main__.py otherwise", default=None)
+    parser.add_argument("-e", "--experiment", help="Section of the config file giving the tier sizes", default=None)
+    parser.add_argument("--compare", help="Also simulate the unsharded run, and report the approximation error",
+                        action="store_true")
+    parser.add_argument("policies", nargs='+', choices=list(registry.available_policies.keys()))
+    args = parser.parse_args()
+    if (args.config_file is None) != (args.experiment is None):
+        parser.error("--config-file and --experiment go together")
+    storage_config = None if args.config_file is None else experiment_storage_config(args.config_file, args.experiment)
+
+    trace = registry.get_trace(args.trace)
+    trace.gen_data(trace_len_limit=args.limit_trace)
+
+    s = f'\n{" "*4}>> '
+    s2 = f'\n{" "*8}>> '
+    for policy_name in args.policies:
+        t0 = time.perf_counter()
+        sharded, unsharded = run_sharded(trace, policy_name, args.shards, storage_config, compare=args.compare,
+                                         max_parallel=args.jobs)
+        results = f'Policy "{policy_name}" over {args.shards} shards, slowest shard simulated in ' \
+                  f'{round(sharded["wall_time"], 3)} s, {round(time.perf_counter() - t0, 3)} s in total:'
+        for name, tier in sharded["tiers"].items():
+            results += f'{s}Tier "{name}": ' + ", ".join([f'{counter} {round(value, 3)}'
+                                                          for counter, value in tier["counters"].items()])
+        if unsharded is not None:
+            errors = [error for error in approximation_errors(sharded, unsharded) if error[4] is not None]
+            results += f'{s}Unsharded run simulated in {round(unsharded["wall_time"], 3)} s, ' \
+                       f'{round(unsharded["wall_time"] / sharded["wall_time"], 2)}x slower than the slowest shard'
+            results += f'{s}Relative error of the sharded run (sharded / unsharded):'
+            for name, metric, sharded_value, value, error in errors:
+                results += f'{s2}{name} {metric}: {round(error * 100, 2)} % ' \
+                           f'({round(sharded_value, 4)} / {round(value, 4)})'
+            if len(errors) > 0:
+                worst = max(errors, key=lambda error: abs(error[4]))
+                mean_error = sum([abs(error[4]) for error in errors]) / len(errors)
+                results += f'{s}Mean absolute error {round(mean_error * 100, 2)} %, ' \
+                           f'worst {round(abs(worst[4]) * 100, 2)} % on {worst[0]} {worst[1]}'
+        print(results + '\n')
@@ -2,6 +2,7 @@ from simpy.core import Environment
 from traces.trace import Trace
 from storage import StorageManager
 from tqdm import tqdm
+from itertools import islice
 import sys
 import os
 import time
@@ -9,22 +10,56 @@ import time
 
 class Simulation:
     def __init__(self, traces: "list[SNIATrace]", storage: StorageManager, env: Environment, log_file="logs/last_run.txt",
-                 progress_bar_enabled=True, logs_enabled=True):
+                 progress_bar_enabled=True, logs_enabled=True, start_line=0, stop_line=None, checkpoint_every=None,
+                 checkpoint_path=None):
+        """
+        :param start_line: index of the first trace line to read, when resuming from a checkpoint
+        :param stop_line: optional, index of the line at which the trace reading stops, eg. at the end of a warm-up
+        :param checkpoint_every: optional, number of trace lines between two checkpoints, see checkpoint.py
+        :param checkpoint_path: file the checkpoints are written to, overwritten each time
+        """
+        if checkpoint_every is not None:
+            assert len(traces) == 1 and checkpoint_path is not None, "Checkpoints need a single trace and a path"
+            for tier in storage.tiers:
+                for listener in tier.listeners:
+                    if not getattr(listener, "checkpointable", True):
+                        raise RuntimeError(f'{type(listener).__name__} cannot be checkpointed')
         self._env = env
         self._storage = storage
         self._log_file = log_file
         self._progress_bar_enabled = progress_bar_enabled
         self._logs_enabled = logs_enabled
+        self._start_line = start_line
+        self._stop_line = stop_line
+        self._checkpoint_every = checkpoint_every
+        self._checkpoint_path = checkpoint_path
 
         # Adding traces to env as processes
-        for trace in traces:
-            self._env.process(self._read_trace(trace))
+        self._trace_processes = [self._env.process(self._read_trace(trace)) for trace in traces]
 
     def run(self):
         """Start the simpy simulation loop. At the end of the simulation, prints the results"""
         t0 = time.time()
-        self._env.run()
-        print(f'Simulation finished after {round(time.time()-t0, 3)} seconds! Printing results:')
+        self._env.run(until=self._env.all_of(self._trace_processes))  # periodic processes never end by themselves
+        if self._stop_line is None:  # a warm-up is continued by another simulation
+            self.finish()
+        run_time = time.time()-t0
+        print(f'Simulation finished after {round(run_time, 3)} seconds! Printing results:')
+        return self.results(run_time)
+
+    def finish(self):
+        """Tells every policy that the simulation finished, see Policy.on_simulation_end()"""
+        policies = []
+        for tier in self._storage.tiers:
+            policies += [listener for listener in tier.listeners if all(listener is not policy for policy in policies)]
+        for policy in policies:
+            policy.on_simulation_end()
+
+    def results(self, run_time):
+        """
+        :param run_time: seconds the simulation took, for the profiling report
+        :return: the results of the simulation so far, formatted
+        """
         s = f'\n{" "*4}>> '
         s2 = f'\n{" "*8}>> '
         output = ""
@@ -47,12 +82,61 @@ class Simulation:
                   f'{s}{tier.number_of_reads} total reads'
                   f'{s2}{tier.number_of_reads-tier.number_of_prefetching_from_this_tier-tier.number_of_eviction_from_this_tier} because of user activity'
                   f'{s2}{tier.number_of_prefetching_from_this_tier+tier.number_of_eviction_from_this_tier} '
-                  'because of migration\n\n')
+                  'because of migration')
+            if tier.channels is not None:
+                output += (f'{s}{tier.channels} channels, {round(tier.utilisation() * 100, 2)}% utilisation'
+                           f'{s2}{tier.queued_operations} IOs waited for a channel, '
+                           f'{round(tier.queueing_delay, 3)} s of queueing delay')
+            output += f'{s}IO durations (p50 / p90 / p99 / p99.9 / max)'
+            for kind, histogram in tier.latency_histograms.items():
+                if histogram.total_count > 0:
+                    output += f'{s2}{kind}: ' + " / ".join(
+                        [f'{histogram.percentile(percent):.3g}' for percent in [50, 90, 99, 99.9]] +
+                        [f'{histogram.max:.3g} s ({histogram.total_count} IOs)'])
+            output += '\n\n'
+        if self._storage.profiler is not None:
+            output += self._storage.profiler.report(run_time)
+        placement_stats = self._storage.placement_stats
+        if len(self._storage.placement_policies) > 0:
+            output += (f'Initial placement:'
+                       f'{s}{placement_stats["direct_placements"]} files created directly on a lower tier '
+                       f'({placement_stats["directly_placed_size"] / (10 ** 9)} Go)'
+                       f'{s2}up to {2 * placement_stats["direct_placements"]} IOs avoided on the default tier'
+                       f'{s2}up to {placement_stats["direct_placements"]} migrations avoided'
+                       f'{s2}up to {round(placement_stats["avoided_default_tier_time"], 3)} s of default tier IO '
+                       'avoided\n\n')
+        promotion_stats = self._storage.promotion_stats
+        if promotion_stats is not None:
+            time_spent_reading = sum([tier.time_spent_reading for tier in self._storage.tiers])
+            net_gain = promotion_stats["saved_read_time"] - promotion_stats["promotion_time"]
+            if promotion_stats["promotions"] == 0:
+                verdict = f'{s}Promotions had no effect on this run: no candidate was promoted'
+            elif net_gain <= 0:
+                verdict = f'{s}Promotions had no benefit on this run: they cost more IO time than they saved'
+            else:
+                verdict = ''
+            output += (f'Promotions:'
+                       f'{s}{promotion_stats["candidates"]} candidates queued'
+                       f'{s2}{promotion_stats["dropped_candidates"]} dropped because they cooled down'
+                       f'{s2}{promotion_stats["eviction_rounds"]} eviction rounds run on the default tier to make room'
+                       f'{s2}{promotion_stats["postponed_for_lack_of_space"]} drains stopped because the default '
+                       'tier was full'
+                       f'{s2}{promotion_stats["larger_than_budget"]} accesses of hot files left out, the files '
+                       'being larger than the promotion budget or the default tier'
+                       f'{s}{promotion_stats["promotions"]} promotions ({promotion_stats["promoted_size"] / (10 ** 9)}'
+                       ' Go)'
+                       f'{s2}{promotion_stats["evicted_again"]} promoted files evicted again'
+                       f'{s}{round(promotion_stats["saved_read_time"], 3)} s of user read time saved'
+                       f'{s2}{round(promotion_stats["promotion_time"], 3)} s spent migrating'
+                       f'{s2}{round(net_gain, 3)} s of net gain, '
+                       f'{round(net_gain / max(time_spent_reading, 1e-9) * 100, 3)}% of the '
+                       f'{round(time_spent_reading, 3)} s spent reading'
+                       f'{verdict}\n\n')
         return output
 
     def _read_trace(self, trace: Trace, simulate_perfect_prefetch: bool = False):
         """Read a trace as a line list, while updating a progress bar. Runs self._read_line for each line"""
-        last_ts = 0
+        last_ts = self._env.now
         backup_stdout = sys.stdout
         if self._logs_enabled:
             os.makedirs(os.path.dirname(self._log_file), exist_ok=True)
@@ -61,8 +145,16 @@ class Simulation:
         else:
             sys.stdout = open(os.devnull, "w+")
         if self._progress_bar_enabled:
-            pbar = tqdm(total=len(trace.data), file=backup_stdout)
-        for line in trace.data:
+            pbar = tqdm(total=len(trace.data) if self._stop_line is None else min(self._stop_line, len(trace.data)),
+                        initial=self._start_line, file=backup_stdout)
+        track_next_use = trace.next_use is not None
+        read_data_line = trace.read_data_line
+        if self._storage.profiler is not None:
+            read_data_line = self._storage.profiler.wrap((type(trace).__name__, "trace", "read_data_line"),
+                                                         read_data_line)
+        if self._checkpoint_every is not None:
+            import checkpoint
+        for index, line in islice(enumerate(trace.data), self._start_line, self._stop_line):
             if self._progress_bar_enabled:
                 pbar.update(1)
             # tstart = line[2]
@@ -70,7 +162,11 @@ class Simulation:
             tstart = trace.timestamp_from_line(line)
             yield self._env.timeout(max(0, tstart - last_ts))  # traces are sorted by tstart order.
             last_ts = tstart
-            trace.read_data_line(self._env, self._storage, line, simulate_perfect_prefetch, self._logs_enabled)
+            if track_next_use:
+                trace.advance_cursor(index, line)
+            read_data_line(self._env, self._storage, line, simulate_perfect_prefetch, self._logs_enabled)
+            if self._checkpoint_every is not None and (index + 1) % self._checkpoint_every == 0:
+                checkpoint.save(self._checkpoint_path, trace, self._storage, index + 1, self._env.now)
 
         if self._progress_bar_enabled:
             pbar.close()
@@ -1,6 +1,10 @@
 from os import environ
+from collections import OrderedDict
+from heapq import heappop, heappush
 from simpy.core import Environment
 from typing import List
+from histograms import LogHistogram
+from event_log import CREATE, DELETE, READ, WRITE, MIGRATION, ROUND_START, ROUND_END, MISSING_FILE
 
 
 class File:
@@ -26,22 +30,29 @@ class File:
 
 
 class Tier:
+    OPERATION_KINDS = ("user_read", "user_write", "eviction_read", "eviction_write", "prefetch_read", "prefetch_write")
+
     def __init__(self, name: str, max_size: int, latency: float, throughput: float,
-                 target_occupation: float = 0.9):
+                 target_occupation: float = 0.9, write_throughput: float = None, channels: int = None):
         """
         TODO: increment used size
-        TODO: returns real delays
 
         :param max_size: octets
         :param latency: seconds
-        :param throughput: Go/seconds
+        :param throughput: octets/seconds, of the reads, and of the writes unless write_throughput is given
         :param target_occupation: [0.0, 1.0[, the maximum allowed used capacity ratio until firing a nearly full event
+        :param write_throughput: optional, octets/seconds
+        :param channels: optional, number of IOs the device serves at the same time. Without it, IOs never wait for
+        each other. With it, the IOs in flight share the throughput, and IOs queue for a channel in arrival order, user
+        IOs and migrations alike, see _serve()
         """
         self.name = name
+        self.index = None  # position in the StorageManager tiers
         self.max_size = max_size
         self.used_size = 0
         self.latency = latency
         self.throughput = throughput
+        self.write_throughput = throughput if write_throughput is None else write_throughput
         self.target_occupation = target_occupation
         self.content = dict()  # key: path, value: File
         self.manager = None
@@ -58,17 +69,80 @@ class Tier:
         self.time_spent_reading = 0
         self.time_spent_writing = 0
 
+        # Contention model, see _serve()
+        self.channels = channels
+        self._channel_free_at = None if channels is None else [0.] * channels  # heap of seconds
+        self._first_io_at = None  # seconds
+        self.busy_time = 0.  # seconds spent serving IOs, summed over the channels
+        self.queueing_delay = 0.  # seconds IOs waited for a channel, summed
+        self.queued_operations = 0
+
+        # Distribution of the read and write durations per operation kind, see Tier.OPERATION_KINDS, including the
+        # time waited for a channel, whose own distribution is under "queueing" when the tier has channels
+        self.latency_histograms = {kind: LogHistogram() for kind in Tier.OPERATION_KINDS + ("queueing",)}
+        # key: cause of the IO, as given to read_file() and write_file(), value: histogram
+        self._read_histograms = {cause: self.latency_histograms[f'{prefix}_read']
+                                 for cause, prefix in [(None, "user"), ("eviction", "eviction"),
+                                                       ("prefetching", "prefetch")]}
+        self._write_histograms = {cause: self.latency_histograms[f'{prefix}_write']
+                                  for cause, prefix in [(None, "user"), ("eviction", "eviction"),
+                                                        ("prefetching", "prefetch")]}
+
     def register_listener(self, listener: "Policy"):
+        if self.manager is not None and self.manager.profiler is not None:
+            self.manager.profiler.instrument_listener(listener, self)
         self.listeners += [listener]
 
     def stats(self):
-        return {"number_of_reads": self.number_of_reads,
-                "number_of_write": self.number_of_write,
-                "number_of_eviction_to_this_tier": self.number_of_eviction_to_this_tier,
-                "number_of_prefetching_from_this_tier": self.number_of_prefetching_from_this_tier,
-                "number_of_prefetching_to_this_tier": self.number_of_prefetching_to_this_tier,
-                "time_spent_reading": self.time_spent_reading,
-                "time_spent_writing": self.time_spent_writing}
+        stats = {"number_of_reads": self.number_of_reads,
+                 "number_of_write": self.number_of_write,
+                 "number_of_eviction_to_this_tier": self.number_of_eviction_to_this_tier,
+                 "number_of_prefetching_from_this_tier": self.number_of_prefetching_from_this_tier,
+                 "number_of_prefetching_to_this_tier": self.number_of_prefetching_to_this_tier,
+                 "time_spent_reading": self.time_spent_reading,
+                 "time_spent_writing": self.time_spent_writing}
+        if self.channels is not None:
+            stats.update({"utilisation": self.utilisation(),
+                          "queueing_delay": self.queueing_delay,
+                          "queued_operations": self.queued_operations})
+        return stats
+
+    def utilisation(self):
+        """
+        :return: [0.0, 1.0], share of the channel time spent serving IOs since the first one, None without channels
+        """
+        if self.channels is None:
+            return None
+        if self._first_io_at is None:
+            return 0.
+        span = max(self._channel_free_at) - self._first_io_at
+        return self.busy_time / (self.channels * span) if span > 0 else 0.
+
+    def _serve(self, size, throughput):
+        """
+        Closed-form multi-channel FIFO queue: the IO starts on the channel freed first, once it is free, and is served at
+        throughput / the number of IOs in flight at that time, itself included. An IO alone on the tier gets the whole
+        throughput, and IOs starting together on every channel share it evenly. IOs already in flight keep the share
+        they started with, so that completion times are known as IOs are submitted and never change afterwards.
+        :param size: octets
+        :param throughput: octets/seconds
+        :return: seconds until the IO completes, including the time waited for a channel
+        """
+        if self.channels is None:
+            return self.latency + size / throughput
+        now = self.manager.now() * self.manager.time_unit
+        if self._first_io_at is None:
+            self._first_io_at = now
+        start = max(now, heappop(self._channel_free_at))
+        in_flight = 1 + sum([1 for free_at in self._channel_free_at if free_at > start])
+        service_time = self.latency + size * in_flight / throughput
+        heappush(self._channel_free_at, start + service_time)
+        self.busy_time += service_time
+        self.latency_histograms["queueing"].record(start - now)
+        if start > now:
+            self.queueing_delay += start - now
+            self.queued_operations += 1
+        return start + service_time - now
 
     def has_file(self, path):
         return path in self.content.keys()
@@ -79,34 +153,43 @@ class Tier:
         """
         return 0
 
-    def create_file(self, timestamp, path, size: int = 0, file: File = None, migration=False):
+    def create_file(self, timestamp, path, size: int = 0, file: File = None, migration=False,
+                    user: str = 'default_user'):
         """
         :param timestamp: timestamp of the file creation event
         :param path: path of the file being created. No file must exist at this path in this tier
         :param size: init size of the file. this will not be counted as a write
         :param file: optional. a file whose metadata will be copied onto the newly created file.
         :param migration: whether the file creation event was caused by a migration. prevents event loops.
+        :param user: owner of the file. Ignored if file is given.
 
         :return: time in seconds until operation completion
         """
         assert path not in self.content.keys()
 
         if file is None:
-            file = File(path, self, size=size, ctime=timestamp, last_mod=timestamp, last_access=timestamp)
+            file = File(path, self, size=size, ctime=timestamp, last_mod=timestamp, last_access=timestamp, user=user)
         else:
             assert file.path == path
             assert file.path not in self.content.keys()  # not supposed to happen with our policies
-            file = File(path, self, file.size, file.creation_time, file.last_modification, file.last_access)
+            file = File(path, self, file.size, file.creation_time, file.last_modification, file.last_access,
+                        file.user)
             assert file.path in self.content.keys()
         self.used_size += file.size
         self.time_spent_writing += self.latency # taille du header faible, on considère uniquement la latence.
         assert path in self.content.keys()
         assert file.path in self.content.keys()
+        for sink in self.manager.event_sinks:
+            sink.emit(CREATE, timestamp, path, self, None, file.size)
         for listener in self.listeners:
             listener.on_file_created(file)
             if not migration and self.used_size >= self.max_size * self.target_occupation and not self.currently_migrating:
                 self.currently_migrating = True
+                for sink in self.manager.event_sinks:
+                    sink.emit(ROUND_START, timestamp, None, self, None, self.used_size)
                 listener.on_tier_nearly_full()
+                for sink in self.manager.event_sinks:
+                    sink.emit(ROUND_END, timestamp, None, self, None, self.used_size)
                 self.currently_migrating = False
         return 0
 
@@ -118,7 +201,7 @@ class Tier:
 
     def read_file(self, timestamp, path, update_meta=True, cause=None):
         """
-        :return: time in seconds until operation completion
+        :return: time in seconds until operation completion, 0 if the file is not on this tier
         """
         if path in self.content.keys():
             file = self.content[path]
@@ -127,7 +210,12 @@ class Tier:
             for listener in self.listeners:
                 listener.on_file_access(file, False)
             self.number_of_reads += 1
-            self.time_spent_reading += self.latency + file.size/self.throughput
+            for sink in self.manager.event_sinks:
+                sink.emit(READ, timestamp, path, self, None, file.size)
+            duration = self._serve(file.size, self.throughput)
+            self.time_spent_reading += duration
+            if cause in self._read_histograms:
+                self._read_histograms[cause].record(duration)
             if cause is not None:
                 if cause == "eviction":
                     self.number_of_eviction_from_this_tier += 1
@@ -135,13 +223,17 @@ class Tier:
                     self.number_of_prefetching_from_this_tier += 1
                 else:
                     raise RuntimeError(f'Unknown cause {cause}. Expected "eviction", "prefetching" or None')
+            return duration
+        elif len(self.manager.event_sinks) > 0:
+            for sink in self.manager.event_sinks:
+                sink.emit(MISSING_FILE, timestamp, path, self)
         else:
             print(f'File {path} should be in tiers {self.name} but it is not. Recheck your trace and policies!')
         return 0
 
     def write_file(self, timestamp, path, update_meta=True, cause=None):
         """
-        :return: time in seconds until operation completion
+        :return: time in seconds until operation completion, 0 if the file is not on this tier
         """
         if path in self.content.keys():
             file = self.content[path]
@@ -151,7 +243,12 @@ class Tier:
             for listener in self.listeners:
                 listener.on_file_access(file, True)
             self.number_of_write += 1
-            self.time_spent_writing += self.latency + file.size/self.throughput
+            for sink in self.manager.event_sinks:
+                sink.emit(WRITE, timestamp, path, self, None, file.size)
+            duration = self._serve(file.size, self.write_throughput)
+            self.time_spent_writing += duration
+            if cause in self._write_histograms:
+                self._write_histograms[cause].record(duration)
             if cause is not None:
                 if cause == "eviction":
                     self.number_of_eviction_to_this_tier += 1
@@ -160,6 +257,10 @@ class Tier:
                 else:
                     raise RuntimeError(f'Unknown cause {cause}. Expected "eviction", "prefetching" or None')
             # TODO: update file size, add offset as arg
+            return duration
+        elif len(self.manager.event_sinks) > 0:
+            for sink in self.manager.event_sinks:
+                sink.emit(MISSING_FILE, timestamp, path, self)
         else:
             print(f'File {path} should be in tiers {self.name} but it is not. Recheck your trace and policies!')
         return 0
@@ -177,24 +278,56 @@ class Tier:
         if path in self.content.keys():
             file = self.content.pop(path)
             self.used_size -= file.size
+            for sink in self.manager.event_sinks:
+                sink.emit(DELETE, self.manager.now(), path, self, None, file.size)
             for listener in self.listeners:
                 listener.on_file_deleted(file)
         return 0
 
 
 class StorageManager:
-    def __init__(self, tiers: List[Tier], env: Environment, default_tier_index: int = 0):
+    def __init__(self, tiers: List[Tier], env: Environment, default_tier_index: int = 0,
+                 profiler: "CallbackProfiler" = None, time_unit: float = 1.):
         """
         :param tiers: Tiers in performance order. Default tier is 0, and a file tier index will augment as it ages.
         :param env: Simpy env, used to fire events
         :param default_tier_index: 0 by default, most of the time you want file to be created on the performant tier.
+        :param profiler: optional, accounts the CPU time of the policies registered after this point
+        :param time_unit: seconds per simulation time unit, see Trace.time_unit. Tiers with channels need it to queue
+        their IOs
         """
         self._env = env
+        self.time_unit = time_unit
         self.tiers = tiers
         self.default_tier_index = default_tier_index
+        self.profiler = profiler
+        self.ongoing_migrations = 0  # lets listeners tell user accesses from migration ones
+
+        # Promotion of hot files back to the default tier, see start_promotions()
+        self.promotion_queue = OrderedDict()  # key: path, value: the PromotionPolicy that proposed it
+        self.promotion_byte_budget = None
+        self.promotion_watermark = None
+        self.promotion_stats = None
+
+        # Initial placement of new files, see get_placement_tier()
+        self.placement_policies = []
+        self.placement_stats = {"direct_placements": 0,
+                                "directly_placed_size": 0,
+                                "avoided_default_tier_time": 0.}
 
-        for tier in tiers:
+        # Receive the simulation events, see event_log.py. Must have an emit(op, timestamp, path, source tier,
+        # destination tier, size) method.
+        self.event_sinks = []
+
+        for index, tier in enumerate(tiers):
             tier.manager = self  # association linking
+            tier.index = index
+
+    def now(self):
+        return self._env.now
+
+    def add_event_sink(self, sink):
+        self.event_sinks += [sink]
 
     def delay(self, timeout, cb):
         yield self._env.timeout(timeout)
@@ -203,6 +336,126 @@ class StorageManager:
     def get_default_tier(self):
         return self.tiers[self.default_tier_index]
 
+    def register_placement_policy(self, policy: "Policy"):
+        self.placement_policies += [policy]
+
+    def get_placement_tier(self, path, size, timestamp, user='default_user'):
+        """
+        To be used by the traces to know where a new file must be created. Placement policies are consulted in their
+        registration order, the first one choosing a tier wins. Without choice, files are created on the default tier.
+
+        :param path: path of the file about to be created
+        :param size: octets
+        :param timestamp: timestamp of the file creation event
+        :param user: owner of the file
+        :return: the tier on which the file must be created
+        """
+        default_tier = self.get_default_tier()
+        for policy in self.placement_policies:
+            tier = policy.choose_initial_tier(path, size, user)
+            if tier is not None:
+                if tier != default_tier:
+                    # Creating the file there saves a write on the default tier, and a read from it when evicted
+                    self.placement_stats["direct_placements"] += 1
+                    self.placement_stats["directly_placed_size"] += size
+                    self.placement_stats["avoided_default_tier_time"] += \
+                        2 * default_tier.latency + size / default_tier.write_throughput + size / default_tier.throughput
+                return tier
+        return default_tier
+
+    def start_promotions(self, interval, byte_budget, watermark=None):
+        """
+        Starts a process draining the promotion queue every interval, moving at most byte_budget octets per interval
+        from the lower tiers to the default tier. The queue is filled by PromotionPolicy instances.
+
+        :param interval: simulation time between two drains
+        :param byte_budget: octets
+        :param watermark: [0.0, 1.0], used capacity ratio of the default tier promotions fill it up to, its target
+        occupation by default. A lower one leaves headroom for the files created between two drains.
+        """
+        self.promotion_byte_budget = byte_budget
+        self.promotion_watermark = self.get_default_tier().target_occupation if watermark is None else watermark
+        self.promotion_stats = {"candidates": 0,
+                                "larger_than_budget": 0,
+                                "promotions": 0,
+                                "promoted_size": 0,
+                                "dropped_candidates": 0,
+                                "eviction_rounds": 0,
+                                "postponed_for_lack_of_space": 0,
+                                "evicted_again": 0,
+                                "promotion_time": 0.,
+                                "saved_read_time": 0.}
+        self._env.process(self._promotion_process(interval, byte_budget))
+
+    def _promotion_process(self, interval, byte_budget):
+        # Drains at multiples of the interval, so that a simulation resumed from a checkpoint drains at the same times
+        yield self._env.timeout(interval - self._env.now % interval)
+        while True:
+            self.drain_promotion_queue(byte_budget)
+            yield self._env.timeout(interval)
+
+    def promotion_size_limit(self):
+        """
+        :return: octets, size of the largest file a drain could promote: within the byte budget, and fitting under the
+        promotion watermark of the default tier once empty
+        """
+        default_tier = self.get_default_tier()
+        return min(self.promotion_byte_budget, default_tier.max_size * self.promotion_watermark)
+
+    def _evict_for_promotions(self, tier: Tier):
+        """Runs an eviction round on the tier, as a file creation filling it would"""
+        if tier.currently_migrating:
+            return
+        tier.currently_migrating = True
+        for sink in self.event_sinks:
+            sink.emit(ROUND_START, self._env.now, None, tier, None, tier.used_size)
+        for listener in tier.listeners:
+            listener.on_tier_nearly_full()
+        for sink in self.event_sinks:
+            sink.emit(ROUND_END, self._env.now, None, tier, None, tier.used_size)
+        tier.currently_migrating = False
+
+    def drain_promotion_queue(self, byte_budget):
+        """
+        Migrates the queued candidates to the default tier, oldest candidates first, until the byte budget is spent.
+        Candidates that cooled down since they were queued are dropped, as well as the ones no drain could ever promote,
+        see promotion_size_limit(). Promotions fill the default tier up to the promotion watermark: the first
+        candidate that does not fit under it triggers an eviction round on the default tier, its eviction policies
+        making room for the hot files, and the drain stops if it still does not fit.
+        """
+        target_tier = self.get_default_tier()
+        budget = byte_budget
+        evicted = False
+        while len(self.promotion_queue) > 0:
+            path, policy = self.promotion_queue.popitem(last=False)
+            file = policy.tier.content.get(path)
+            if file is None or not policy.is_still_hot(path):
+                self.promotion_stats["dropped_candidates"] += 1
+                continue
+            if file.size > self.promotion_size_limit():
+                self.promotion_stats["larger_than_budget"] += 1
+                continue
+            if file.size <= budget and not evicted and \
+                    target_tier.used_size + file.size > target_tier.max_size * self.promotion_watermark:
+                evicted = True
+                self._evict_for_promotions(target_tier)
+                self.promotion_stats["eviction_rounds"] += 1
+            if file.size > budget or \
+                    target_tier.used_size + file.size > target_tier.max_size * self.promotion_watermark:
+                self.promotion_queue[path] = policy
+                self.promotion_queue.move_to_end(path, last=False)
+                if file.size <= budget:
+                    self.promotion_stats["postponed_for_lack_of_space"] += 1
+                break
+            budget -= file.size
+            read_time, write_time = file.tier.time_spent_reading, target_tier.time_spent_writing
+            self.migrate(file, target_tier, self._env.now)
+            self.promotion_stats["promotion_time"] += file.tier.time_spent_reading - read_time + \
+                target_tier.time_spent_writing - write_time
+            self.promotion_stats["promotions"] += 1
+            self.promotion_stats["promoted_size"] += file.size
+            policy.on_file_promoted(target_tier.content[path])
+
     def get_file(self, path):
         """
         :param path: Fully qualified path
@@ -227,11 +480,16 @@ class StorageManager:
         is_eviction = file.tier.manager.tiers.index(file.tier) < file.tier.manager.tiers.index(target_tier)
         cause = ["prefetching", "eviction"][is_eviction]
 
+        manager = file.tier.manager
+        for sink in manager.event_sinks:
+            sink.emit(MIGRATION, timestamp, file.path, file.tier, target_tier, file.size)
+        manager.ongoing_migrations += 1
         delay = 0.
         delay += target_tier.create_file(timestamp, file.path, file=file, migration=True)
         assert file.path in target_tier.content.keys()
         delay += max(file.tier.read_file(timestamp, file.path, update_meta=False, cause=cause),
                      target_tier.write_file(timestamp, file.path, update_meta=False, cause=cause))
         delay += file.tier.delete_file(file.path, event_priority=2)
+        manager.ongoing_migrations -= 1
 
         return delay
@@ -3,13 +3,16 @@ import os
 import sys
 import random
 from tqdm import tqdm
-from resources import IBM_OBJECT_STORE_FILES
+import resources
 from traces.trace import Trace
+from traces.ibm_object_store_trace import IBMObjectStoreTrace
+from event_log import INVALID_LINE
 
 _DEBUG = False
 
 
 class AugmentedIBMObjectStoreTrace(Trace):
+    time_unit = 1e-3  # timestamps are in milliseconds
 
     # Column names extracted from recorder_viz, kept here as static members vars
     _COLUMN_NAMES = ("path", "rank", "tstart", "tend",
@@ -34,10 +37,10 @@ class AugmentedIBMObjectStoreTrace(Trace):
             sys.stdout.flush()
             pbar = tqdm(total=trace_len_limit, desc="Parsing..."+str(trace_len_limit))
 
-        for path in IBM_OBJECT_STORE_FILES:
+        for path in resources.ibm_object_store_files():
             if not trace_len_limit>0:
                 sys.stdout.flush()
-                pbar = tqdm(total=os.path.getsize(path), desc=f'Parsing trace file {trace}')
+                pbar = tqdm(total=os.path.getsize(path), desc=f'Parsing trace file {path}')
             if self.line_count>=trace_len_limit and trace_len_limit>0:
                 print(f'Skipping file {path} as we reached the line limit')
                 sys.stdout.flush()
@@ -53,21 +56,14 @@ class AugmentedIBMObjectStoreTrace(Trace):
 
                     iteration_count += 1
 
-                    split = line.split(' ')
-                    try:
-                        timestamp, op_code, uid, size, offset_start, offset_end = (split+[0, 0, 0])[:6]
-                        timestamp = int(timestamp)
-                    except:
+                    parsed = IBMObjectStoreTrace.parse_line(line)
+                    if parsed is None:
                         continue
+                    timestamp, op_code, uid, size, offset_start, offset_end = parsed
 
                     #assert timestamp >= last_timestamp
                     #last_timestamp = timestamp
 
-                    op_code = op_code.split('.')[1]
-                    size = int(size)
-                    offset_start = int(offset_start)
-                    offset_end = int(offset_end)
-
                     if ignore_head and op_code == "HEAD":
                         continue
 
@@ -151,8 +147,6 @@ class AugmentedIBMObjectStoreTrace(Trace):
                 storage.migrate(file, storage.get_default_tier(), env.now)
                 assert file.path in storage.get_default_tier().content.keys()
             tier = file.tier
-        else:
-            tier = storage.get_default_tier()
 
         if file is not None:
             if op_code == "GET":
@@ -160,16 +154,20 @@ class AugmentedIBMObjectStoreTrace(Trace):
             elif op_code == "HEAD":
                 tier.read_file(timestamp, uid)
             elif op_code == "DELETE":
-                tier.delete_file(timestamp, uid)
-            elif op_code == "COPY":
-                print(f'Skipping undefined operation "{(" ".join([str(i) for i in line]))}".')
-            elif op_code == "PUT":
-                print(f'Invalid use of operation code {op_code} in operation "{(" ".join([str(i) for i in line]))}" '
-                      '- file already exist.')
+                tier.delete_file(uid)
+            elif op_code in ["COPY", "PUT"]:
+                for sink in storage.event_sinks:
+                    sink.emit(INVALID_LINE, timestamp, uid, tier, None, size)
+                if logs_enabled and op_code == "COPY":
+                    print(f'Skipping undefined operation "{(" ".join([str(i) for i in line]))}".')
+                elif logs_enabled:
+                    print(f'Invalid use of operation code {op_code} in operation '
+                          f'"{(" ".join([str(i) for i in line]))}" - file already exist.')
             else:
                 raise RuntimeError(f'Unknown operation code {op_code}')
         else:
             if op_code == "PUT":
+                tier = storage.get_placement_tier(uid, size, timestamp)
                 tier.create_file(timestamp, uid, size)
                 tier.write_file(timestamp, uid)
 
@@ -188,6 +186,9 @@ class AugmentedIBMObjectStoreTrace(Trace):
     def timestamp_from_line(self, line):
         return line[0]
 
+    def path_from_line(self, line):
+        return line[2]
+
 
 if __name__ == "__main__":
     import numpy as np
@@ -98,7 +98,7 @@ class SNIATrace(Trace):
         time_taken = 0.  # Time taken by this io, computed by the tier class
         is_read = True
         if file is None:
-            tier = storage.get_default_tier()
+            tier = storage.get_placement_tier(path, class_size, tstart)
             time_taken += tier.create_file(tstart, path, class_size)
             is_read = False
         else:
@@ -126,3 +126,6 @@ class SNIATrace(Trace):
 
     def timestamp_from_line(self, line):
         return line[1]
+
+    def path_from_line(self, line):
+        return str(line[0])
@@ -0,0 +1,250 @@
+import hashlib
+import heapq
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from math import cos, pi, log1p, expm1
+from traces.ibm_object_store_trace import IBMObjectStoreTrace
+
+_SESSION_ARRIVAL = 0
+_SESSION_OPERATION = 1
+_DELETION = 2
+
+
+class _LazyLines:
+    """Trace data generated while it is read. Each iteration restarts the generation from the seed."""
+    def __init__(self, trace: "StreamingSyntheticTrace", line_count):
+        self._trace = trace
+        self._line_count = line_count
+
+    def __len__(self):
+        return self._line_count
+
+    def __iter__(self):
+        return self._trace.generate(self._line_count)
+
+
+class StreamingSyntheticTrace(IBMObjectStoreTrace):
+    """
+    Object store workload generated on the fly, to test the simulator far beyond the size of the real traces. Only the
+    live objects and the ongoing sessions are kept in memory, lines are generated as the simulation reads them.
+
+    Workload model:
+        - sessions arrive following a Poisson process whose rate follows the time of day (diurnal cycle),
+        - each session belongs to a user, picked with a Zipf distribution, and is a heavy-tailed number of operations
+          separated by exponential think times,
+        - an operation is a PUT (Pareto size, owned by the session user), or a GET or HEAD on one of the user's live
+          objects, picked with a Zipf distribution over their recency,
+        - each object is deleted when its lifetime is over. Lifetimes follow a log-normal distribution, or the
+          distribution fitted from a real trace, see fit_lifetimes().
+
+    Lines have the IBM object store format, followed by the user. lifetime_per_fileid holds the lifetimes of the live
+    objects only, so that oracle policies can be evaluated. Oracle policies needing the whole trace in advance (OPT)
+    cannot be used.
+    """
+    def __init__(self, line_count=10 ** 7, user_count=1000, user_zipf_exponent=1.2, sessions_per_hour=3600.,
+                 diurnal_amplitude=0.5, peak_hour=14., session_length_alpha=1.5, mean_think_time=2.,
+                 op_mix=(0.3, 0.55, 0.15), popularity_zipf_exponent=1.1, size_alpha=1.2, min_size=4096,
+                 max_size=10 ** 10, lifetime_mu=8., lifetime_sigma=2., seed=0):
+        """
+        :param line_count: number of lines generated, unless limited by gen_data()
+        :param user_count: number of users
+        :param user_zipf_exponent: skew of the user activity
+        :param sessions_per_hour: mean session arrival rate over a day
+        :param diurnal_amplitude: [0, 1[, relative variation of the session arrival rate over a day
+        :param peak_hour: hour of the day with the most session arrivals
+        :param session_length_alpha: Pareto shape of the number of operations per session, heavier tail when lower
+        :param mean_think_time: mean time between two operations of a session, in seconds
+        :param op_mix: relative weights of PUT, GET and HEAD
+        :param popularity_zipf_exponent: skew of the object popularity, over the recency of the user's objects
+        :param size_alpha: Pareto shape of the object sizes, heavier tail when lower
+        :param min_size: octets
+        :param max_size: octets
+        :param lifetime_mu: mean of the log of the object lifetimes in seconds, unless fit_lifetimes() was called
+        :param lifetime_sigma: standard deviation of the log of the object lifetimes in seconds
+        :param seed: same seed, same trace
+        """
+        IBMObjectStoreTrace.__init__(self)
+        self.line_count = line_count
+        self.user_count = user_count
+        self.user_zipf_exponent = user_zipf_exponent
+        self.sessions_per_hour = sessions_per_hour
+        self.diurnal_amplitude = diurnal_amplitude
+        self.peak_hour = peak_hour
+        self.session_length_alpha = session_length_alpha
+        self.mean_think_time = mean_think_time
+        self.op_mix = op_mix
+        self.popularity_zipf_exponent = popularity_zipf_exponent
+        self.size_alpha = size_alpha
+        self.min_size = min_size
+        self.max_size = max_size
+        self.lifetime_mu = lifetime_mu
+        self.lifetime_sigma = lifetime_sigma
+        self.lifetime_quantiles = None  # log1p(seconds), see fit_lifetimes()
+        self.seed = seed
+        self.data = _LazyLines(self, line_count)
+
+    def fit_lifetimes(self, lifetime_per_fileid, time_unit=1e-3, quantile_count=256):
+        """
+        Makes the generated lifetimes follow the distribution of a real trace.
+        :param lifetime_per_fileid: lifetimes of a trace, see IBMObjectStoreTrace.lifetime_per_fileid
+        :param time_unit: seconds per lifetime unit, see Trace.time_unit
+        :param quantile_count: resolution of the fitted distribution
+        """
+        lifetimes = sorted([log1p(max(0., lifetime * time_unit)) for lifetime in lifetime_per_fileid.values()])
+        if len(lifetimes) == 0:
+            raise RuntimeError("Cannot fit lifetimes on an empty trace")
+        self.lifetime_quantiles = [lifetimes[round(i / (quantile_count - 1) * (len(lifetimes) - 1))]
+                                   for i in range(quantile_count)]
+
+    def gen_data(self, trace_len_limit=-1):
+        line_count = self.line_count if trace_len_limit <= 0 else min(trace_len_limit, self.line_count)
+        self.data = _LazyLines(self, line_count)
+        return self.data
+
+    def fingerprint(self):
+        """
+        :return: str identifying the generated data, hashed from the generator parameters as lines cannot be indexed
+        """
+        parameters = {name: value for name, value in vars(self).items()
+                      if isinstance(value, (int, float, str, tuple)) or name == "lifetime_quantiles"}
+        return hashlib.sha256(repr((type(self).__name__, len(self.data), sorted(parameters.items()))).encode()) \
+            .hexdigest()
+
+    def gen_next_use_index(self):
+        raise RuntimeError(f'{type(self).__name__} generates its lines while they are simulated: the next uses '
+                           'oracle policies such as OPT need cannot be known in advance')
+
+    def _lifetime(self, rng):
+        """
+        :return: seconds
+        """
+        if self.lifetime_quantiles is None:
+            return rng.lognormvariate(self.lifetime_mu, self.lifetime_sigma)
+        position = rng.random() * (len(self.lifetime_quantiles) - 1)
+        index = int(position)
+        lower = self.lifetime_quantiles[index]
+        upper = self.lifetime_quantiles[min(index + 1, len(self.lifetime_quantiles) - 1)]
+        return expm1(lower + (upper - lower) * (position - index))
+
+    def _session_rate(self, seconds):
+        """
+        :return: session arrivals per second at this time of the day
+        """
+        hours = seconds / 3600
+        return self.sessions_per_hour / 3600 * \
+            (1 + self.diurnal_amplitude * cos(2 * pi * (hours - self.peak_hour) / 24))
+
+    def generate(self, line_count):
+        """
+        :return: a generator of line_count lines, always the same for a given seed
+        """
+        rng = random.Random(self.seed)
+        user_cumulative = list(accumulate([rank ** -self.user_zipf_exponent
+                                           for rank in range(1, self.user_count + 1)]))
+        popularity_cumulative = list(accumulate([rank ** -self.popularity_zipf_exponent for rank in range(1, 4097)]))
+        max_rate = self.sessions_per_hour / 3600 * (1 + self.diurnal_amplitude)
+
+        self.lifetime_per_fileid.clear()  # live objects only. Cleared in place, policies may hold a reference to it
+        user_objects = {}  # key: user, value: list of its objects in creation order, deleted ones removed lazily
+        dead_objects = {}  # key: user, value: number of deleted objects still in its list
+        owner = {}  # key: live object, value: its user
+        object_count = 0
+        events = [(0., 0, _SESSION_ARRIVAL, None)]  # heap of (seconds, sequence number, kind, content)
+        sequence = 1
+        emitted = 0
+        deleted = None  # its lifetime is forgotten once its deletion line has been simulated
+        while emitted < line_count and len(events) > 0:
+            if deleted is not None:
+                del self.lifetime_per_fileid[deleted]
+                deleted = None
+            seconds, _, kind, content = heapq.heappop(events)
+            timestamp = int(seconds / self.time_unit)
+            if kind == _SESSION_ARRIVAL:
+                # Thinning of a Poisson process at the maximum rate, to follow the diurnal rate
+                next_arrival = seconds + rng.expovariate(max_rate)
+                heapq.heappush(events, (next_arrival, sequence, _SESSION_ARRIVAL, None))
+                sequence += 1
+                if seconds > 0 and rng.random() * max_rate > self._session_rate(seconds):
+                    continue
+                user = f'user{bisect_left(user_cumulative, rng.random() * user_cumulative[-1])}'
+                operations = min(10 ** 6, int(rng.paretovariate(self.session_length_alpha)))
+                heapq.heappush(events, (seconds, sequence, _SESSION_OPERATION, (user, operations)))
+                sequence += 1
+            elif kind == _DELETION:
+                user = owner.pop(content, None)
+                if user is None:
+                    continue
+                dead_objects[user] += 1
+                deleted = content
+                emitted += 1
+                yield timestamp, "DELETE", content, 0, 0, 0, user
+            else:
+                user, operations = content
+                if operations > 1:
+                    heapq.heappush(events, (seconds + rng.expovariate(1 / self.mean_think_time), sequence,
+                                            _SESSION_OPERATION, (user, operations - 1)))
+                    sequence += 1
+                op_code = rng.choices(("PUT", "GET", "HEAD"), weights=self.op_mix)[0]
+                objects = user_objects.setdefault(user, [])
+                if len(objects) == dead_objects.get(user, 0):
+                    op_code = "PUT"
+                if op_code == "PUT":
+                    uid = f'{object_count:016x}'
+                    object_count += 1
+                    size = min(self.max_size, int(self.min_size * rng.paretovariate(self.size_alpha)))
+                    lifetime = self._lifetime(rng)
+                    objects += [uid]
+                    dead_objects.setdefault(user, 0)
+                    owner[uid] = user
+                    self.lifetime_per_fileid[uid] = lifetime / self.time_unit
+                    heapq.heappush(events, (seconds + lifetime, sequence, _DELETION, uid))
+                    sequence += 1
+                    emitted += 1
+                    yield timestamp, "PUT", uid, size, 0, 0, user
+                    continue
+                if dead_objects[user] > len(objects) // 2:
+                    objects[:] = [uid for uid in objects if uid in owner]
+                    dead_objects[user] = 0
+                uid = None
+                while uid is None or uid not in owner:
+                    rank = bisect_left(popularity_cumulative, rng.random() * popularity_cumulative[-1])
+                    uid = objects[-1 - rank % len(objects)]
+                emitted += 1
+                yield timestamp, op_code, uid, 0, 0, 0, user
+
+    def read_data_line(self, env, storage, line, simulate_perfect_prefetch: bool = False, logs_enabled=True):
+        """Read a line, and fire events if necessary"""
+        timestamp, op_code, uid, size, offset_start, offset_end, user = line
+        if op_code == "PUT":
+            tier = storage.get_placement_tier(uid, size, timestamp, user)
+            tier.create_file(timestamp, uid, size, user=user)
+            tier.write_file(timestamp, uid)
+        else:
+            IBMObjectStoreTrace.read_data_line(self, env, storage, line[:6], simulate_perfect_prefetch, logs_enabled)
+
+
+if __name__ == "__main__":
+    # Generates lines without simulating them, to report the generation rate and the memory needed
+    import argparse
+    import resource
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--limit-trace", help="Number of lines generated", default=10 ** 6, type=int)
+    parser.add_argument("-s", "--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    trace = StreamingSyntheticTrace(line_count=args.limit_trace, seed=args.seed)
+    op_counts = {}
+    users = set()
+    t0 = time.perf_counter()
+    for line in trace.data:
+        op_counts[line[1]] = op_counts.get(line[1], 0) + 1
+        users.add(line[6])
+    duration = time.perf_counter() - t0
+    print(f'{len(trace.data)} lines generated in {round(duration, 3)} s '
+          f'({round(len(trace.data) / duration)} lines/s), {len(users)} active users, '
+          f'{len(trace.lifetime_per_fileid)} live objects at the end, over {round(line[0] * trace.time_unit / 3600, 3)} '
+          f'hours: ' + ", ".join([f'{count} {op}' for op, count in op_counts.items()]) +
+          f'\n    >> peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10} Mo')
@@ -0,0 +1,108 @@
+import heapq
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from tqdm import tqdm
+from traces.ibm_object_store_trace import IBMObjectStoreTrace
+
+
+class SyntheticTrace(IBMObjectStoreTrace):
+    """
+    Deterministic object store workload, for benchmarks and tests without the real datasets. Lines have the IBM object
+    store format, so the trace is replayed by IBMObjectStoreTrace.read_data_line().
+
+    Each line is an operation drawn from the PUT/GET/HEAD/DELETE mix:
+        - PUT creates an object, with a log-normal size and a log-normal lifetime,
+        - GET and HEAD access a live object, picked with a Zipf distribution over the recency rank of the objects
+          (the most recently created objects are the most popular),
+        - DELETE deletes the object whose lifetime expired first. If no lifetime expired yet, the line becomes a GET.
+    """
+    def __init__(self, line_count=100000, op_mix=(0.2, 0.6, 0.1, 0.1), zipf_exponent=1.1, size_mu=12.,
+                 size_sigma=2., max_size=10 ** 10, lifetime_mu=8., lifetime_sigma=2., mean_interarrival=50.,
+                 seed=0):
+        """
+        :param line_count: number of lines generated, unless limited by gen_data()
+        :param op_mix: relative weights of PUT, GET, HEAD and DELETE
+        :param zipf_exponent: skew of the object popularity
+        :param size_mu: mean of the log of the object sizes, in octets (e**12 ~ 160 Ko)
+        :param size_sigma: standard deviation of the log of the object sizes
+        :param max_size: octets
+        :param lifetime_mu: mean of the log of the object lifetimes, in seconds (e**8 ~ 50 min)
+        :param lifetime_sigma: standard deviation of the log of the object lifetimes
+        :param mean_interarrival: mean time between two lines, in ms
+        :param seed: same seed, same trace
+        """
+        IBMObjectStoreTrace.__init__(self)
+        self.line_count = line_count
+        self.op_mix = op_mix
+        self.zipf_exponent = zipf_exponent
+        self.size_mu = size_mu
+        self.size_sigma = size_sigma
+        self.max_size = max_size
+        self.lifetime_mu = lifetime_mu
+        self.lifetime_sigma = lifetime_sigma
+        self.mean_interarrival = mean_interarrival
+        self.seed = seed
+
+    def gen_data(self, trace_len_limit=-1):
+        line_count = self.line_count if trace_len_limit <= 0 else min(trace_len_limit, self.line_count)
+        rng = random.Random(self.seed)
+        operations = rng.choices(["PUT", "GET", "HEAD", "DELETE"], weights=self.op_mix, k=line_count)
+        # Cumulative Zipf weights of the recency ranks, bounded by the number of objects the trace can create
+        zipf_cumulative = list(accumulate([rank ** -self.zipf_exponent
+                                           for rank in range(1, max(2, operations.count("PUT") + 2))]))
+
+        self.data = []
+        self.file_ids_occurences = {}
+        self.lifetime_per_fileid = {}
+        live = []  # uids in creation order, deleted ones are removed lazily
+        deleted = set()
+        deaths = []  # heap of (death timestamp, uid)
+        timestamp = 0
+        for op_code in tqdm(operations, desc="Generating synthetic trace..."):
+            timestamp += int(rng.expovariate(1 / self.mean_interarrival))
+            if op_code == "DELETE":
+                while len(deaths) > 0 and deaths[0][1] in deleted:
+                    heapq.heappop(deaths)
+                if len(deaths) > 0 and deaths[0][0] <= timestamp:
+                    uid = heapq.heappop(deaths)[1]
+                    deleted.add(uid)
+                    self.data += [(timestamp, "DELETE", uid, 0, 0, 0)]
+                    self.file_ids_occurences[uid][2] = timestamp
+                    continue
+                op_code = "GET"
+            if op_code == "PUT" or len(live) == len(deleted):
+                uid = f'{len(self.file_ids_occurences):016x}'
+                size = min(self.max_size, max(1, int(rng.lognormvariate(self.size_mu, self.size_sigma))))
+                live += [uid]
+                heapq.heappush(deaths, (timestamp + int(rng.lognormvariate(self.lifetime_mu, self.lifetime_sigma)
+                                                        * 1000), uid))
+                self.file_ids_occurences[uid] = [1, timestamp, timestamp]
+                self.data += [(timestamp, "PUT", uid, size, 0, 0)]
+                continue
+            if len(deleted) > len(live) // 2:
+                live = [uid for uid in live if uid not in deleted]
+                deleted.clear()
+            uid = None
+            while uid is None or uid in deleted:
+                rank = bisect_left(zipf_cumulative, rng.random() * zipf_cumulative[-1])
+                uid = live[-1 - rank % len(live)]
+            self.file_ids_occurences[uid][0] += 1
+            self.file_ids_occurences[uid][2] = timestamp
+            self.data += [(timestamp, op_code, uid, 0, 0, 0)]
+
+        self.unique_files = len(self.file_ids_occurences)
+        self.lifetime_per_fileid = {uid: last_access - creation_time
+                                    for uid, (_, creation_time, last_access) in self.file_ids_occurences.items()}
+        return self.data
+
+
+if __name__ == "__main__":
+    trace = SyntheticTrace()
+    trace.gen_data()
+    op_counts = {}
+    for line in trace.data:
+        op_counts[line[1]] = op_counts.get(line[1], 0) + 1
+    t = (trace.data[-1][0] - trace.data[0][0]) * trace.time_unit
+    print(f'{len(trace.data)} lines on {trace.unique_files} objects over {round(t / 3600, 3)} hours: ' +
+          ", ".join([f'{count} {op}' for op, count in op_counts.items()]))
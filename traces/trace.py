@@ -2,15 +2,20 @@
 import os
 import sys
 import datetime
+import hashlib
+from array import array
 from tqdm import tqdm
 
 _DEBUG = False
 
 
 class Trace:
+    time_unit = 1.  # seconds per timestamp unit, the simulation clock runs in timestamp units
 
     def __init__(self):
-        pass
+        self.next_use = None  # see gen_next_use_index()
+        self.cursor = 0  # index of the line being simulated, only maintained when next_use is generated
+        self._next_use_per_path = {}
 
     def gen_data(self, trace_len_limit=-1):
         """
@@ -24,6 +29,51 @@ class Trace:
     def timestamp_from_line(self, line):
         raise NotImplementedError("Using unspecialized trace class.")
 
+    def path_from_line(self, line):
+        raise NotImplementedError("Using unspecialized trace class.")
+
+    def fingerprint(self):
+        """
+        :return: str identifying the generated data, hashed from its length and up to 4096 lines spread over it
+        """
+        digest = hashlib.sha256(f'{type(self).__name__} {len(self.data)}'.encode())
+        for i in range(0, len(self.data), max(1, len(self.data) // 4096)):
+            digest.update(repr(self.data[i]).encode())
+        return digest.hexdigest()
+
+    def gen_next_use_index(self):
+        """
+        Backward pass over the trace data computing, for each line, the index of the next line accessing the same path.
+        Lines whose path is never accessed again get len(self.data). Used by oracle policies.
+        """
+        never = len(self.data)
+        next_use = array('q', [never]) * len(self.data)
+        last_seen = {}
+        for i in tqdm(range(len(self.data) - 1, -1, -1), total=len(self.data), desc="Generating next uses..."):
+            path = self.path_from_line(self.data[i])
+            next_use[i] = last_seen.get(path, never)
+            last_seen[path] = i
+        self.next_use = next_use
+        self._next_use_per_path = {}
+
+    def advance_cursor(self, index, line):
+        """Called by the simulation before each line is read, once the next use index has been generated"""
+        if index == 0:
+            self._next_use_per_path.clear()
+        self.cursor = index
+        next_use = self.next_use[index]
+        if next_use == len(self.data):
+            self._next_use_per_path.pop(self.path_from_line(line), None)
+        else:
+            self._next_use_per_path[self.path_from_line(line)] = next_use
+
+    def next_use_of(self, path):
+        """
+        :return: the index of the next line of the trace accessing this path, after the current cursor. len(self.data)
+        if it is never accessed again.
+        """
+        return self._next_use_per_path.get(path, len(self.data))
+
     def get_columns_label(self):
         """
         :return: The columns corresponding to the data
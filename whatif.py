@@ -0,0 +1,192 @@
+"""
+What-if runs: the warm-up prefix of a trace is simulated once, then the process forks into one child per variant.
+Children start from the warmed tiers, shared copy-on-write with the parent, and only simulate the rest of the trace.
+
+A variant changes, from the end of the warm-up:
+    - the eviction policy: the policies of the warm-up are unregistered, the new ones are built and their state is
+      rebuilt from the tier contents (creations in creation order, then accesses in last access order),
+    - tier parameters: max_size, latency, throughput or target_occupation.
+
+Variants are given as comma separated key=value pairs, eg. "policy=fifo", "target_occupation=0.8" (every tier) or
+"tier0.max_size=2e9,policy=lifetime". An empty variant continues the warm-up configuration.
+
+    python whatif.py -t ibm_object_store --warmup-lines 1000000 --base-policy lru -v policy=fifo -v policy=lifetime
+"""
+import argparse
+import time
+
+import simpy
+
+import registry
+from forked_runs import peak_rss_mb, run_forked
+from simulation import Simulation
+from storage import Tier, StorageManager
+
+# Same tiers as the default run of __main__.py: name, max size, latency, throughput, policy
+DEFAULT_STORAGE_CONFIG = [['SSD', round(0.03125 * 10 ** 9), 100e-6, 2e9, 'commandline-policy'],
+                          ['HDD', 8 * 10 ** 9, 10e-3, 250e6, 'commandline-policy'],
+                          ['Tapes', 50 * 10 ** 9, 20, 315e6, 'no-policy']]
+_TIER_PARAMETERS = ("max_size", "latency", "throughput", "target_occupation")
+
+
+def parse_variant(spec: str):
+    """
+    :return: dict, key: "policy", "target_occupation" or (tier index, tier parameter), value: new value
+    """
+    variant = {}
+    for assignment in [part for part in spec.split(',') if part.strip() != ""]:
+        key, value = [part.strip() for part in assignment.split('=')]
+        if key == "policy":
+            if value not in registry.available_policies:
+                raise RuntimeError(f'Unknown policy "{value}" in variant "{spec}"')
+            variant[key] = value
+        elif key == "target_occupation":
+            variant[key] = float(value)
+        elif key.startswith("tier") and '.' in key and key.split('.')[1] in _TIER_PARAMETERS:
+            tier_index, parameter = key.split('.')
+            variant[(int(tier_index[len("tier"):]), parameter)] = int(float(value)) if parameter == "max_size" \
+                else float(value)
+        else:
+            raise RuntimeError(f'Unknown parameter "{key}" in variant "{spec}", expected policy, target_occupation or '
+                               f'tier<index>.<{"|".join(_TIER_PARAMETERS)}>')
+    return variant
+
+
+def build_policies(policy_name, storage_config, tiers, storage, env, trace):
+    """
+    :return: the policies built on the tiers whose config asks for the command line policy
+    """
+    policies = []
+    for config, tier in zip(storage_config, tiers):
+        if config[-1] == "commandline-policy":
+            policies += [registry.build_policy(policy_name, tier, storage, env, trace)]
+        elif config[-1] != "no-policy":
+            policies += [registry.build_policy(config[-1], tier, storage, env, trace)]
+    return policies
+
+
+def replace_policies(policies, policy_name, storage_config, tiers, storage, env, trace):
+    """
+    Unregisters the given policies, builds the new ones and rebuilds their state from the tier contents.
+    :return: the new policies
+    """
+    for policy in policies:
+        for tier in tiers:
+            tier.listeners = [listener for listener in tier.listeners if listener is not policy]
+        storage.placement_policies = [placement for placement in storage.placement_policies if placement is not policy]
+    new_policies = build_policies(policy_name, storage_config, tiers, storage, env, trace)
+    for policy in new_policies:
+        files = list(policy.tier.content.values())
+        for file in sorted(files, key=lambda file: file.creation_time):
+            policy.on_file_created(file)
+        for file in sorted(files, key=lambda file: file.last_access):
+            if file.last_access > file.creation_time:
+                policy.on_file_access(file, False)
+    return new_policies
+
+
+def tier_stats(tiers):
+    return {tier.name: dict(tier.stats(), used_size=tier.used_size) for tier in tiers}
+
+
+def _run_variant(spec, variant, trace, storage_config, tiers, storage, env, policies, base_policy, warmup_lines,
+                 connection):
+    """Forked process: applies the variant on the warmed state, simulates the rest of the trace, sends the results"""
+    t0 = time.perf_counter()
+    for key, value in variant.items():
+        if key == "target_occupation":
+            for tier in tiers:
+                tier.target_occupation = value
+        elif isinstance(key, tuple):
+            setattr(tiers[key[0]], key[1], value)
+    if variant.get("policy", base_policy) != base_policy:
+        replace_policies(policies, variant["policy"], storage_config, tiers, storage, env, trace)
+    results = Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False,
+                         start_line=warmup_lines).run()
+    connection.send({"variant": spec,
+                     "results": results,
+                     "stats": tier_stats(tiers),
+                     "run_time": time.perf_counter() - t0,
+                     "peak_rss_mb": peak_rss_mb()})
+    connection.close()
+
+
+def run_what_if(trace, variant_specs, base_policy, warmup_lines, storage_config=None, max_parallel=None,
+                channels=None):
+    """
+    :param variant_specs: see parse_variant()
+    :param channels: optional, channels of each tier, see Tier. Their queues are warmed up and forked like the rest of
+    the tiers
+    :param max_parallel: maximum number of children running at the same time, the number of CPUs by default
+    :return: the results of each variant, in their completion order, and the savings report
+    """
+    storage_config = DEFAULT_STORAGE_CONFIG if storage_config is None else storage_config
+    variants = [(spec, parse_variant(spec)) for spec in variant_specs]
+
+    t0 = time.perf_counter()
+    env = simpy.Environment()
+    tiers = [Tier(*config[:-1], channels=channels) for config in storage_config]
+    storage = StorageManager(tiers, env, time_unit=trace.time_unit)
+    policies = build_policies(base_policy, storage_config, tiers, storage, env, trace)
+    print(f'Warming up on {warmup_lines} lines with policy {base_policy}...')
+    Simulation([trace], storage, env, progress_bar_enabled=False, logs_enabled=False, stop_line=warmup_lines).run()
+    warmup_time = time.perf_counter() - t0
+    warmup_rss = peak_rss_mb()
+
+    collected = []
+    t1 = time.perf_counter()
+    for spec, result in run_forked([(spec, _run_variant, (spec, variant, trace, storage_config, tiers, storage, env,
+                                                          policies, base_policy, warmup_lines))
+                                    for spec, variant in variants], max_parallel):
+        if result is None:
+            print(f'Variant "{spec}" crashed')
+        else:
+            collected += [result]
+            print(f'{"#" * 10} Variant "{spec}" {"#" * 10}\n{result["results"]}')
+    branches_time = time.perf_counter() - t1
+
+    s = f'\n{" "*4}>> '
+    s2 = f'\n{" "*8}>> '
+    variants_time = sum([result["run_time"] for result in collected])
+    independent_time = len(collected) * warmup_time + variants_time
+    # Peak RSS of a child counts the warmed state it shares with the parent
+    independent_memory = sum([result["peak_rss_mb"] for result in collected])
+    forked_memory = warmup_rss + sum([max(0., result["peak_rss_mb"] - warmup_rss) for result in collected])
+    report = (f'What-if runs of {len(collected)} variants after a warm-up of {warmup_lines} lines:'
+              f'{s}Warm-up simulated once in {round(warmup_time, 3)} s, variants in {round(variants_time, 3)} s of '
+              f'CPU time ({round(branches_time, 3)} s of wall time)'
+              f'{s2}{round(warmup_time + variants_time, 3)} s of CPU time instead of {round(independent_time, 3)} s '
+              f'for independent runs, {round((1 - (warmup_time + variants_time) / max(independent_time, 1e-9)) * 100, 1)}'
+              f'% saved'
+              f'{s}{round(warmup_rss, 1)} Mo of warmed state shared copy-on-write'
+              f'{s2}about {round(forked_memory, 1)} Mo for all the variants at once, instead of '
+              f'{round(independent_memory, 1)} Mo for independent runs in parallel\n')
+    return collected, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--trace", help="Trace to simulate", choices=list(registry.available_traces.keys()),
+                        default="ibm_object_store")
+    parser.add_argument("-l", "--limit-trace", help="Limit the number of line that will be read from the trace",
+                        default=-1, type=int)
+    parser.add_argument("-w", "--warmup-lines", help="Number of trace lines simulated before forking", type=int,
+                        required=True)
+    parser.add_argument("-b", "--base-policy", help="Policy of the warm-up", default="lru",
+                        choices=list(registry.available_policies.keys()))
+    parser.add_argument("-v", "--variant", help="A what-if variant, see module doc. Can be repeated.",
+                        action="append", default=[])
+    parser.add_argument("-j", "--jobs", help="Maximum number of variants simulated at the same time", default=None,
+                        type=int)
+    parser.add_argument("--channels", help="Model the contention of each tier, see --channels of __main__.py",
+                        default=None, type=int)
+    args = parser.parse_args()
+
+    trace = registry.get_trace(args.trace)
+    trace.gen_data(trace_len_limit=args.limit_trace)
+    if "opt" in [args.base_policy] + [parse_variant(spec).get("policy") for spec in args.variant] or \
+            "opt-size" in [args.base_policy] + [parse_variant(spec).get("policy") for spec in args.variant]:
+        trace.gen_next_use_index()  # before forking, so that the children share it
+    _, report = run_what_if(trace, args.variant or [""], args.base_policy, args.warmup_lines, max_parallel=args.jobs,
+                            channels=args.channels)
+    print(report)